@@ -0,0 +1,188 @@
+import copy
+from datetime import datetime
+
+from medications import drug_profile
+from prompts import render_prompt
+from structured_output import parse_structured_output
+
+# Canned triage assessment used when the model call or JSON parsing fails
+TRIAGE_FALLBACK = {
+    "symptoms": ["chest pain", "radiation to left arm", "shortness of breath", "dizziness"],
+    "duration": "30 minutes",
+    "medical_history": ["hypertension"],
+    "urgency": "Critical",
+    "triage_category": "1",
+    "recommended_tests": ["ECG", "Cardiac enzymes", "Chest X-ray"],
+    "potential_diagnosis": ["Acute Myocardial Infarction", "Angina", "Aortic Dissection"],
+    "action": "Cardiac alert sent to EHR and cardiology team notified"
+}
+
+# Canned medication plan used when the model call or JSON parsing fails
+MEDICATION_FALLBACK = {
+    "medication": "Sumatriptan",
+    "dosage": "50mg",
+    "frequency": "as needed",
+    "timing": "at onset of migraine",
+    "duration": "as needed for migraines",
+    "patient_concern": "None reported",
+    "adherence_risk": "Low",
+    "recommendation": "Keep medication accessible + migraine trigger tracking app",
+    "refill_date": "N/A - as needed",
+    "action": "Patient education on migraine triggers scheduled + medication access reminder set"
+}
+
+# Fields the model still writes for a prescription whose sig the local parser has read
+MEDICATION_CONCERN_FIELDS = ("patient_concern", "adherence_risk", "recommendation", "action")
+
+# Canned mental health assessment used when the model call or JSON parsing fails
+MENTAL_HEALTH_FALLBACK = {
+    "risk_phrases": ["hopeless", "overwhelmed", "don't see any point in continuing", "nothing brings me joy"],
+    "symptoms": ["insomnia", "appetite loss", "anhedonia", "hopelessness"],
+    "risk_level": "High",
+    "suicide_risk": "Elevated",
+    "recommended_response": "Immediate follow-up within 24 hours",
+    "suggested_resources": ["Crisis helpline", "Emergency psychiatric evaluation", "Safety plan development"],
+    "action": "Crisis counselor notified and safety check scheduled for today"
+}
+
+# Canned structured report used when the model call or JSON parsing fails
+REPORT_FALLBACK = {
+    "patient_demographics": {"age": "65", "gender": "male"},
+    "diagnosis": "Community-acquired pneumonia",
+    "treatment": "IV antibiotics, now transitioned to oral",
+    "vital_signs": {"BP": "120/80", "O2 saturation": "97% on room air"},
+    "medications": [{"name": "Amoxicillin", "dosage": "500mg", "frequency": "TID", "duration": "7 days"}],
+    "follow_up": {"provider": "PCP", "timeframe": "1 week"},
+    "action": "Structured report generated and sent to PCP"
+}
+
+
+# Function to build the triage prompt for a clinical note
+def build_triage_prompt(user_input):
+    return render_prompt("triage", user_input)
+
+
+# Function to build the medication adherence prompt for a prescription
+def build_medication_prompt(user_input, today=None):
+    return render_prompt("medication", user_input, today=today or datetime.now())
+
+
+# Function to build the mental health risk prompt for a journal entry
+def build_mental_health_prompt(user_input):
+    return render_prompt("mental_health", user_input)
+
+
+# Function to build the structured report prompt for a clinical note
+def build_report_prompt(user_input):
+    return render_prompt("report", user_input)
+
+
+# Function to normalize and validate triage output
+def normalize_triage_output(output):
+    required_keys = [
+        "symptoms", "duration", "medical_history", "urgency",
+        "triage_category", "recommended_tests", "potential_diagnosis", "action"
+    ]
+    for key in required_keys:
+        if key not in output:
+            if key in ["symptoms", "medical_history", "recommended_tests", "potential_diagnosis"]:
+                output[key] = []
+            elif key == "action":
+                output[key] = "No action specified"
+            else:
+                output[key] = "Unknown"
+    if isinstance(output["symptoms"], str):
+        output["symptoms"] = [output["symptoms"].strip()] if output["symptoms"].strip() else []
+    return output
+
+
+# Function to normalize medication adherence output; missing fields come from the drug's profile when it has one
+def normalize_medication_output(output):
+    required_keys = [
+        "medication", "dosage", "frequency", "timing", "duration",
+        "patient_concern", "adherence_risk", "recommendation", "refill_date", "action"
+    ]
+    profile = drug_profile(output.get("medication")) or {}
+    for key in required_keys:
+        if key not in output or not output[key]:
+            if key == "patient_concern":
+                output[key] = "None reported"
+            elif key == "refill_date":
+                output[key] = "N/A - as needed" if profile and profile["days_supply"] is None else "N/A"
+            elif key in profile:
+                output[key] = profile[key]
+            elif key == "action":
+                output[key] = "No action specified"
+            elif key == "adherence_risk":
+                output[key] = "Unknown"
+            else:
+                output[key] = "Not specified"
+    return output
+
+
+# Function to build the prompt for a locally parsed prescription, asking the model only for the concern and guidance
+def build_medication_concern_prompt(user_input, output):
+    sig = ", ".join(
+        f"{key} {output[key]}" for key in ("medication", "dosage", "frequency", "timing", "duration")
+        if output.get(key) and output[key] != "Not specified"
+    )
+    return render_prompt("medication_concern", user_input, sig=sig)
+
+
+# Function to merge the model's concern and guidance fields into a locally parsed plan; raises StructuredOutputError
+def merge_medication_concern(output, response_text):
+    concern = parse_structured_output(response_text, "medication_concern")
+    output.update({key: concern[key] for key in MEDICATION_CONCERN_FIELDS if concern.get(key)})
+    return output
+
+
+# Function to normalize mental health output
+def normalize_mental_health_output(output):
+    required_keys = [
+        "risk_phrases", "symptoms", "risk_level", "suicide_risk",
+        "recommended_response", "suggested_resources", "action"
+    ]
+    for key in required_keys:
+        if key not in output:
+            if key in ["risk_phrases", "symptoms", "suggested_resources"]:
+                output[key] = []
+            elif key == "action":
+                output[key] = "No action specified"
+            else:
+                output[key] = "Unknown"
+    return output
+
+
+# Per-analysis prompt builder, output normalizer and canned fallback, keyed by structured-output feature
+ANALYZERS = {
+    "triage": {"prompt": build_triage_prompt, "normalize": normalize_triage_output, "fallback": TRIAGE_FALLBACK},
+    "medication": {
+        "prompt": build_medication_prompt, "normalize": normalize_medication_output, "fallback": MEDICATION_FALLBACK
+    },
+    "mental_health": {
+        "prompt": build_mental_health_prompt, "normalize": normalize_mental_health_output,
+        "fallback": MENTAL_HEALTH_FALLBACK
+    },
+    "report": {"prompt": build_report_prompt, "normalize": None, "fallback": REPORT_FALLBACK}
+}
+
+
+# Function to build the prompt for an analysis kind
+def build_prompt(kind, user_input):
+    return ANALYZERS[kind]["prompt"](user_input)
+
+
+# Function to fill an analysis kind's missing output fields with its defaults
+def normalize_analysis(kind, output):
+    normalize = ANALYZERS[kind]["normalize"]
+    return normalize(output) if normalize else output
+
+
+# Function to turn a model response into a validated, normalized output; raises StructuredOutputError
+def parse_analysis(kind, response_text):
+    return normalize_analysis(kind, parse_structured_output(response_text, kind))
+
+
+# Function to return a normalized copy of an analysis kind's canned fallback output
+def fallback_output(kind):
+    return normalize_analysis(kind, copy.deepcopy(ANALYZERS[kind]["fallback"]))
@@ -0,0 +1,211 @@
+import argparse
+import asyncio
+import sys
+import time
+
+import requests
+import uvicorn
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from analyzers import (
+    build_medication_concern_prompt, build_prompt, merge_medication_concern, normalize_analysis,
+    normalize_medication_output, normalize_triage_output, parse_analysis
+)
+from event_store import get_event_store
+from inference import CircuitOpenError, InferenceError, get_engine
+from long_notes import analyze_long_note, needs_chunking
+from medications import parse_prescription
+from pretriage import PRETRIAGE_SHORT_CIRCUIT, pretriage, pretriage_output
+from prompts import prompt_stats
+from scheduler import triage_priority
+from schedules import plan_refill_date
+from structured_output import StructuredOutputError, generation_budget, parse_stats
+
+# Bind address and uvicorn worker processes for `python api.py`
+API_HOST = "0.0.0.0"
+API_PORT = 8000
+API_WORKERS = 4
+
+# Largest number of items accepted by one batch request
+API_BATCH_MAX_ITEMS = 100
+
+# URL path segment -> analysis kind
+ROUTE_KINDS = {
+    "triage": "triage",
+    "medication": "medication",
+    "mental-health": "mental_health",
+    "report": "report"
+}
+
+
+class APIError(Exception):
+    def __init__(self, status_code, detail):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+# Function to run one prompt through the shared engine, mapping inference failures to API errors
+async def _generate(prompt, max_length, priority=None):
+    try:
+        return await asyncio.wrap_future(get_engine().submit(prompt, max_length=max_length, priority=priority))
+    except CircuitOpenError as e:
+        raise APIError(503, str(e))
+    except (InferenceError, requests.exceptions.RequestException) as e:
+        raise APIError(502, f"Inference failed: {e}")
+
+
+# Function to run one analysis end to end; returns the response body or raises APIError.
+# Triage responses also carry the local pre-triage result, and confident routine notes skip the model.
+# Prescriptions for known drugs are parsed locally; the model only writes the concern fields when free text remains.
+async def analyze(kind, text):
+    start_time = time.time()
+    extra = {}
+    priority = None
+    if kind == "triage":
+        provisional = pretriage(text)
+        extra["pretriage"] = provisional
+        priority = triage_priority(provisional["urgency"])
+        if provisional["confident"] and provisional["urgency"] in PRETRIAGE_SHORT_CIRCUIT:
+            output = normalize_triage_output(pretriage_output(provisional))
+            processing_time = round(time.time() - start_time, 2)
+            await run_in_threadpool(get_event_store().record, kind, output, processing_time)
+            return dict(extra, kind=kind, output=output, processing_time=processing_time)
+    if kind == "medication":
+        prescription = parse_prescription(text)
+        extra["prescription"] = {key: prescription[key] for key in ("drug", "parsed", "residual", "local")}
+        if prescription["local"] or (prescription["drug"] and not needs_chunking(text)):
+            output = prescription["output"]
+            if not prescription["local"]:
+                response_text = await _generate(
+                    build_medication_concern_prompt(text, output), generation_budget("medication_concern")
+                )
+                try:
+                    merge_medication_concern(output, response_text)
+                except StructuredOutputError as e:
+                    raise APIError(502, str(e))
+            output = normalize_medication_output(output)
+            processing_time = round(time.time() - start_time, 2)
+            await run_in_threadpool(get_event_store().record, kind, output, processing_time)
+            return dict(extra, kind=kind, output=output, processing_time=processing_time)
+    try:
+        if needs_chunking(text):
+            # Chunks are submitted together and merged; waiting on them happens off the event loop
+            output, extra["chunks"] = await run_in_threadpool(analyze_long_note, kind, text, priority=priority)
+            output = normalize_analysis(kind, output)
+        else:
+            response_text = await _generate(build_prompt(kind, text), generation_budget(kind), priority)
+            output = parse_analysis(kind, response_text)
+    except CircuitOpenError as e:
+        raise APIError(503, str(e))
+    except (InferenceError, requests.exceptions.RequestException) as e:
+        raise APIError(502, f"Inference failed: {e}")
+    except StructuredOutputError as e:
+        raise APIError(502, str(e))
+    if kind == "medication":
+        # Refill dates come from the schedule engine rather than the model's date arithmetic
+        output["refill_date"] = await run_in_threadpool(plan_refill_date, output)
+    processing_time = round(time.time() - start_time, 2)
+    await run_in_threadpool(get_event_store().record, kind, output, processing_time)
+    return dict(extra, kind=kind, output=output, processing_time=processing_time)
+
+
+async def _read_json(request):
+    try:
+        return await request.json()
+    except ValueError:
+        raise APIError(400, "Request body must be JSON")
+
+
+def _kind(request):
+    kind = ROUTE_KINDS.get(request.path_params["route"])
+    if kind is None:
+        raise APIError(404, f"Unknown analysis; expected one of {', '.join(ROUTE_KINDS)}")
+    return kind
+
+
+def _text(item):
+    text = item.get("text") if isinstance(item, dict) else item
+    if not isinstance(text, str) or not text.strip():
+        raise APIError(422, "Each item needs a non-empty 'text' string")
+    return text.strip()
+
+
+def _error_response(error):
+    return JSONResponse({"error": error.detail}, status_code=error.status_code)
+
+
+async def single(request):
+    try:
+        kind = _kind(request)
+        body = await _read_json(request)
+        return JSONResponse(await analyze(kind, _text(body)))
+    except APIError as e:
+        return _error_response(e)
+
+
+# Items run concurrently; the engine bounds how many reach the endpoint at once. Every item gets its own status, so an
+# unexpected error in one item is reported as that item's 500 rather than failing the whole batch.
+async def batch(request):
+    try:
+        kind = _kind(request)
+        body = await _read_json(request)
+        items = body.get("items") if isinstance(body, dict) else None
+        if not isinstance(items, list) or not items:
+            raise APIError(422, "Body must be {\"items\": [...]} with at least one item")
+        if len(items) > API_BATCH_MAX_ITEMS:
+            raise APIError(413, f"At most {API_BATCH_MAX_ITEMS} items per batch")
+        texts = [_text(item) for item in items]
+    except APIError as e:
+        return _error_response(e)
+
+    start_time = time.time()
+    outcomes = await asyncio.gather(*(analyze(kind, text) for text in texts), return_exceptions=True)
+    results = []
+    for index, (item, outcome) in enumerate(zip(items, outcomes)):
+        item_id = item.get("id", index + 1) if isinstance(item, dict) else index + 1
+        if isinstance(outcome, APIError):
+            results.append({"id": item_id, "error": outcome.detail, "status": outcome.status_code})
+        elif isinstance(outcome, Exception):
+            results.append({"id": item_id, "error": f"Internal error: {type(outcome).__name__}: {outcome}", "status": 500})
+        elif isinstance(outcome, BaseException):
+            raise outcome
+        else:
+            results.append(dict(outcome, id=item_id, status=200))
+    return JSONResponse({
+        "kind": kind,
+        "results": results,
+        "failed": sum(1 for r in results if r["status"] != 200),
+        "processing_time": round(time.time() - start_time, 2)
+    })
+
+
+async def health(request):
+    return JSONResponse({
+        "status": "ok", "engine": get_engine().stats(), "scheduler": get_engine().scheduler.snapshot(),
+        "parse": parse_stats.snapshot(), "prompts": prompt_stats.snapshot()
+    })
+
+
+app = Starlette(routes=[
+    Route("/health", health, methods=["GET"]),
+    Route("/{route:str}/batch", batch, methods=["POST"]),
+    Route("/{route:str}", single, methods=["POST"])
+])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the triage, medication, mental health and report analyzers over HTTP.")
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=API_PORT)
+    parser.add_argument("-w", "--workers", type=int, default=API_WORKERS, help="uvicorn worker processes")
+    args = parser.parse_args(argv)
+    uvicorn.run("api:app", host=args.host, port=args.port, workers=args.workers)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
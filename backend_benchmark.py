@@ -0,0 +1,223 @@
+import argparse
+import json
+import random
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from analyzers import build_prompt
+from inference import POOL_SIZE, HFBackend, InferenceClient, InferenceEngine, OpenAIBackend
+from local_backend import LocalBackend
+from scheduler import PRIORITY_CLASSES, PriorityScheduler, priority_for
+from structured_output import generation_budget
+
+# Backends compared by default; "local" loads the in-process model unless --stub is given
+BENCHMARK_BACKENDS = ("hf", "openai", "local")
+
+# Simulated generation latency (seconds) for the stub server and the stub local generator
+STUB_LATENCY = 0.2
+
+SAMPLE_COMPLAINTS = [
+    "chest pain radiating to the left arm, sweating, BP 150/95, HR 110",
+    "sore throat and mild fever for two days, eating and drinking normally",
+    "fell from a ladder, right wrist swollen and painful, no head injury",
+    "shortness of breath on exertion, ankle swelling, known heart failure",
+    "sudden severe headache, worst of life, vomiting, neck stiffness",
+    "rash on both forearms after gardening, itchy, no fever"
+]
+
+STUB_OUTPUT = json.dumps({"urgency": "Medium", "triage_category": "3", "action": "Assess within 60 minutes"})
+
+
+# Function to build the benchmark workload: count triage prompts over synthetic notes
+def sample_prompts(count, seed=0):
+    rng = random.Random(seed)
+    return [
+        build_prompt("triage", f"Patient {i}, age {rng.randint(18, 90)}: {rng.choice(SAMPLE_COMPLAINTS)}.")
+        for i in range(count)
+    ]
+
+
+# Stand-in inference server answering both the Hugging Face and the OpenAI-compatible completion protocols
+class StubHandler(BaseHTTPRequestHandler):
+    latency = STUB_LATENCY
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.latency)
+        if self.path.startswith("/v1/completions"):
+            body = {"choices": [{"index": 0, "text": STUB_OUTPUT, "finish_reason": "stop"}]}
+        else:
+            body = [{"generated_text": STUB_OUTPUT}]
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Function to start the stub server on a free local port; returns (server, base_url)
+def start_stub(latency=STUB_LATENCY):
+    handler = type("Handler", (StubHandler,), {"latency": latency})
+    # A listen backlog as deep as the connection pool, so bursts are not delayed by SYN retransmits
+    server_class = type("StubServer", (ThreadingHTTPServer,), {"request_queue_size": POOL_SIZE})
+    server = server_class(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+# Function to build a stub batched generator whose cost is fixed per batch, like one padded forward pass
+def stub_generator(latency=STUB_LATENCY):
+    def generate(prompts, max_length, temperature, stop=()):
+        time.sleep(latency)
+        return [STUB_OUTPUT for _ in prompts]
+
+    return generate
+
+
+# Function to build the named backend, pointed at the stub server when stub_url is given
+def make_benchmark_backend(name, stub_url=None, latency=STUB_LATENCY):
+    if name == "hf":
+        return HFBackend(stub_url) if stub_url else HFBackend()
+    if name == "openai":
+        return OpenAIBackend(stub_url) if stub_url else OpenAIBackend()
+    if name == "local":
+        return LocalBackend(stub_generator(latency) if stub_url else None)
+    raise ValueError(f"Unknown inference backend: {name}")
+
+
+# Function to run the workload through one backend with the given concurrency; caching is off so every prompt runs
+def run_workload(backend, prompts, concurrency, max_length=None):
+    client = InferenceClient(backend)
+    engine = InferenceEngine(client, max_concurrency=concurrency)
+    max_length = max_length or generation_budget("triage")
+    latencies = []
+
+    def timed(prompt):
+        start_time = time.perf_counter()
+        engine.generate(prompt, max_length=max_length, use_cache=False)
+        latencies.append(time.perf_counter() - start_time)
+
+    # Requests come from concurrency caller threads, as Streamlit sessions and API workers would
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(timed, prompt) for prompt in prompts]
+        wait(futures)
+    elapsed = time.perf_counter() - start_time
+    errors = [future.exception() for future in futures if future.exception() is not None]
+    client.close()
+    latencies.sort()
+    result = {
+        "prompts": len(prompts),
+        "errors": len(errors),
+        "elapsed": elapsed,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "p50": statistics.median(latencies) if latencies else None,
+        "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else None
+    }
+    if errors:
+        result["error"] = str(errors[0])
+    if hasattr(backend, "stats"):
+        result.update(backend.stats())
+    return result
+
+
+def _p95(values):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * 0.95))]
+
+
+# Function to run a mixed workload: count bulk report and medication prompts flood the engine at once while crisis and
+# triage prompts arrive one by one, as live sessions would. Returns per-class end-to-end latencies (seconds).
+# With fifo every request shares one class with no limits, i.e. first come first served.
+def run_mixed(backend, count, concurrency, fifo=False, interval=STUB_LATENCY / 2):
+    client = InferenceClient(backend)
+    engine = InferenceEngine(client, max_concurrency=concurrency)
+    if fifo:
+        engine.scheduler = PriorityScheduler(concurrency, limits={})
+    latencies = {cls: [] for cls in PRIORITY_CLASSES}
+    futures = []
+
+    def submit(kind, note):
+        prompt = build_prompt(kind, note)
+        cls = "triage" if fifo else None
+        start_time = time.perf_counter()
+        future = engine.submit(prompt, max_length=generation_budget(kind), use_cache=False, priority=cls)
+        future.add_done_callback(
+            lambda f, cls=priority_for(prompt): latencies[cls].append(time.perf_counter() - start_time)
+        )
+        futures.append(future)
+
+    for i in range(count):
+        kind = "medication" if i % 4 == 3 else "report"
+        submit(kind, f"Bulk note {i}: follow-up visit, vitals stable, continue current medications.")
+    for i in range(max(1, count // 4)):
+        kind = "mental_health" if i % 2 else "triage"
+        submit(kind, f"Live note {i}: {SAMPLE_COMPLAINTS[i % len(SAMPLE_COMPLAINTS)]}.")
+        time.sleep(interval)
+    wait(futures)
+    client.close()
+    return {cls: values for cls, values in latencies.items() if values}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare inference backends on the same triage prompt workload.")
+    parser.add_argument("backends", nargs="*", metavar="backend",
+                        help=f"backends to run (default: {' '.join(BENCHMARK_BACKENDS)})")
+    parser.add_argument("-n", "--prompts", type=int, default=32, help="prompts in the workload")
+    parser.add_argument("-c", "--concurrency", type=int, default=8, help="requests in flight at once")
+    parser.add_argument("--max-length", type=int, help="tokens to generate per prompt (default: the triage budget)")
+    parser.add_argument("--stub", action="store_true", help="run the HTTP backends against a local stub server and "
+                                                            "the local backend with a stub generator (no model)")
+    parser.add_argument("--latency", type=float, default=STUB_LATENCY, help="stub generation latency (seconds)")
+    parser.add_argument("--mixed", action="store_true", help="flood with -n report/medication prompts while crisis and "
+                                                             "triage prompts arrive, with and without prioritization")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.backends if name not in BENCHMARK_BACKENDS]
+    if unknown:
+        parser.error(f"unknown backend: {', '.join(unknown)}")
+
+    prompts = sample_prompts(args.prompts)
+    server, stub_url = start_stub(args.latency) if args.stub else (None, None)
+    try:
+        if args.mixed:
+            for name in args.backends or BENCHMARK_BACKENDS:
+                for fifo in (True, False):
+                    backend = make_benchmark_backend(name, stub_url, args.latency)
+                    latencies = run_mixed(backend, args.prompts, args.concurrency, fifo, args.latency / 2)
+                    classes = ", ".join(
+                        f"{cls} p50 {statistics.median(values) * 1000:.0f} / p95 {_p95(values) * 1000:.0f} ms"
+                        for cls, values in latencies.items()
+                    )
+                    print(f"{name:<7} {'fifo' if fifo else 'priority':<8} {classes}")
+            return 0
+        for name in args.backends or BENCHMARK_BACKENDS:
+            result = run_workload(make_benchmark_backend(name, stub_url, args.latency), prompts, args.concurrency,
+                                  args.max_length)
+            if result["p50"] is None:
+                print(f"{name:<7} failed: {result.get('error')}")
+                continue
+            line = (f"{name:<7} {result['prompts']} prompts x{args.concurrency}: {result['elapsed']:.2f}s, "
+                    f"{result['throughput']:.1f} prompts/s, p50 {result['p50'] * 1000:.0f} ms, "
+                    f"p95 {result['p95'] * 1000:.0f} ms")
+            if "avg_batch" in result:
+                line += f", {result['batches']} batches (avg {result['avg_batch']})"
+            if result["errors"]:
+                line += f", {result['errors']} errors ({result['error']})"
+            print(line)
+    finally:
+        if server is not None:
+            server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+import argparse
+import csv
+import io
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from analyzers import build_triage_prompt, normalize_triage_output
+from event_store import get_event_store
+from inference import get_engine
+from long_notes import analyze_long_note, needs_chunking
+from pretriage import PRETRIAGE_SHORT_CIRCUIT, pretriage, pretriage_output
+from scheduler import triage_priority
+from structured_output import generation_budget, parse_structured_output
+
+# Maximum number of notes in flight against the inference endpoint at once
+BATCH_MAX_WORKERS = 8
+
+# Column / field names recognised as the note text, in order of preference
+NOTE_FIELDS = ("note", "clinical_note", "text", "intake_note")
+
+URGENCY_ORDER = {"Critical": 0, "High": 1, "Medium": 2, "Low": 3}
+
+
+# Function to read intake notes from CSV or JSONL text into [{"id", "note"}] records
+def load_notes(text, filename):
+    if filename.lower().endswith((".jsonl", ".ndjson")):
+        rows = [json.loads(line) for line in text.splitlines() if line.strip()]
+    else:
+        rows = list(csv.DictReader(io.StringIO(text)))
+    records = []
+    for index, row in enumerate(rows):
+        field = next((f for f in NOTE_FIELDS if f in row), None)
+        if field is None:
+            field = next(iter(row), None)
+        note = str(row.get(field) or "").strip() if field else ""
+        if note:
+            records.append({"id": row.get("id", index + 1), "note": note})
+    return records
+
+
+# Function to triage a single note headlessly; raises on inference or parsing failure.
+# priority is the scheduler class (default "triage"; red-flag notes go in as "crisis").
+def triage_note(note, priority=None):
+    if needs_chunking(note):
+        output, _ = analyze_long_note("triage", note, priority=priority)
+        return normalize_triage_output(output)
+    response_text = get_engine().generate(
+        build_triage_prompt(note), max_length=generation_budget("triage"), priority=priority
+    )
+    return normalize_triage_output(parse_structured_output(response_text, "triage"))
+
+
+# Function to fan notes out with bounded concurrency, yielding one result row per note as it completes.
+# Notes are pre-triaged locally and submitted most urgent first, so red flags reach the model ahead of routine ones;
+# notes with no rule match are queued as Medium.
+def run_batch(records, max_workers=BATCH_MAX_WORKERS):
+    ranked = sorted(
+        ((pretriage(record["note"]), record) for record in records),
+        key=lambda item: URGENCY_ORDER.get(item[0]["urgency"], URGENCY_ORDER["Medium"])
+    )
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(_timed_triage, record["note"], provisional): (record, provisional)
+            for provisional, record in ranked
+        }
+        for future in as_completed(futures):
+            record, provisional = futures[future]
+            output, elapsed, error = future.result()
+            yield {
+                "id": record["id"],
+                "pretriage": provisional["urgency"] or "",
+                "triage_category": output.get("triage_category", "Unknown"),
+                "urgency": output.get("urgency", "Unknown"),
+                "symptoms": ", ".join(map(str, output.get("symptoms", []))),
+                "potential_diagnosis": ", ".join(map(str, output.get("potential_diagnosis", []))),
+                "recommended_tests": ", ".join(map(str, output.get("recommended_tests", []))),
+                "action": output.get("action", ""),
+                "processing_time": elapsed,
+                "error": error,
+                "note": record["note"]
+            }
+
+
+def _timed_triage(note, provisional):
+    start_time = time.time()
+    try:
+        if provisional["confident"] and provisional["urgency"] in PRETRIAGE_SHORT_CIRCUIT:
+            output = normalize_triage_output(pretriage_output(provisional))
+        else:
+            output = triage_note(note, triage_priority(provisional["urgency"]))
+        error = ""
+    except Exception as e:
+        output = normalize_triage_output(pretriage_output(provisional) if provisional["urgency"] else {})
+        error = str(e)
+    elapsed = round(time.time() - start_time, 2)
+    if not error:
+        get_event_store().record("triage", output, elapsed)
+    return output, elapsed, error
+
+
+# Function to build the results DataFrame, most urgent triage category first
+def results_frame(rows):
+    import pandas as pd
+
+    df = pd.DataFrame(rows)
+    if df.empty:
+        return df
+    df["_category"] = pd.to_numeric(df["triage_category"], errors="coerce")
+    df["_urgency"] = df["urgency"].map(URGENCY_ORDER)
+    df = df.sort_values(["_category", "_urgency"], na_position="last", kind="stable")
+    return df.drop(columns=["_category", "_urgency"]).reset_index(drop=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch-triage a CSV or JSONL file of ER intake notes.")
+    parser.add_argument("path", help="CSV (with a 'note' column) or JSONL (with a 'note' field) of intake notes")
+    parser.add_argument("-w", "--workers", type=int, default=BATCH_MAX_WORKERS, help="concurrent inference requests")
+    parser.add_argument("-o", "--output", help="write results as CSV to this path instead of stdout")
+    args = parser.parse_args(argv)
+
+    with open(args.path, encoding="utf-8") as f:
+        records = load_notes(f.read(), args.path)
+
+    start_time = time.time()
+    rows = []
+    for row in run_batch(records, max_workers=args.workers):
+        rows.append(row)
+        print(f"[{len(rows)}/{len(records)}] {row['id']}: {row['urgency']} (category {row['triage_category']})",
+              file=sys.stderr)
+    elapsed = time.time() - start_time
+
+    df = results_frame(rows)
+    df.to_csv(args.output or sys.stdout, index=False)
+    rate = len(rows) / elapsed if elapsed > 0 else 0.0
+    print(f"Triaged {len(rows)} notes in {elapsed:.2f}s ({rate:.2f} notes/sec)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
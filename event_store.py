@@ -0,0 +1,171 @@
+import copy
+import json
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+# Append-only store of analysis results with rollups maintained on write
+EVENT_STORE_DB = "analysis_events.sqlite3"
+
+# Rollup dimensions recorded per analysis kind: metric name -> output field
+ROLLUP_FIELDS = {
+    "triage": {"urgency": "urgency"},
+    "medication": {"medication": "medication", "adherence_risk": "adherence_risk"},
+    "mental_health": {"risk_level": "risk_level"},
+    "report": {}
+}
+
+
+class EventStore:
+    def __init__(self, path=EVENT_STORE_DB):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                processing_time REAL,
+                fallback INTEGER NOT NULL DEFAULT 0,
+                payload TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS rollups (
+                kind TEXT NOT NULL,
+                metric TEXT NOT NULL,
+                bucket TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                total_time REAL NOT NULL DEFAULT 0,
+                fallbacks INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (kind, metric, bucket)
+            );
+        """)
+        self._db.commit()
+
+    # Appends one analysis result and updates its rollups in the same transaction
+    def record(self, kind, output, processing_time=None, fallback=False, created_at=None):
+        created_at = created_at or time.time()
+        day = datetime.fromtimestamp(created_at).strftime("%Y-%m-%d")
+        buckets = [("all", "all"), ("day", day)]
+        for metric, field in ROLLUP_FIELDS.get(kind, {}).items():
+            value = output.get(field)
+            if isinstance(value, str) and value.strip():
+                buckets.append((metric, value.strip()))
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO events (kind, created_at, processing_time, fallback, payload) VALUES (?, ?, ?, ?, ?)",
+                (kind, created_at, processing_time, int(fallback), json.dumps(output, default=str))
+            )
+            self._db.executemany(
+                "INSERT INTO rollups (kind, metric, bucket, count, total_time, fallbacks) VALUES (?, ?, ?, 1, ?, ?) "
+                "ON CONFLICT (kind, metric, bucket) DO UPDATE SET count = count + 1, "
+                "total_time = total_time + excluded.total_time, fallbacks = fallbacks + excluded.fallbacks",
+                [(kind, metric, bucket, processing_time or 0.0, int(fallback)) for metric, bucket in buckets]
+            )
+
+    # {bucket: count} for one rollup dimension
+    def distribution(self, kind, metric):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT bucket, count FROM rollups WHERE kind = ? AND metric = ? ORDER BY count DESC", (kind, metric)
+            ).fetchall()
+        return dict(rows)
+
+    # {"count", "avg_processing_time", "fallback_rate"} over every event of a kind
+    def totals(self, kind):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT count, total_time, fallbacks FROM rollups WHERE kind = ? AND metric = 'all' AND bucket = 'all'",
+                (kind,)
+            ).fetchone()
+        count, total_time, fallbacks = row or (0, 0.0, 0)
+        return {
+            "count": count,
+            "avg_processing_time": round(total_time / count, 2) if count else 0.0,
+            "fallback_rate": round(100 * fallbacks / count, 1) if count else 0.0
+        }
+
+    # [(day, count, avg_processing_time)] for the last `days` days, oldest first, zero-filled
+    def daily(self, kind, days=7, today=None):
+        today = today or date.today()
+        first = (today - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT bucket, count, total_time FROM rollups WHERE kind = ? AND metric = 'day' AND bucket >= ?",
+                (kind, first)
+            ).fetchall()
+        by_day = {bucket: (count, total_time) for bucket, count, total_time in rows}
+        series = []
+        for offset in range(days - 1, -1, -1):
+            day = (today - timedelta(days=offset)).strftime("%Y-%m-%d")
+            count, total_time = by_day.get(day, (0, 0.0))
+            series.append((day, count, round(total_time / count, 2) if count else 0.0))
+        return series
+
+    # Recorded outputs of a kind in insertion order, optionally limited to one YYYY-MM-DD day; read in pages
+    def outputs(self, kind, day=None, page_size=500):
+        start, end = float("-inf"), float("inf")
+        if day:
+            start = datetime.strptime(day, "%Y-%m-%d").timestamp()
+            end = (datetime.strptime(day, "%Y-%m-%d") + timedelta(days=1)).timestamp()
+        last_id = 0
+        while True:
+            with self._lock:
+                rows = self._db.execute(
+                    "SELECT id, payload FROM events WHERE kind = ? AND id > ? AND created_at >= ? AND created_at < ? "
+                    "ORDER BY id LIMIT ?",
+                    (kind, last_id, start, end, page_size)
+                ).fetchall()
+            if not rows:
+                return
+            for last_id, payload in rows:
+                yield json.loads(payload)
+
+
+# Function to build the dashboard analytics dict from recorded events; unmeasured figures keep their defaults
+def build_analytics(store, defaults, reminders_sent=0):
+    analytics = copy.deepcopy(defaults)
+
+    triage = store.totals("triage")
+    if triage["count"]:
+        urgency = {level: 0 for level in ("Critical", "High", "Medium", "Low")}
+        urgency.update(store.distribution("triage", "urgency"))
+        analytics["triage_stats"].update(
+            total_cases=triage["count"],
+            urgency_distribution=urgency,
+            avg_processing_time=triage["avg_processing_time"]
+        )
+
+    medication = store.totals("medication")
+    if medication["count"]:
+        top = list(store.distribution("medication", "medication").items())[:5]
+        analytics["medication_stats"]["most_common_medications"] = dict(top)
+    analytics["medication_stats"]["total_reminders_sent"] = reminders_sent
+
+    mental = store.totals("mental_health")
+    if mental["count"]:
+        risk_levels = {level: 0 for level in ("High", "Medium", "Low")}
+        risk_levels.update(store.distribution("mental_health", "risk_level"))
+        analytics["mental_health_stats"]["risk_levels"] = risk_levels
+
+    report = store.totals("report")
+    if report["count"]:
+        analytics["report_stats"].update(
+            total_reports=report["count"],
+            avg_completion_time=report["avg_processing_time"],
+            error_rate=report["fallback_rate"]
+        )
+    return analytics
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+# Process-wide event store
+def get_event_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = EventStore()
+        return _store
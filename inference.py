@@ -0,0 +1,485 @@
+import asyncio
+import functools
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from prompts import prompt_stats
+from response_cache import ResponseCache, make_cache_key
+from scheduler import PriorityScheduler, priority_for
+from structured_output import JSON_STOP_SEQUENCES, SCHEMAS, JSONEndScanner, is_structured_output
+
+# Hugging Face API configuration
+API_URL = ""
+headers = {
+    "Authorization": "",
+    "Content-Type": ""
+}
+
+# Inference backend: "hf" (hosted Inference API above), "openai" (OpenAI-compatible server such as TGI's /v1 API,
+# vLLM or llama.cpp's server) or "local" (in-process CPU model, see local_backend.py)
+INFERENCE_BACKEND = "hf"
+
+# OpenAI-compatible server settings
+OPENAI_BASE_URL = "http://localhost:8080"
+OPENAI_MODEL = "tgi"
+OPENAI_API_KEY = ""
+
+# Connection pool and timeout settings (seconds) for inference requests
+POOL_SIZE = 20
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 60
+
+# Retry settings for 429 / 503 "model loading" responses
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 10.0
+RETRY_STATUS_CODES = (429, 503)
+
+# Maximum number of upstream requests the inference engine keeps in flight
+ENGINE_MAX_CONCURRENCY = POOL_SIZE
+
+# Circuit breaker settings: open after N consecutive failures, probe again after the cooldown
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_COOLDOWN = 30.0
+
+
+class InferenceError(Exception):
+    pass
+
+
+class CircuitOpenError(InferenceError):
+    pass
+
+
+# Tracks consecutive endpoint failures and short-circuits calls while the endpoint is down
+class CircuitBreaker:
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.cooldown:
+                return "half-open"
+            return "open"
+
+    def allow(self):
+        # After the cooldown a single probe is let through; it re-arms the cooldown until it resolves
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at >= self.cooldown:
+                self._opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+# Delay before the next retry: full-jitter exponential backoff, stretched to honour Retry-After
+def backoff_delay(attempt, response=None):
+    delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, min(BACKOFF_CAP, float(retry_after)))
+    return delay
+
+
+# Shared HTTP plumbing for remote backends: pooled keep-alive session, retries with backoff and a circuit breaker.
+# Subclasses supply the endpoint's request payload and how to read its responses and stream events.
+class HTTPBackend:
+    def __init__(self, api_url, headers=None, pool_size=POOL_SIZE,
+                 connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 max_retries=MAX_RETRIES, breaker=None):
+        self.api_url = api_url
+        # The endpoint identifies the model unless a subclass names it in the payload
+        self.model = api_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.breaker = breaker or CircuitBreaker()
+        self.session = requests.Session()
+        self.session.headers.update({k: v for k, v in (headers or {}).items() if v})
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _payload(self, prompt, max_length, temperature, stop=(), stream=False):
+        raise NotImplementedError
+
+    # Returns the generated text from a complete JSON response, or None if the format is not recognised
+    def _text(self, result):
+        raise NotImplementedError
+
+    # Returns the text carried by one parsed stream event ("" for none), or None at the end of the stream
+    def _token(self, event):
+        raise NotImplementedError
+
+    # POST with retries; returns once response headers arrive (the body is left unread)
+    def _post(self, data, report):
+        if not self.breaker.allow():
+            raise CircuitOpenError("Inference endpoint unavailable (circuit open)")
+        for attempt in range(self.max_retries + 1):
+            report("sent")
+            try:
+                response = self.session.post(self.api_url, json=data, timeout=self.timeout, stream=True)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                # Read timeouts are not retried: a hung generation would only hang again
+                if attempt < self.max_retries and not isinstance(e, requests.exceptions.ReadTimeout):
+                    report("retrying")
+                    time.sleep(backoff_delay(attempt))
+                    continue
+                self.breaker.record_failure()
+                raise
+            if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                response.close()
+                report("retrying")
+                time.sleep(backoff_delay(attempt, response))
+                continue
+            break
+        report("first_byte")
+        if response.status_code >= 500 or response.status_code in RETRY_STATUS_CODES:
+            self.breaker.record_failure()
+        if response.status_code >= 400:
+            response.close()
+        response.raise_for_status()
+        return response
+
+    def generate(self, prompt, max_length, temperature, report, stop=()):
+        response = self._post(self._payload(prompt, max_length, temperature, stop), report)
+        try:
+            result = response.json()
+        except requests.exceptions.RequestException:
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        report("parsed")
+        text = self._text(result)
+        if text is None:
+            raise InferenceError(f"Unexpected response format: {result}")
+        return text
+
+    # Yields generated text chunks as they arrive over server-sent events. Closing the generator early drops the
+    # connection, which stops generation on servers that cancel on disconnect (TGI, vLLM).
+    def stream(self, prompt, max_length, temperature, report, stop=()):
+        response = self._post(self._payload(prompt, max_length, temperature, stop, stream=True), report)
+        with response:
+            if "text/event-stream" not in response.headers.get("Content-Type", ""):
+                # Endpoint ignored the stream flag: fall back to the whole response at once
+                result = response.json()
+                text = self._text(result)
+                if text is None:
+                    raise InferenceError(f"Unexpected response format: {result}")
+                self.breaker.record_success()
+                report("parsed")
+                yield text
+                return
+            response.encoding = "utf-8"
+            try:
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    try:
+                        event = json.loads(data)
+                    except ValueError:
+                        # A garbled event means a misbehaving endpoint (or proxy), not a client error
+                        self.breaker.record_failure()
+                        raise InferenceError(f"Malformed stream event: {data[:200]}")
+                    token = self._token(event)
+                    if token is None:
+                        break
+                    if token:
+                        yield token
+            except requests.exceptions.RequestException:
+                self.breaker.record_failure()
+                raise
+            except GeneratorExit:
+                # The caller has what it needs (e.g. a complete JSON object); the endpoint itself was healthy
+                self.breaker.record_success()
+                raise
+        self.breaker.record_success()
+        report("parsed")
+
+    def close(self):
+        self.session.close()
+
+
+# Hosted Hugging Face Inference API (and TGI's native /generate_stream protocol when streaming)
+class HFBackend(HTTPBackend):
+    name = "hf"
+
+    def __init__(self, api_url=API_URL, headers=headers, **options):
+        super().__init__(api_url, headers, **options)
+
+    # max_length is a budget of new tokens, as for the other backends; the API's own max_length would count the prompt
+    def _payload(self, prompt, max_length, temperature, stop=(), stream=False):
+        data = {
+            "inputs": prompt,
+            "parameters": {
+                "max_new_tokens": max_length,
+                "temperature": temperature,
+                "return_full_text": False
+            }
+        }
+        if stop:
+            data["parameters"]["stop"] = list(stop)
+        if stream:
+            data["stream"] = True
+        return data
+
+    def _text(self, result):
+        if isinstance(result, list) and len(result) > 0 and "generated_text" in result[0]:
+            return result[0]["generated_text"]
+        return None
+
+    def _token(self, event):
+        if "error" in event:
+            raise InferenceError(f"Streaming generation failed: {event['error']}")
+        token = event.get("token") or {}
+        if token.get("special") or not token.get("text"):
+            return ""
+        return token["text"]
+
+
+# OpenAI-compatible completions endpoint: TGI's /v1 API, vLLM, llama.cpp server, or a local stub
+class OpenAIBackend(HTTPBackend):
+    name = "openai"
+
+    def __init__(self, base_url=OPENAI_BASE_URL, model=OPENAI_MODEL, api_key=OPENAI_API_KEY, **options):
+        super().__init__(
+            f"{base_url.rstrip('/')}/v1/completions",
+            {"Authorization": f"Bearer {api_key}" if api_key else ""}, **options
+        )
+        self.model = model
+
+    def _payload(self, prompt, max_length, temperature, stop=(), stream=False):
+        return {
+            "model": self.model,
+            "prompt": prompt,
+            "max_tokens": max_length,
+            "temperature": temperature,
+            "stop": list(stop) or None,
+            "stream": stream
+        }
+
+    def _text(self, result):
+        choices = result.get("choices") if isinstance(result, dict) else None
+        if choices and isinstance(choices[0], dict) and "text" in choices[0]:
+            return choices[0]["text"]
+        return None
+
+    def _token(self, event):
+        if "error" in event:
+            raise InferenceError(f"Streaming generation failed: {event['error']}")
+        choices = event.get("choices") or [{}]
+        return choices[0].get("text") or ""
+
+
+# Function to build the configured inference backend
+def make_backend(name=INFERENCE_BACKEND):
+    if name == "hf":
+        return HFBackend()
+    if name == "openai":
+        return OpenAIBackend()
+    if name == "local":
+        from local_backend import LocalBackend
+
+        return LocalBackend()
+    raise ValueError(f"Unknown inference backend: {name}")
+
+
+# Backend-independent client: response cache and per-template latency accounting in front of one backend.
+# stop is sent with every request; the default ends generation at the closing fence of a ```json block.
+class InferenceClient:
+    def __init__(self, backend=None, cache=None, stop=JSON_STOP_SEQUENCES):
+        self.backend = backend or make_backend()
+        self.cache = cache
+        self.stop = tuple(stop)
+        self.early_stops = 0
+
+    def cache_key(self, prompt, max_length, temperature):
+        return make_cache_key(prompt, max_length, temperature, self.backend.name, self.backend.model, self.stop)
+
+    def _cached(self, prompt, max_length, temperature, use_cache):
+        if not use_cache or self.cache is None:
+            return None, None
+        key = self.cache_key(prompt, max_length, temperature)
+        return key, self.cache.get(key)
+
+    # Caches text only once it parses as the structured output of the prompt's template, so a malformed response is
+    # generated afresh next time rather than served from the cache; prompts without a schema are cached as they are
+    def _store(self, key, prompt, text):
+        if key is None:
+            return
+        feature = (getattr(prompt, "template_key", None) or "").split("@")[0]
+        if feature in SCHEMAS and not is_structured_output(text, feature):
+            return
+        self.cache.put(key, text)
+
+    # progress, if given, is called with "sent", "retrying", "first_byte", "parsed" or "cached" as the request advances
+    def generate(self, prompt, max_length=800, temperature=0.3, use_cache=True, progress=None):
+        report = progress or (lambda stage: None)
+        start_time = time.perf_counter()
+        key, cached = self._cached(prompt, max_length, temperature, use_cache)
+        if cached is not None:
+            report("cached")
+            prompt_stats.observe(prompt, 0.0, cached=True)
+            return cached
+        generated_text = self.backend.generate(prompt, max_length, temperature, report, self.stop)
+        self._store(key, prompt, generated_text)
+        prompt_stats.observe(prompt, time.perf_counter() - start_time)
+        return generated_text
+
+    # Yields generated text chunks as the backend produces them. With stop_at_json the stream ends as soon as a balanced
+    # top-level JSON object has arrived: text after its closing brace is dropped and the backend stream is closed.
+    def stream(self, prompt, max_length=800, temperature=0.3, use_cache=True, progress=None, stop_at_json=True):
+        report = progress or (lambda stage: None)
+        start_time = time.perf_counter()
+        key, cached = self._cached(prompt, max_length, temperature, use_cache)
+        if cached is not None:
+            report("cached")
+            prompt_stats.observe(prompt, 0.0, cached=True)
+            yield cached
+            return
+        parts = []
+        scanner = JSONEndScanner() if stop_at_json else None
+        chunks = self.backend.stream(prompt, max_length, temperature, report, self.stop)
+        try:
+            for chunk in chunks:
+                end = scanner.feed(chunk) if scanner is not None else None
+                if end is not None:
+                    chunk = chunk[:end]
+                if chunk:
+                    parts.append(chunk)
+                    yield chunk
+                if end is not None:
+                    self.early_stops += 1
+                    break
+        finally:
+            chunks.close()
+        prompt_stats.observe(prompt, time.perf_counter() - start_time)
+        self._store(key, prompt, "".join(parts))
+
+    def close(self):
+        self.backend.close()
+
+
+# Single asyncio event loop that coalesces identical in-flight prompts and admits upstream calls through a priority
+# scheduler. priority names a scheduler class; by default it follows the prompt's template.
+class InferenceEngine:
+    def __init__(self, client, max_concurrency=ENGINE_MAX_CONCURRENCY):
+        self.client = client
+        self.max_concurrency = max_concurrency
+        self.loop = asyncio.new_event_loop()
+        self.requests = 0
+        self.coalesced = 0
+        self._inflight = {}
+        self.scheduler = PriorityScheduler(max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="inference")
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="inference-loop", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self._ready.set()
+        self.loop.run_forever()
+
+    async def generate_async(self, prompt, max_length=800, temperature=0.3, use_cache=True, progress=None,
+                             priority=None):
+        self.requests += 1
+        key = (self.client.cache_key(prompt, max_length, temperature), use_cache)
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            if progress:
+                progress("coalesced")
+            return await asyncio.shield(future)
+        future = self.loop.create_future()
+        self._inflight[key] = future
+        priority = priority or priority_for(prompt)
+        try:
+            await self.scheduler.acquire(priority)
+            try:
+                call = functools.partial(self.client.generate, prompt, max_length, temperature, use_cache, progress)
+                future.set_result(await self.loop.run_in_executor(self._executor, call))
+            finally:
+                self.scheduler.release(priority)
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            del self._inflight[key]
+        return await future
+
+    # Schedule a request from any thread; returns a concurrent.futures.Future
+    def submit(self, prompt, max_length=800, temperature=0.3, use_cache=True, progress=None, priority=None):
+        coro = self.generate_async(prompt, max_length, temperature, use_cache, progress, priority)
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    # Blocking entry point for Streamlit script threads and worker pools
+    def generate(self, prompt, max_length=800, temperature=0.3, use_cache=True, timeout=None, priority=None):
+        return self.submit(prompt, max_length, temperature, use_cache, priority=priority).result(timeout)
+
+    # Streams a prompt through the client once the scheduler admits it, so streamed calls share the same priorities
+    def stream(self, prompt, max_length=800, temperature=0.3, use_cache=True, priority=None):
+        priority = priority or priority_for(prompt)
+        asyncio.run_coroutine_threadsafe(self.scheduler.acquire(priority), self.loop).result()
+        try:
+            yield from self.client.stream(prompt, max_length, temperature, use_cache)
+        finally:
+            self.loop.call_soon_threadsafe(self.scheduler.release, priority)
+
+    def stats(self):
+        return {
+            "backend": self.client.backend.name, "requests": self.requests, "coalesced": self.coalesced,
+            "in_flight": len(self._inflight), "queued": self.scheduler.queued, "early_stops": self.client.early_stops
+        }
+
+
+_client = None
+_engine = None
+_client_lock = threading.Lock()
+
+
+# Process-wide client shared by every Streamlit session and worker thread
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = InferenceClient(cache=ResponseCache())
+        return _client
+
+
+# Process-wide engine in front of the shared client
+def get_engine():
+    global _engine
+    client = get_client()
+    with _client_lock:
+        if _engine is None:
+            _engine = InferenceEngine(client)
+        return _engine
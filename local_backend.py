@@ -0,0 +1,153 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from structured_output import JSONEndScanner
+
+# In-process model for offline use (CPU); any causal LM on the Hugging Face hub with a chat-style instruct tune works
+LOCAL_MODEL = "Qwen/Qwen2.5-0.5B-Instruct"
+
+# Concurrent prompts with the same generation settings are run as one padded batch of up to this many,
+# waiting at most LOCAL_BATCH_WAIT seconds for a batch to fill once its first prompt arrives
+LOCAL_BATCH_SIZE = 8
+LOCAL_BATCH_WAIT = 0.02
+
+# Dynamic int8 quantization of the model's linear layers: roughly halves CPU latency for small quality loss
+LOCAL_QUANTIZE = True
+
+# CPU threads for the model (None leaves torch's default)
+LOCAL_THREADS = None
+
+
+# Function to return the prefix of text up to the end of its first balanced JSON object, or None if it has not closed
+def _json_prefix(text):
+    end = JSONEndScanner().feed(text)
+    return None if end is None else text[:end]
+
+
+# Function to load LOCAL_MODEL and return a batched generator: generate(prompts, max_length, temperature, stop) -> texts.
+# Each sequence stops at a stop string or as soon as its JSON object closes, and the batch ends when all have stopped.
+# transformers and torch are imported here so the dashboard only needs them when the local backend is selected.
+def load_generator(model_name=LOCAL_MODEL, quantize=LOCAL_QUANTIZE, threads=LOCAL_THREADS):
+    import torch
+    from transformers import AutoModelForCausalLM, AutoTokenizer, StoppingCriteria, StoppingCriteriaList
+
+    if threads:
+        torch.set_num_threads(threads)
+    tokenizer = AutoTokenizer.from_pretrained(model_name, padding_side="left")
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    model = AutoModelForCausalLM.from_pretrained(model_name, torch_dtype=torch.float32)
+    model.eval()
+    if quantize:
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    class JSONObjectStop(StoppingCriteria):
+        def __init__(self, width):
+            self.width = width
+
+        def __call__(self, input_ids, scores, **kwargs):
+            texts = tokenizer.batch_decode(input_ids[:, self.width:], skip_special_tokens=True)
+            return torch.tensor([_json_prefix(text) is not None for text in texts], device=input_ids.device)
+
+    def generate(prompts, max_length, temperature, stop=()):
+        inputs = tokenizer(list(prompts), return_tensors="pt", padding=True)
+        # Left padding lines every prompt up at the same width, so new tokens start at the same column
+        width = inputs["input_ids"].shape[1]
+        sampling = {"do_sample": True, "temperature": temperature} if temperature > 0 else {"do_sample": False}
+        if stop:
+            sampling.update(stop_strings=list(stop), tokenizer=tokenizer)
+        with torch.inference_mode():
+            output = model.generate(
+                **inputs, max_new_tokens=max_length, pad_token_id=tokenizer.pad_token_id,
+                stopping_criteria=StoppingCriteriaList([JSONObjectStop(width)]), **sampling
+            )
+        texts = tokenizer.batch_decode(output[:, width:], skip_special_tokens=True)
+        return [_json_prefix(text) or text for text in texts]
+
+    return generate
+
+
+# In-process CPU backend: a worker thread gathers concurrent requests into batches so one forward pass serves several
+# prompts. generator(prompts, max_length, temperature, stop) -> texts may be injected (for tests or other runtimes);
+# by default LOCAL_MODEL is loaded on the first request.
+class LocalBackend:
+    name = "local"
+
+    def __init__(self, generator=None, batch_size=LOCAL_BATCH_SIZE, batch_wait=LOCAL_BATCH_WAIT):
+        self.generator = generator
+        self.model = LOCAL_MODEL if generator is None else getattr(generator, "__qualname__", "custom")
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.batches = 0
+        self.prompts = 0
+        self._queue = queue.Queue()
+        self._load_lock = threading.Lock()
+        self._worker = threading.Thread(target=self._run, name="local-inference", daemon=True)
+        self._worker.start()
+
+    def _generator(self):
+        with self._load_lock:
+            if self.generator is None:
+                self.generator = load_generator()
+            return self.generator
+
+    # Takes the next request, then any others queued within batch_wait, up to batch_size
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.batch_wait
+        while batch[-1] is not None and len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            closing = batch[-1] is None
+            requests = [request for request in batch if request is not None]
+            # Prompts only share a forward pass when their generation settings match
+            groups = {}
+            for prompt, max_length, temperature, stop, future in requests:
+                groups.setdefault((max_length, temperature, stop), []).append((prompt, future))
+            for (max_length, temperature, stop), group in groups.items():
+                try:
+                    texts = self._generator()([prompt for prompt, _ in group], max_length, temperature, stop)
+                except Exception as e:
+                    for _, future in group:
+                        future.set_exception(e)
+                    continue
+                self.batches += 1
+                self.prompts += len(group)
+                for (_, future), text in zip(group, texts):
+                    future.set_result(text)
+            if closing:
+                return
+
+    def generate(self, prompt, max_length, temperature, report, stop=()):
+        future = Future()
+        report("sent")
+        self._queue.put((prompt, max_length, temperature, tuple(stop), future))
+        text = future.result()
+        report("first_byte")
+        report("parsed")
+        return text
+
+    # Batched generation finishes all prompts together, so the text arrives as a single chunk
+    def stream(self, prompt, max_length, temperature, report, stop=()):
+        yield self.generate(prompt, max_length, temperature, report, stop)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "prompts": self.prompts,
+            "avg_batch": round(self.prompts / self.batches, 2) if self.batches else 0.0
+        }
+
+    def close(self):
+        self._queue.put(None)
+        self._worker.join()
@@ -0,0 +1,154 @@
+import json
+import re
+from concurrent.futures import as_completed
+
+from analyzers import build_prompt
+from inference import get_engine
+from structured_output import StructuredOutputError, generation_budget, parse_structured_output
+
+# Notes longer than this many characters (roughly 1,000 tokens) are split and analyzed chunk by chunk
+CHUNK_MAX_CHARS = 4000
+
+# A line that opens a section: "HOSPITAL COURSE:", "Medications:", "Day 3 -"
+SECTION_RE = re.compile(r"(?m)^(?=[ \t]*(?:[A-Z][A-Za-z0-9 /&()'-]{1,40}:|Day \d+\b|\d{4}-\d{2}-\d{2}\b))")
+PARAGRAPH_RE = re.compile(r"\n[ \t]*\n")
+SENTENCE_RE = re.compile(r"(?<=[.!?;])\s+")
+
+# Severity ladders for fields merged by taking the most severe value, most severe first
+SEVERITY_FIELDS = {
+    "urgency": ["Critical", "High", "Medium", "Low"],
+    "risk_level": ["High", "Medium", "Low"],
+    "adherence_risk": ["High", "Medium", "Low"]
+}
+
+# Field whose most severe chunk supplies the free-text fields (action, recommended_response, ...) per analysis kind
+LEAD_FIELD = {"triage": "urgency", "mental_health": "risk_level", "medication": "adherence_risk"}
+
+
+# Function to report whether a note is long enough to need chunked analysis
+def needs_chunking(text, max_chars=CHUNK_MAX_CHARS):
+    return len(text or "") > max_chars
+
+
+def _pack(pieces, max_chars, joiner):
+    chunks, current = [], ""
+    for piece in pieces:
+        piece = piece.strip()
+        if not piece:
+            continue
+        if current and len(current) + len(joiner) + len(piece) > max_chars:
+            chunks.append(current)
+            current = piece
+        else:
+            current = f"{current}{joiner}{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _split_long(piece, max_chars):
+    if len(piece) <= max_chars:
+        return [piece]
+    sentences = []
+    for sentence in SENTENCE_RE.split(piece):
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            sentences.append(sentence[:cut])
+            sentence = sentence[cut:].lstrip()
+        sentences.append(sentence)
+    return _pack(sentences, max_chars, " ")
+
+
+# Function to split a note into chunks of at most max_chars, breaking on section headers and blank lines first,
+# then on sentence boundaries, and only mid-sentence (at a space) when a single sentence is too long
+def split_note(text, max_chars=CHUNK_MAX_CHARS):
+    text = (text or "").strip()
+    if len(text) <= max_chars:
+        return [text] if text else []
+    pieces = []
+    for section in SECTION_RE.split(text):
+        for paragraph in PARAGRAPH_RE.split(section):
+            pieces.extend(_split_long(paragraph.strip(), max_chars))
+    return _pack(pieces, max_chars, "\n\n")
+
+
+def _rank(field, value):
+    ladder = SEVERITY_FIELDS[field]
+    return ladder.index(value) if value in ladder else len(ladder)
+
+
+def _item_key(item):
+    if isinstance(item, dict):
+        name = item.get("name")
+        return ("name", str(name).strip().lower()) if name else ("dict", json.dumps(item, sort_keys=True, default=str))
+    return ("value", str(item).strip().lower())
+
+
+# Function to merge per-chunk structured outputs of one analysis kind:
+# - severity fields (urgency, risk_level, adherence_risk) take the most severe value, triage_category the lowest number
+# - lists are unioned in first-seen order (case-insensitive; medications de-duplicated by name)
+# - dicts (vital_signs, patient_demographics, follow_up) are merged key by key, later chunks winning, so the most
+#   recent reading in a chronological note is kept
+# - other scalars come from the most severe chunk, falling back to the first chunk that has them
+def merge_outputs(kind, outputs):
+    outputs = [output for output in outputs if isinstance(output, dict)]
+    if not outputs:
+        return {}
+    lead_field = LEAD_FIELD.get(kind)
+    by_severity = sorted(outputs, key=lambda output: _rank(lead_field, output.get(lead_field))) if lead_field else outputs
+
+    merged = {}
+    for key in dict.fromkeys(key for output in outputs for key in output):
+        values = [output[key] for output in outputs if output.get(key) not in (None, "", [], {})]
+        if not values:
+            merged[key] = outputs[0].get(key)
+        elif key in SEVERITY_FIELDS:
+            merged[key] = min(values, key=lambda value: _rank(key, value))
+        elif key == "triage_category":
+            numeric = [value for value in values if str(value).strip().isdigit()]
+            merged[key] = str(min(int(value) for value in numeric)) if numeric else values[0]
+        elif all(isinstance(value, list) for value in values):
+            seen, union = set(), []
+            for value in values:
+                for item in value:
+                    if _item_key(item) not in seen:
+                        seen.add(_item_key(item))
+                        union.append(item)
+            merged[key] = union
+        elif all(isinstance(value, dict) for value in values):
+            combined = {}
+            for value in values:
+                combined.update(value)
+            merged[key] = combined
+        else:
+            merged[key] = next(output[key] for output in by_severity if output.get(key) not in (None, "", [], {}))
+    return merged
+
+
+# Function to analyze a long note: every chunk is submitted to the inference engine at once, so latency follows
+# the slowest chunk rather than the sum. Returns (merged_output, {"chunks", "failed"}); raises StructuredOutputError
+# when no chunk produced a usable output. on_chunk(done, total) is called from the calling thread as chunks finish.
+# Each chunk gets the kind's generation budget unless max_length is given, and the kind's scheduler class unless
+# priority is given.
+def analyze_long_note(kind, text, max_length=None, on_chunk=None, priority=None):
+    chunks = split_note(text)
+    engine = get_engine()
+    max_length = max_length or generation_budget(kind)
+    futures = [
+        engine.submit(build_prompt(kind, chunk), max_length=max_length, priority=priority) for chunk in chunks
+    ]
+    order = {future: index for index, future in enumerate(futures)}
+    outputs = [None] * len(chunks)
+    errors = []
+    for done, future in enumerate(as_completed(futures), start=1):
+        try:
+            outputs[order[future]] = parse_structured_output(future.result(), kind)
+        except Exception as e:
+            errors.append(e)
+        if on_chunk is not None:
+            on_chunk(done, len(chunks))
+    parsed = [output for output in outputs if output is not None]
+    if not parsed:
+        raise errors[-1] if errors else StructuredOutputError("Note is empty")
+    return merge_outputs(kind, parsed), {"chunks": len(chunks), "failed": len(errors)}
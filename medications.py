@@ -0,0 +1,402 @@
+import re
+from datetime import datetime, timedelta
+
+# Per-drug defaults, used for fields a prescription (or a model response) leaves out. days_supply is the supply a
+# fill covers (None for as-needed drugs, which get no refill date); course drugs are fixed courses with no refill.
+DRUG_PROFILES = {
+    "sumatriptan": {
+        "name": "Sumatriptan", "aliases": ["imitrex"],
+        "frequency": "as needed", "timing": "at onset of migraine", "duration": "as needed for migraines",
+        "adherence_risk": "Low", "days_supply": None,
+        "recommendation": "Keep medication accessible + migraine trigger tracking app",
+        "action": "Patient education on migraine triggers scheduled + medication access reminder set"
+    },
+    "amoxicillin": {
+        "name": "Amoxicillin", "aliases": ["amoxil"],
+        "frequency": "three times daily", "timing": "with or without food", "duration": "7 days",
+        "adherence_risk": "Medium", "days_supply": 7, "course": True,
+        "recommendation": "Finish the full course even if symptoms improve + dose reminders",
+        "action": "Dose reminders set for the full antibiotic course"
+    },
+    "azithromycin": {
+        "name": "Azithromycin", "aliases": ["zithromax", "z-pak", "zpak"],
+        "frequency": "once daily", "timing": "at the same time each day", "duration": "5 days",
+        "adherence_risk": "Low", "days_supply": 5, "course": True,
+        "recommendation": "Finish the full course even if symptoms improve",
+        "action": "Daily dose reminder set for the antibiotic course"
+    },
+    "ciprofloxacin": {
+        "name": "Ciprofloxacin", "aliases": ["cipro"],
+        "frequency": "twice daily", "timing": "2 hours apart from antacids or dairy", "duration": "7 days",
+        "adherence_risk": "Medium", "days_supply": 7, "course": True,
+        "recommendation": "Separate doses from antacids and dairy + finish the full course",
+        "action": "Dose reminders set for the antibiotic course with dairy/antacid spacing advice"
+    },
+    "prednisone": {
+        "name": "Prednisone", "aliases": ["deltasone"],
+        "frequency": "once daily", "timing": "in the morning with food", "duration": "5 days",
+        "adherence_risk": "Low", "days_supply": 5, "course": True,
+        "recommendation": "Take with breakfast + do not stop a long course abruptly",
+        "action": "Morning dose reminder set for the steroid course"
+    },
+    "metformin": {
+        "name": "Metformin", "aliases": ["glucophage"],
+        "frequency": "twice daily", "timing": "with meals", "duration": "ongoing",
+        "adherence_risk": "Medium", "days_supply": 30,
+        "recommendation": "Take with meals to limit stomach upset + glucose logging app",
+        "action": "Mealtime dose reminders and refill reminder set"
+    },
+    "insulin glargine": {
+        "name": "Insulin glargine", "aliases": ["lantus", "basaglar", "toujeo"],
+        "frequency": "once daily", "timing": "at bedtime", "duration": "ongoing",
+        "adherence_risk": "Medium", "days_supply": 30,
+        "recommendation": "Inject at the same time daily + glucose logging app",
+        "action": "Nightly injection reminder and refill reminder set"
+    },
+    "lisinopril": {
+        "name": "Lisinopril", "aliases": ["zestril", "prinivil"],
+        "frequency": "once daily", "timing": "in the morning", "duration": "ongoing",
+        "adherence_risk": "Medium", "days_supply": 30,
+        "recommendation": "Daily pill organizer + home blood pressure log",
+        "action": "Daily dose reminder and refill reminder set"
+    },
+    "losartan": {
+        "name": "Losartan", "aliases": ["cozaar"],
+        "frequency": "once daily", "timing": "in the morning", "duration": "ongoing",
+        "adherence_risk": "Medium", "days_supply": 30,
+        "recommendation": "Daily pill organizer + home blood pressure log",
+        "action": "Daily dose reminder and refill reminder set"
+    },
+    "amlodipine": {
+        "name": "Amlodipine", "aliases": ["norvasc"],
+        "frequency": "once daily", "timing": "at the same time each day", "duration": "ongoing",
+        "adherence_risk": "Medium", "days_supply": 30,
+        "recommendation": "Daily pill organizer + home blood pressure log",
+        "action": "Daily dose reminder and refill reminder set"
+    },
+    "metoprolol": {
+        "name": "Metoprolol", "aliases": ["lopressor", "toprol", "toprol-xl"],
+        "frequency": "twice daily", "timing": "with meals", "duration": "ongoing",
+        "adherence_risk": "Medium", "days_supply": 30,
+        "recommendation": "Do not stop suddenly + home heart rate and blood pressure log",
+        "action": "Twice-daily dose reminders and refill reminder set"
+    },
+    "hydrochlorothiazide": {
+        "name": "Hydrochlorothiazide", "aliases": ["hctz", "microzide"],
+        "frequency": "once daily", "timing": "in the morning", "duration": "ongoing",
+        "adherence_risk": "Low", "days_supply": 30,
+        "recommendation": "Take in the morning to avoid night-time urination",
+        "action": "Morning dose reminder and refill reminder set"
+    },
+    "atorvastatin": {
+        "name": "Atorvastatin", "aliases": ["lipitor"],
+        "frequency": "once daily", "timing": "at bedtime", "duration": "ongoing",
+        "adherence_risk": "Medium", "days_supply": 30,
+        "recommendation": "Pair the dose with a nightly routine + report muscle pain",
+        "action": "Nightly dose reminder and refill reminder set"
+    },
+    "simvastatin": {
+        "name": "Simvastatin", "aliases": ["zocor"],
+        "frequency": "once daily", "timing": "at bedtime", "duration": "ongoing",
+        "adherence_risk": "Medium", "days_supply": 30,
+        "recommendation": "Pair the dose with a nightly routine + report muscle pain",
+        "action": "Nightly dose reminder and refill reminder set"
+    },
+    "warfarin": {
+        "name": "Warfarin", "aliases": ["coumadin", "jantoven"],
+        "frequency": "once daily", "timing": "in the evening", "duration": "ongoing",
+        "adherence_risk": "High", "days_supply": 30,
+        "recommendation": "Same time every evening + keep INR checks and a consistent vitamin K intake",
+        "action": "Evening dose reminder, INR check reminder and refill reminder set"
+    },
+    "levothyroxine": {
+        "name": "Levothyroxine", "aliases": ["synthroid", "levoxyl"],
+        "frequency": "once daily", "timing": "in the morning on an empty stomach", "duration": "ongoing",
+        "adherence_risk": "Low", "days_supply": 30,
+        "recommendation": "Take 30-60 minutes before breakfast, apart from calcium or iron",
+        "action": "Morning dose reminder and refill reminder set"
+    },
+    "omeprazole": {
+        "name": "Omeprazole", "aliases": ["prilosec"],
+        "frequency": "once daily", "timing": "before breakfast", "duration": "8 weeks",
+        "adherence_risk": "Low", "days_supply": 30,
+        "recommendation": "Take 30 minutes before breakfast",
+        "action": "Morning dose reminder and refill reminder set"
+    },
+    "sertraline": {
+        "name": "Sertraline", "aliases": ["zoloft"],
+        "frequency": "once daily", "timing": "in the morning", "duration": "ongoing",
+        "adherence_risk": "Medium", "days_supply": 30,
+        "recommendation": "Keep taking daily; full effect takes 4-6 weeks + mood check-ins",
+        "action": "Daily dose reminder, 4-week follow-up and refill reminder set"
+    },
+    "fluoxetine": {
+        "name": "Fluoxetine", "aliases": ["prozac"],
+        "frequency": "once daily", "timing": "in the morning", "duration": "ongoing",
+        "adherence_risk": "Medium", "days_supply": 30,
+        "recommendation": "Keep taking daily; full effect takes 4-6 weeks + mood check-ins",
+        "action": "Daily dose reminder, 4-week follow-up and refill reminder set"
+    },
+    "gabapentin": {
+        "name": "Gabapentin", "aliases": ["neurontin"],
+        "frequency": "three times daily", "timing": "spaced evenly through the day", "duration": "ongoing",
+        "adherence_risk": "Medium", "days_supply": 30,
+        "recommendation": "Space doses evenly + avoid alcohol",
+        "action": "Dose reminders and refill reminder set"
+    },
+    "montelukast": {
+        "name": "Montelukast", "aliases": ["singulair"],
+        "frequency": "once daily", "timing": "in the evening", "duration": "ongoing",
+        "adherence_risk": "Low", "days_supply": 30,
+        "recommendation": "Take every evening even without symptoms + report mood changes",
+        "action": "Evening dose reminder and refill reminder set"
+    },
+    "cetirizine": {
+        "name": "Cetirizine", "aliases": ["zyrtec"],
+        "frequency": "once daily", "timing": "at bedtime", "duration": "during allergy season",
+        "adherence_risk": "Low", "days_supply": 30,
+        "recommendation": "Take at night if it causes drowsiness",
+        "action": "Nightly dose reminder set"
+    },
+    "albuterol": {
+        "name": "Albuterol", "aliases": ["ventolin", "proair", "salbutamol"],
+        "frequency": "as needed", "timing": "for wheezing or shortness of breath", "duration": "as needed for asthma",
+        "adherence_risk": "Low", "days_supply": None,
+        "recommendation": "Carry the inhaler at all times + track how often it is needed",
+        "action": "Inhaler technique education scheduled + rescue inhaler use tracking enabled"
+    },
+    "ibuprofen": {
+        "name": "Ibuprofen", "aliases": ["advil", "motrin"],
+        "frequency": "as needed", "timing": "with food", "duration": "as needed for pain",
+        "adherence_risk": "Low", "days_supply": None,
+        "recommendation": "Take with food + do not exceed the daily maximum",
+        "action": "Patient education on safe dosing limits sent"
+    },
+    "acetaminophen": {
+        "name": "Acetaminophen", "aliases": ["tylenol", "paracetamol"],
+        "frequency": "as needed", "timing": "for pain or fever", "duration": "as needed for pain",
+        "adherence_risk": "Low", "days_supply": None,
+        "recommendation": "Do not exceed 3 g a day + check combination products for acetaminophen",
+        "action": "Patient education on safe dosing limits sent"
+    }
+}
+
+# Strength or dose-count, e.g. "50mg", "0.5 mg", "10 units", "2 puffs"
+DOSE_RE = re.compile(
+    r"\b(\d+(?:\.\d+)?)\s*(mg|mcg|µg|g|ml|units?|iu|puffs?|tabs?|tablets?|caps?|capsules?|drops?)\b", re.IGNORECASE
+)
+STRENGTH_UNITS = ("mg", "mcg", "µg", "g", "ml", "unit", "units", "iu")
+COMPACT_UNITS = ("mg", "mcg", "µg", "g", "ml")
+
+# Route abbreviations and phrases -> route
+ROUTES = [
+    (r"po|p\.o\.|by mouth|orally|oral", "by mouth"),
+    (r"sl|sublingual(?:ly)?", "sublingual"),
+    (r"iv|intravenous(?:ly)?", "intravenous"),
+    (r"im|intramuscular(?:ly)?", "intramuscular"),
+    (r"sc|subq|sq|subcut|subcutaneous(?:ly)?", "subcutaneous"),
+    (r"inh|inhaled|via inhaler", "inhaled"),
+    (r"top|topical(?:ly)?", "topical"),
+    (r"pr|rectal(?:ly)?", "rectal")
+]
+
+# Frequency abbreviations and phrases -> (frequency, timing implied by the abbreviation)
+FREQUENCIES = [
+    (r"q\.?i\.?d\.?|four times (?:a day|daily)", "four times daily", None),
+    (r"t\.?i\.?d\.?|three times (?:a day|daily)", "three times daily", None),
+    (r"b\.?i\.?d\.?|twice (?:a day|daily)|two times (?:a day|daily)", "twice daily", None),
+    (r"q\.?h\.?s\.?|at bedtime|nightly|every night", "at bedtime", None),
+    (r"q\.?am|every morning", "every morning", None),
+    (r"q\.?pm|every evening", "once daily", "in the evening"),
+    (r"q\.?d\.?|o\.?d\.?|once (?:a day|daily)|daily|every day", "once daily", None),
+    (r"once (?:a )?week(?:ly)?|weekly|q\.?wk", "once weekly", None)
+]
+INTERVAL_RE = re.compile(r"\b(?:q\s?(\d{1,2})\s?h(?:rs?|ours?)?|every (\d{1,2}) hours?)\b", re.IGNORECASE)
+PRN_RE = re.compile(
+    r"\b(?:p\.?r\.?n\.?|as needed)(?:\s+(?:for\s+)?(pain|fever|headaches?|migraines?|wheezing|shortness of breath|sob|"
+    r"nausea|sleep|anxiety|itching|allergies))?\b",
+    re.IGNORECASE
+)
+
+# Administration timing phrases and abbreviations -> timing
+TIMINGS = [
+    (r"with (?:meals|food)|p\.?c\.?", "with meals"),
+    (r"before (?:meals|food)|a\.?c\.?", "before meals"),
+    (r"before breakfast", "before breakfast"),
+    (r"(?:on an )?empty stomach", "on an empty stomach"),
+    (r"in the morning", "in the morning"),
+    (r"in the evening", "in the evening"),
+    (r"at night", "at bedtime")
+]
+
+# Course length, e.g. "x 7 days", "for 2 weeks", "x10d"
+DURATION_RE = re.compile(r"(?:\bx|×|\bfor)\s*(\d{1,3})\s*(d|days?|wks?|weeks?|mos?|months?)\b", re.IGNORECASE)
+DURATION_DAYS = {"d": 1, "day": 1, "wk": 7, "week": 7, "mo": 30, "month": 30}
+
+# Dispensed quantity, e.g. "#30", "disp: 60", "qty 90"
+QUANTITY_RE = re.compile(r"(?:#|\bdisp(?:ense)?:?\s*|\bqty:?\s*)(\d{1,4})\b", re.IGNORECASE)
+
+# Doses per day for frequencies with a fixed schedule
+DOSES_PER_DAY = {
+    "once daily": 1, "every morning": 1, "at bedtime": 1, "twice daily": 2, "three times daily": 3,
+    "four times daily": 4
+}
+
+# Words that carry no information beyond the parsed sig; anything else left over is free text for the model
+SIG_FILLER = {
+    "prescription", "rx", "sig", "take", "takes", "taking", "tab", "tabs", "tablet", "tablets", "cap", "caps",
+    "capsule", "capsules", "one", "two", "three", "by", "mouth", "of", "and", "the", "a", "an", "per", "day", "days",
+    "refill", "refills", "dispense", "disp", "qty", "then", "for", "with", "at", "in", "every", "po", "x", "hours",
+    "medication", "dose", "start", "continue", "use", "inhale", "inject", "apply", "puff", "puffs", "patient", "pt"
+}
+
+# Default supply (days) assumed for a drug without a profile or a stated duration or quantity
+DEFAULT_DAYS_SUPPLY = 30
+
+_DRUG_INDEX = {}
+for _key, _profile in DRUG_PROFILES.items():
+    for _name in [_key] + _profile.get("aliases", []):
+        _DRUG_INDEX[_name] = _key
+# Longest drug name in words, so lookups try "insulin glargine" before "insulin"
+_MAX_NAME_WORDS = max(len(name.split()) for name in _DRUG_INDEX)
+
+_WORD_RE = re.compile(r"[a-zµ][a-zµ\-]*", re.IGNORECASE)
+_ROUTE_RES = [(re.compile(rf"\b(?:{pattern})(?!\w)", re.IGNORECASE), route) for pattern, route in ROUTES]
+_FREQUENCY_RES = [
+    (re.compile(rf"\b(?:{pattern})(?!\w)", re.IGNORECASE), frequency, timing) for pattern, frequency, timing in FREQUENCIES
+]
+_TIMING_RES = [(re.compile(rf"\b(?:{pattern})(?!\w)", re.IGNORECASE), timing) for pattern, timing in TIMINGS]
+
+
+# Function to look up a drug profile by generic or brand name (case-insensitive); None when unknown
+def drug_profile(name):
+    key = _DRUG_INDEX.get(" ".join(str(name or "").lower().split()))
+    return DRUG_PROFILES[key] if key else None
+
+
+# Function to find the first known drug name in a text; returns (profile_key, (start, end)) or (None, None)
+def find_drug(text):
+    words = list(_WORD_RE.finditer(text))
+    for i in range(len(words)):
+        for size in range(min(_MAX_NAME_WORDS, len(words) - i), 0, -1):
+            name = " ".join(word.group().lower() for word in words[i:i + size])
+            if name in _DRUG_INDEX:
+                return _DRUG_INDEX[name], (words[i].start(), words[i + size - 1].end())
+    return None, None
+
+
+def _first(patterns, text, spans):
+    for pattern, *values in patterns:
+        match = pattern.search(text)
+        if match:
+            spans.append(match.span())
+            return values
+    return None
+
+
+# Function to parse a free-text prescription with the local drug lexicon and sig rules. Returns {"output", "drug",
+# "parsed", "residual", "local"}: output is a full medication plan (parsed fields, then the drug's profile defaults),
+# parsed lists the fields read from the text, residual is any free text the rules could not account for (a patient
+# concern, say), and local is True when the drug is known and nothing is left over, so no model call is needed.
+def parse_prescription(text, today=None):
+    text = text or ""
+    today = today or datetime.now()
+    spans, parsed = [], {}
+
+    drug, drug_span = find_drug(text)
+    if drug_span:
+        spans.append(drug_span)
+    profile = DRUG_PROFILES.get(drug, {})
+
+    doses = list(DOSE_RE.finditer(text))
+    strength = next((m for m in doses if m.group(2).lower() in STRENGTH_UNITS), doses[0] if doses else None)
+    if strength:
+        spans.extend(m.span() for m in doses)
+        unit = strength.group(2).lower()
+        parsed["dosage"] = f"{strength.group(1)}{unit}" if unit in COMPACT_UNITS else f"{strength.group(1)} {unit}"
+
+    route = _first(_ROUTE_RES, text, spans)
+    if route:
+        parsed["route"] = route[0]
+
+    prn = PRN_RE.search(text)
+    interval = INTERVAL_RE.search(text)
+    if interval:
+        spans.append(interval.span())
+    if prn:
+        spans.append(prn.span())
+        parsed["frequency"] = "as needed"
+        if interval:
+            parsed["timing"] = f"no more often than every {interval.group(1) or interval.group(2)} hours"
+        elif prn.group(1):
+            parsed["timing"] = f"for {prn.group(1).lower()}"
+    elif interval:
+        hours = int(interval.group(1) or interval.group(2))
+        parsed["frequency"] = {24: "once daily", 12: "twice daily"}.get(hours, f"every {hours} hours")
+    frequency = _first(_FREQUENCY_RES, text, spans)
+    if frequency and "frequency" not in parsed:
+        parsed["frequency"] = frequency[0]
+        if frequency[1]:
+            parsed["timing"] = frequency[1]
+
+    timing = _first(_TIMING_RES, text, spans)
+    if timing and "timing" not in parsed:
+        parsed["timing"] = timing[0]
+
+    duration_days = None
+    duration = DURATION_RE.search(text)
+    if duration:
+        spans.append(duration.span())
+        count, unit = int(duration.group(1)), duration.group(2).lower().rstrip("s")
+        duration_days = count * DURATION_DAYS.get(unit, 1)
+        label = {"d": "day", "wk": "week", "mo": "month"}.get(unit, unit)
+        parsed["duration"] = f"{count} {label}{'s' if count != 1 else ''}"
+
+    quantity = QUANTITY_RE.search(text)
+    if quantity:
+        spans.append(quantity.span())
+
+    output = {
+        "medication": profile.get("name", "Not specified"),
+        "dosage": parsed.get("dosage", "Not specified"),
+        "frequency": parsed.get("frequency") or profile.get("frequency", "Not specified"),
+        "timing": parsed.get("timing") or profile.get("timing", "Not specified"),
+        "duration": parsed.get("duration") or profile.get("duration", "Not specified"),
+        "patient_concern": "None reported",
+        "adherence_risk": profile.get("adherence_risk", "Unknown"),
+        "recommendation": profile.get("recommendation", "Not specified"),
+        "refill_date": "N/A",
+        "action": profile.get("action", "No action specified")
+    }
+    if "route" in parsed:
+        output["route"] = parsed["route"]
+
+    if output["frequency"] == "as needed":
+        output["refill_date"] = "N/A - as needed"
+    elif profile.get("course") and (duration_days or profile.get("days_supply")):
+        course_end = today + timedelta(days=duration_days or profile["days_supply"])
+        output["refill_date"] = f"N/A - course ends {course_end.strftime('%Y-%m-%d')}"
+    elif drug or parsed:
+        doses_per_day = DOSES_PER_DAY.get(output["frequency"])
+        if duration_days:
+            days_supply = duration_days
+        elif quantity and doses_per_day:
+            days_supply = int(quantity.group(1)) // doses_per_day
+        else:
+            days_supply = profile.get("days_supply") or DEFAULT_DAYS_SUPPLY
+        output["refill_date"] = (today + timedelta(days=days_supply)).strftime("%Y-%m-%d")
+
+    covered = [False] * len(text)
+    for start, end in spans:
+        covered[start:end] = [True] * (end - start)
+    residual = [
+        word.group() for word in _WORD_RE.finditer(text)
+        if not covered[word.start()] and word.group().lower() not in SIG_FILLER
+    ]
+    return {
+        "output": output,
+        "drug": drug,
+        "parsed": sorted(parsed),
+        "residual": " ".join(residual),
+        "local": drug is not None and not residual
+    }
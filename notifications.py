@@ -0,0 +1,265 @@
+import os
+import queue
+import smtplib
+import sys
+import threading
+import time
+import uuid
+from email.mime.text import MIMEText
+
+# SMTP configuration
+SMTP_SERVER = "smtp.gmail.com"
+SMTP_PORT = 587
+SMTP_USE_TLS = True
+SENDER_EMAIL = "amennahali8@gmail.com"
+
+# The SMTP password is never kept in source: it is read from this environment variable, or from the same key in
+# Streamlit secrets (.streamlit/secrets.toml) when running in the dashboard
+SENDER_PASSWORD_KEY = "SENDER_PASSWORD"
+
+# Twilio configuration
+TWILIO_ACCOUNT_SID = ""
+TWILIO_AUTH_TOKEN = ""
+TWILIO_NUMBER = "+12183001925"
+
+# Dispatcher settings: authenticated SMTP connections kept open, background workers,
+# and how long (seconds) a pooled connection may sit idle before it is checked with NOOP
+SMTP_POOL_SIZE = 2
+DISPATCH_WORKERS = 2
+SMTP_IDLE_CHECK = 30
+
+# Finished notification jobs stay queryable for NOTIFICATION_JOB_TTL seconds, and at most NOTIFICATION_JOB_HISTORY
+# of them are kept at once (oldest evicted first); queued and sending jobs are never evicted
+NOTIFICATION_JOB_TTL = 3600
+NOTIFICATION_JOB_HISTORY = 1000
+
+
+# Raised when a notification channel is missing required configuration
+class NotificationConfigError(Exception):
+    pass
+
+
+# Function to look up the SMTP password from the environment, then Streamlit secrets. Streamlit is only consulted when
+# the dashboard has already imported it, so headless workers never load it.
+def smtp_password():
+    password = os.environ.get(SENDER_PASSWORD_KEY)
+    streamlit = sys.modules.get("streamlit")
+    if not password and streamlit is not None:
+        try:
+            password = streamlit.secrets.get(SENDER_PASSWORD_KEY)
+        except Exception:
+            # No secrets file
+            password = None
+    if not password:
+        raise NotificationConfigError(
+            f"SMTP password not configured: set the {SENDER_PASSWORD_KEY} environment variable "
+            f"or add {SENDER_PASSWORD_KEY} to .streamlit/secrets.toml"
+        )
+    return password
+
+
+# Pool of logged-in SMTP connections reused across messages. Without an explicit password, smtp_password() is looked up
+# when the first connection is made.
+class SMTPPool:
+    def __init__(self, host=SMTP_SERVER, port=SMTP_PORT, username=SENDER_EMAIL, password=None,
+                 size=SMTP_POOL_SIZE, use_tls=SMTP_USE_TLS):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _connect(self):
+        # Resolve the password before connecting, so a missing one fails with its own error rather than a login failure
+        password = (self.password or smtp_password()) if self.username else None
+        server = smtplib.SMTP(self.host, self.port, timeout=30)
+        if self.use_tls:
+            server.starttls()
+        if self.username:
+            server.login(self.username, password)
+        return server
+
+    def _acquire(self):
+        self._slots.acquire()
+        while True:
+            try:
+                server, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if time.monotonic() - last_used < SMTP_IDLE_CHECK:
+                return server
+            try:
+                if server.noop()[0] == 250:
+                    return server
+            except smtplib.SMTPException:
+                pass
+            self._close(server)
+        try:
+            return self._connect()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _release(self, server):
+        self._idle.put((server, time.monotonic()))
+        self._slots.release()
+
+    def _discard(self, server):
+        self._close(server)
+        self._slots.release()
+
+    def _close(self, server):
+        try:
+            server.quit()
+        except Exception:
+            pass
+
+    def send(self, sender, recipient, message):
+        # A pooled connection the server has since dropped is replaced once before giving up
+        for attempt in range(2):
+            server = self._acquire()
+            try:
+                server.sendmail(sender, recipient, message)
+            except smtplib.SMTPServerDisconnected:
+                self._discard(server)
+                if attempt:
+                    raise
+                continue
+            except Exception:
+                self._discard(server)
+                raise
+            self._release(server)
+            return
+
+    def close(self):
+        while True:
+            try:
+                server, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._close(server)
+
+
+# Function to build a Twilio REST client; twilio is imported on first use so importing this module stays cheap
+def twilio_client(account_sid, auth_token):
+    from twilio.rest import Client
+
+    return Client(account_sid, auth_token)
+
+
+# SMS sender that builds its Twilio client once and reuses it
+class SMSSender:
+    def __init__(self, account_sid=TWILIO_ACCOUNT_SID, auth_token=TWILIO_AUTH_TOKEN, from_number=TWILIO_NUMBER,
+                 client_factory=twilio_client):
+        self.account_sid = account_sid
+        self.auth_token = auth_token
+        self.from_number = from_number
+        self.client_factory = client_factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    def send(self, body, to):
+        with self._lock:
+            if self._client is None:
+                self._client = self.client_factory(self.account_sid, self.auth_token)
+        message = self._client.messages.create(body=body, from_=self.from_number, to=to)
+        return message.sid
+
+
+# Queue-backed dispatcher that sends email + SMS notifications on background workers
+class NotificationDispatcher:
+    def __init__(self, smtp_pool, sms_sender, workers=DISPATCH_WORKERS, sender_email=SENDER_EMAIL,
+                 job_ttl=NOTIFICATION_JOB_TTL, job_history=NOTIFICATION_JOB_HISTORY):
+        self.smtp_pool = smtp_pool
+        self.sms_sender = sms_sender
+        self.sender_email = sender_email
+        self.job_ttl = job_ttl
+        self.job_history = job_history
+        self._queue = queue.Queue()
+        self._jobs = {}
+        self._lock = threading.Lock()
+        for i in range(workers):
+            threading.Thread(target=self._work, name=f"notify-{i}", daemon=True).start()
+
+    def submit(self, email=None, phone=None, subject="", body="", sms_body=""):
+        job_id = uuid.uuid4().hex[:12]
+        job = {
+            "id": job_id,
+            "status": "queued",
+            "email": "pending" if email else "skipped",
+            "sms": "pending" if phone else "skipped",
+            "created_at": time.time(),
+            "finished_at": None
+        }
+        with self._lock:
+            self._prune()
+            self._jobs[job_id] = job
+        self._queue.put((job_id, email, phone, subject, body, sms_body))
+        return job_id
+
+    def job(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def pending(self):
+        return self._queue.qsize()
+
+    # Drops finished jobs past their TTL, then the oldest finished jobs beyond the history limit; call with the lock held
+    def _prune(self):
+        finished = [(job_id, job["finished_at"]) for job_id, job in self._jobs.items() if job["finished_at"] is not None]
+        cutoff = time.time() - self.job_ttl
+        expired = [job_id for job_id, finished_at in finished if finished_at < cutoff]
+        kept = len(finished) - len(expired)
+        if kept > self.job_history:
+            kept_ids = [job_id for job_id, finished_at in sorted(finished, key=lambda entry: entry[1])
+                        if finished_at >= cutoff]
+            expired += kept_ids[:kept - self.job_history]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def _update(self, job_id, **changes):
+        with self._lock:
+            self._jobs[job_id].update(changes)
+
+    def _work(self):
+        while True:
+            job_id, email, phone, subject, body, sms_body = self._queue.get()
+            self._update(job_id, status="sending")
+            if email:
+                msg = MIMEText(body)
+                msg["From"] = self.sender_email
+                msg["To"] = email
+                msg["Subject"] = subject
+                try:
+                    self.smtp_pool.send(self.sender_email, email, msg.as_string())
+                    self._update(job_id, email="sent")
+                except Exception as e:
+                    self._update(job_id, email=f"failed: {e}")
+            if phone:
+                try:
+                    sid = self.sms_sender.send(sms_body, phone)
+                    self._update(job_id, sms=f"sent ({sid})")
+                except Exception as e:
+                    self._update(job_id, sms=f"failed: {e}")
+            job = self.job(job_id)
+            failed = job["email"].startswith("failed") or job["sms"].startswith("failed")
+            self._update(job_id, status="failed" if failed else "done", finished_at=time.time())
+            with self._lock:
+                self._prune()
+            self._queue.task_done()
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+# Process-wide dispatcher shared by every Streamlit session
+def get_dispatcher():
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = NotificationDispatcher(SMTPPool(), SMSSender())
+        return _dispatcher
@@ -0,0 +1,315 @@
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from analyzers import fallback_output
+
+# Page geometry in points (US letter) and the layout the single-page renderer used
+PAGE_SIZE = (612.0, 792.0)
+LEFT_MARGIN = 50
+TOP_Y = 750
+BOTTOM_MARGIN = 50
+LINE_HEIGHT = 20
+FONT_SIZE = 12
+
+# Bulk export settings: worker processes, reports handed to a worker at a time, and how many
+# chunks may be rendered ahead of the writer (bounds memory regardless of pack size)
+BULK_WORKERS = os.cpu_count() or 2
+BULK_CHUNKSIZE = 8
+BULK_PREFETCH_CHUNKS = 4
+
+# Start method for render workers; spawn keeps them independent of the parent's threads
+BULK_MP_CONTEXT = "spawn"
+
+# Upper bound (bytes) on rendered PDFs kept in memory for repeat downloads
+PDF_CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+
+# Function to flatten a structured report into (font, text, space_after) lines in reading order
+def report_lines(output):
+    lines = [("Helvetica", "Structured Clinical Report", 30), ("Helvetica-Bold", "Patient Information", 20)]
+    for key, value in (output.get("patient_demographics") or {}).items():
+        lines.append(("Helvetica", f"{str(key).title()}: {value}", 20))
+    if "diagnosis" in output:
+        lines.append(("Helvetica", f"Diagnosis: {output['diagnosis']}", 20))
+
+    lines.append((None, "", 20))
+    lines.append(("Helvetica-Bold", "Clinical Findings", 20))
+    for key, value in (output.get("vital_signs") or {}).items():
+        lines.append(("Helvetica", f"{key}: {value}", 20))
+    if "medications" in output:
+        lines.append(("Helvetica", "Medications:", 20))
+        for med in output["medications"] or []:
+            if isinstance(med, dict):
+                med = " ".join(str(med[k]) for k in ("name", "dosage", "frequency") if med.get(k))
+            lines.append(("Helvetica", f"- {med}", 20))
+
+    lines.append((None, "", 20))
+    lines.append(("Helvetica-Bold", "Follow-up Plan", 20))
+    follow_up = output.get("follow_up") or {}
+    lines.append((
+        "Helvetica",
+        f"When: In {follow_up.get('timeframe', 'N/A')} with {follow_up.get('provider', 'Provider')}", 20
+    ))
+    if "action" in output:
+        lines.append(("Helvetica", f"Action: {output['action']}", 20))
+    return lines
+
+
+# Function to lay a report out into pages of (font, x, y, text) draw operations, wrapping long
+# lines to the page width and starting a new page whenever the next line would cross the bottom margin
+def layout_pages(output):
+    from reportlab.lib.utils import simpleSplit
+
+    width = PAGE_SIZE[0] - 2 * LEFT_MARGIN - 10
+    pages, page, y = [], [], TOP_Y
+    for font, text, space_after in report_lines(output):
+        if font is None:
+            y -= space_after
+            continue
+        wrapped = simpleSplit(text, font, FONT_SIZE, width) or [""]
+        for i, segment in enumerate(wrapped):
+            if y < BOTTOM_MARGIN:
+                pages.append(page)
+                page, y = [], TOP_Y
+            page.append((font, LEFT_MARGIN + (10 if i else 0), y, segment))
+            y -= space_after if i == len(wrapped) - 1 else LINE_HEIGHT
+    pages.append(page)
+    return pages
+
+
+# Function to draw laid-out pages onto a canvas, one showPage per page, with a page footer
+def draw_pages(c, pages):
+    for number, page in enumerate(pages, start=1):
+        for font, x, y, text in page:
+            c.setFont(font, FONT_SIZE)
+            c.drawString(x, y, text)
+        if len(pages) > 1:
+            c.setFont("Helvetica", 9)
+            c.drawRightString(PAGE_SIZE[0] - LEFT_MARGIN, BOTTOM_MARGIN / 2, f"Page {number} of {len(pages)}")
+        c.showPage()
+
+
+# Function to render one structured report to PDF bytes
+def render_report_pdf(output):
+    return _render_pdf(output)[0]
+
+
+def _render_pdf(output):
+    from reportlab.pdfgen import canvas
+
+    pages = layout_pages(output)
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=PAGE_SIZE, pageCompression=1)
+    draw_pages(c, pages)
+    c.save()
+    return buffer.getvalue(), len(pages)
+
+
+# Content-addressed key for a structured report
+def report_key(output):
+    payload = json.dumps(output, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# LRU cache of rendered PDF bytes, bounded by their total size
+class PDFCache:
+    def __init__(self, max_bytes=PDF_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[key] = value
+            self._size += len(value)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "hit_rate": round(100 * self.hits / lookups, 1) if lookups else 0.0
+            }
+
+
+pdf_cache = PDFCache()
+
+
+# Function to return a report's PDF bytes, rendering it only the first time its content is seen in this process
+def cached_report_pdf(output):
+    key = report_key(output)
+    pdf_bytes = pdf_cache.get(key)
+    if pdf_bytes is None:
+        pdf_bytes = render_report_pdf(output)
+        pdf_cache.put(key, pdf_bytes)
+    return pdf_bytes
+
+
+# Ordered executor.map that keeps at most `window` results pending, so the caller can write each one out
+# and drop it before the rest of a large pack has been rendered
+def _bounded_map(executor, fn, items, window):
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def _render_chunk(chunk):
+    return [_render_pdf(output) for output in chunk]
+
+
+def _layout_chunk(chunk):
+    return [layout_pages(output) for output in chunk]
+
+
+def _chunks(reports, size):
+    chunk = []
+    for report in reports:
+        chunk.append(report)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# Function to render many structured reports into one merged PDF or a ZIP of per-report PDFs.
+# Reports may be any iterable (e.g. a generator over a JSONL file); rendering runs in a process pool
+# and results are written in input order as they complete. Returns {"reports", "pages", "elapsed", "pages_per_sec"}.
+def export_reports(reports, path, fmt="pdf", workers=BULK_WORKERS, chunksize=BULK_CHUNKSIZE):
+    if fmt not in ("pdf", "zip"):
+        raise ValueError(f"Unknown export format: {fmt}")
+    start_time = time.time()
+    chunks = _chunks(reports, chunksize)
+    window = max(1, workers) * BULK_PREFETCH_CHUNKS
+    count = pages = 0
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(BULK_MP_CONTEXT)) as executor:
+        if fmt == "zip":
+            with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+                for rendered in _bounded_map(executor, _render_chunk, chunks, window):
+                    for pdf_bytes, page_count in rendered:
+                        count += 1
+                        pages += page_count
+                        archive.writestr(f"report_{count:05d}.pdf", pdf_bytes)
+        else:
+            # Workers do the layout and text wrapping; drawing into the single output document stays in this
+            # process since a PDF's cross-reference table can't be assembled from independent writers
+            from reportlab.pdfgen import canvas
+
+            c = canvas.Canvas(path, pagesize=PAGE_SIZE, pageCompression=1)
+            for laid_out in _bounded_map(executor, _layout_chunk, chunks, window):
+                for report_pages in laid_out:
+                    count += 1
+                    pages += len(report_pages)
+                    draw_pages(c, report_pages)
+            c.save()
+
+    elapsed = time.time() - start_time
+    return {
+        "reports": count,
+        "pages": pages,
+        "elapsed": round(elapsed, 2),
+        "pages_per_sec": round(pages / elapsed, 1) if elapsed > 0 else 0.0
+    }
+
+
+# Function to stream structured reports from a JSONL file (one report object per line) or a JSON array
+def iter_reports(path):
+    with open(path, encoding="utf-8") as f:
+        if path.lower().endswith(".json"):
+            yield from json.load(f)
+            return
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+# Function to build synthetic reports for benchmarking; every third one has a medication list long enough to paginate
+def sample_reports(count):
+    for i in range(count):
+        report = fallback_output("report")
+        report["patient_demographics"]["id"] = f"BENCH-{i:05d}"
+        if i % 3 == 0:
+            report["medications"] = report["medications"] * 40
+        yield report
+
+
+def benchmark(count, workers):
+    with tempfile.TemporaryDirectory() as tmp:
+        for fmt in ("pdf", "zip"):
+            for n in sorted({1, workers}):
+                stats = export_reports(sample_reports(count), os.path.join(tmp, f"bench.{fmt}"), fmt=fmt, workers=n)
+                size_kb = os.path.getsize(os.path.join(tmp, f"bench.{fmt}")) / 1024
+                print(f"{fmt:>3} workers={n:<2} {stats['reports']} reports, {stats['pages']} pages in "
+                      f"{stats['elapsed']:.2f}s ({stats['pages_per_sec']} pages/sec, {size_kb:.0f} KiB)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export structured clinical reports as one merged PDF or a ZIP of PDFs.")
+    parser.add_argument("path", nargs="?", help="JSONL (one report per line) or JSON array of structured reports")
+    parser.add_argument("--day", help="export the reports recorded in the event store on this YYYY-MM-DD day instead")
+    parser.add_argument("-o", "--output", help="output path; .zip writes one PDF per report, anything else one merged PDF")
+    parser.add_argument("-w", "--workers", type=int, default=BULK_WORKERS, help="render worker processes")
+    parser.add_argument("--benchmark", type=int, metavar="N", help="render N synthetic reports and report pages/sec")
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        benchmark(args.benchmark, args.workers)
+        return 0
+    if not (args.path or args.day) or not args.output:
+        parser.error("a path or --day, and --output, are required unless --benchmark is given")
+
+    if args.day:
+        from event_store import get_event_store
+
+        reports = get_event_store().outputs("report", day=args.day)
+    else:
+        reports = iter_reports(args.path)
+    fmt = "zip" if args.output.lower().endswith(".zip") else "pdf"
+    stats = export_reports(reports, args.output, fmt=fmt, workers=args.workers)
+    print(f"Exported {stats['reports']} reports ({stats['pages']} pages) to {args.output} in {stats['elapsed']}s "
+          f"({stats['pages_per_sec']} pages/sec)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+import re
+
+from medications import parse_prescription
+
+# Pre-triage rules: (urgency, triage_category, label, pattern, confident). Patterns run against lower-cased
+# note text; a confident match is trusted on its own, the rest only nudge the provisional urgency. Administrative
+# rules (ADMINISTRATIVE_RULES) are only confident when the note holds nothing else.
+PRETRIAGE_RULES = [
+    ("Critical", 1, "chest pain radiating to arm/jaw",
+     r"chest (?:pain|pressure|tightness)\W+(?:\w+\W+){0,6}?(?:radiat\w*|spread\w*)\W+(?:\w+\W+){0,3}?(?:arm|jaw|neck|back)", True),
+    ("Critical", 1, "cardiac arrest / unresponsive",
+     r"\b(?:cardiac arrest|no pulse|pulseless|apneic|cpr)\b|\bunresponsive\b(?! to\b)"
+     r"|\bnot breathing\b(?! (?:well|normally|properly|easily|comfortably|right|as well|good|great)\b)", True),
+    ("Critical", 1, "stroke signs",
+     r"\b(?:facial droop|face droop\w*|slurred speech|one[- ]sided weakness|hemiparesis|aphasia|sudden (?:vision loss|numbness))\b", True),
+    ("Critical", 1, "anaphylaxis",
+     r"\b(?:anaphyla\w+|throat (?:closing|swelling)|tongue swelling|epipen)\b", True),
+    ("Critical", 1, "severe bleeding",
+     r"\b(?:uncontrolled|severe|massive|heavy) (?:bleeding|hemorrhage|haemorrhage)\b|\bvomiting blood\b|\bhematemesis\b", True),
+    ("Critical", 1, "active seizure",
+     r"\b(?:seizing|status epilepticus|seizure (?:ongoing|lasting|for \d+))\b", True),
+    ("Critical", 1, "severe respiratory distress",
+     r"\b(?:severe (?:shortness of breath|respiratory distress|dyspnea)|cyanosis|cyanotic|blue lips|unable to (?:breathe|speak))\b", True),
+    ("Critical", 1, "suicidal with plan or attempt",
+     r"\b(?:suicide attempt|overdos\w+|attempted suicide|plan to (?:kill|end))\b", True),
+    ("High", 2, "chest pain", r"\bchest (?:pain|pressure|tightness)\b", False),
+    ("High", 2, "shortness of breath", r"\b(?:shortness of breath|short of breath|dyspnea|difficulty breathing|sob)\b", False),
+    ("High", 2, "head injury with loss of consciousness",
+     r"\b(?:head (?:injury|trauma)|hit (?:his|her|their) head)\b.*\b(?:loss of consciousness|loc|passed out|blacked out)\b", True),
+    ("High", 2, "syncope", r"\b(?:syncope|fainted|passed out|collapsed)\b", False),
+    ("High", 2, "severe abdominal pain", r"\bsevere (?:abdominal|stomach|belly) pain\b", False),
+    ("High", 2, "high fever", r"\b(?:fever|temp\w*) (?:of )?(?:10[3-9]|4[0-2](?:\.\d)?)\b|\bhigh fever\b", False),
+    ("High", 2, "suicidal ideation", r"\b(?:suicidal|want to die|kill myself|end my life)\b", False),
+    ("Medium", 3, "fracture or deformity", r"\b(?:fracture\w*|broken (?:arm|leg|wrist|ankle)|deformity)\b", False),
+    ("Medium", 3, "dizziness", r"\b(?:dizz\w+|vertigo|lightheaded\w*)\b", False),
+    ("Medium", 3, "moderate pain", r"\b(?:moderate pain|pain (?:score|level) (?:of )?[4-6])\b", False),
+    ("Medium", 3, "vomiting", r"\b(?:vomit\w*|persistent nausea)\b", False),
+    ("Medium", 3, "laceration", r"\b(?:laceration|deep cut|needs stitches)\b", False),
+    ("Low", 4, "medication refill", r"\b(?:medication|prescription|rx) refill\b|\brefill (?:request|of)\b", True),
+    ("Low", 4, "minor cold symptoms", r"\b(?:runny nose|sore throat|common cold|nasal congestion|sneezing)\b", False),
+    ("Low", 5, "minor skin complaint", r"\b(?:mild rash|insect bite|minor (?:cut|scrape|abrasion)|sunburn)\b", False),
+    ("Low", 5, "administrative visit", r"\b(?:sick note|work note|forms? to (?:be )?(?:filled|signed)|vaccination record)\b", True)
+]
+
+# Provisional urgencies that stand on their own when confident; those notes are not sent to the model
+PRETRIAGE_SHORT_CIRCUIT = ("Low",)
+
+# Rules for administrative requests. They are confident only when nothing clinical is left once the request, any
+# prescription sig (parsed with medications.parse_prescription) and ADMINISTRATIVE_FILLER words are removed.
+ADMINISTRATIVE_RULES = ("medication refill", "administrative visit")
+ADMINISTRATIVE_FILLER = {
+    "request", "requests", "requested", "requesting", "need", "needs", "needed", "wants", "asks", "asking", "please",
+    "new", "copy", "updated", "for", "to", "from", "my", "his", "her", "their", "school", "work", "employer", "visit",
+    "appointment", "today", "called", "calling", "call", "phone", "pharmacy", "form", "forms", "note", "record", "is",
+    "due", "out", "ran", "running", "low", "on", "same", "usual", "as", "before"
+}
+
+URGENCY_RANK = {"Critical": 0, "High": 1, "Medium": 2, "Low": 3}
+
+# Words that negate a finding when they appear shortly before it ("denies chest pain", "no fever")
+NEGATION_RE = re.compile(r"\b(?:no|denies|denied|without|negative for|not)\b(?:\W+\w+){0,2}\W*$")
+
+# Text before a match that is searched for a negation; only its last clause counts, so "denies chest pain. refill
+# request" does not negate the refill
+NEGATION_WINDOW = 30
+CLAUSE_BREAK_RE = re.compile(r"[.;:!?,()]|\b(?:but|however|although|though)\b")
+
+_COMPILED_RULES = [
+    (urgency, category, label, re.compile(pattern), confident)
+    for urgency, category, label, pattern, confident in PRETRIAGE_RULES
+]
+
+_SPACE_RE = re.compile(r"\s+")
+
+
+# Function to lower-case a note and collapse whitespace so patterns can use single spaces
+def normalize_note(text):
+    return _SPACE_RE.sub(" ", (text or "").lower()).strip()
+
+
+def _negated(note, start):
+    clause = CLAUSE_BREAK_RE.split(note[max(0, start - NEGATION_WINDOW):start])[-1]
+    return bool(NEGATION_RE.search(clause))
+
+
+# Function to report whether a note is only an administrative request: its administrative phrases, any prescription
+# sig and filler words account for every word
+def administrative_only(note):
+    for _, _, label, pattern, _ in _COMPILED_RULES:
+        if label in ADMINISTRATIVE_RULES:
+            note = pattern.sub(" ", note)
+    residual = parse_prescription(note)["residual"].lower().split()
+    return all(word in ADMINISTRATIVE_FILLER for word in residual)
+
+
+# Function to assign a provisional urgency from the rule set. Returns {"urgency", "triage_category", "matched",
+# "confident"}; urgency is None when nothing matched. Confident means the most urgent matching rule is a red flag
+# (or a clear low-acuity request with nothing more urgent in the note).
+def pretriage(text):
+    note = normalize_note(text)
+    matches = []
+    for urgency, category, label, pattern, confident in _COMPILED_RULES:
+        match = pattern.search(note)
+        if match and not _negated(note, match.start()):
+            if label in ADMINISTRATIVE_RULES:
+                confident = administrative_only(note)
+            matches.append((URGENCY_RANK[urgency], category, urgency, label, confident))
+    if not matches:
+        return {"urgency": None, "triage_category": None, "matched": [], "confident": False}
+    matches.sort()
+    _, category, urgency, _, _ = matches[0]
+    top = [m for m in matches if m[2] == urgency]
+    return {
+        "urgency": urgency,
+        "triage_category": str(category),
+        "matched": [label for _, _, _, label, _ in matches],
+        "confident": any(confident for *_, confident in top)
+    }
+
+
+# Function to turn a pre-triage result into a triage output (before normalize_triage_output)
+def pretriage_output(result):
+    if result["urgency"] == "Critical":
+        action = "Red-flag alert raised from intake note; immediate clinician review requested"
+    else:
+        action = f"Queued as {result['urgency']} priority from intake note rules"
+    return {
+        "symptoms": list(result["matched"]),
+        "urgency": result["urgency"],
+        "triage_category": result["triage_category"],
+        "action": action
+    }
@@ -0,0 +1,355 @@
+import argparse
+import re
+import string
+import sys
+import threading
+from datetime import datetime
+
+# Version of each template used for new prompts; other registered versions stay available for comparison
+PROMPT_VERSIONS = {
+    "triage": "v1",
+    "medication": "v1",
+    "medication_concern": "v1",
+    "mental_health": "v1",
+    "report": "v1",
+    "analytics": "v1"
+}
+
+# Hugging Face tokenizer used to count prompt tokens (needs `transformers`), e.g. "gpt2"; None uses a fast estimate
+PROMPT_TOKENIZER = None
+
+# Rough BPE approximation: short letter runs, digit groups and single punctuation marks each count as one token
+TOKEN_RE = re.compile(r"[^\W\d_]{1,5}|\d{1,3}|[^\w\s]")
+
+# Template sources: str.format strings with an {input} field ({today} for medication plans, {sig} for the parsed
+# prescription). Literal braces in the example JSON are doubled.
+TRIAGE_V1 = """
+You are a medical AI assistant specialized in triage analysis. Analyze the following clinical note and provide a structured triage assessment in JSON format. The response must exactly match the structure and detail level of the following example:
+```json
+{{
+  "symptoms": ["chest pain", "radiation to left arm", "shortness of breath", "dizziness"],
+  "duration": "30 minutes",
+  "medical_history": ["hypertension"],
+  "urgency": "Critical",
+  "triage_category": "1",
+  "recommended_tests": ["ECG", "Cardiac enzymes", "Chest X-ray"],
+  "potential_diagnosis": ["Acute Myocardial Infarction", "Angina", "Aortic Dissection"],
+  "action": "Cardiac alert sent to EHR and cardiology team notified"
+}}
+```
+Requirements:
+- "symptoms": Always return as a list of detailed symptoms. If the clinical note is vague (e.g., "chest pain"), infer additional related symptoms (e.g., "shortness of breath", "dizziness") based on medical likelihood.
+- "duration": Provide a reasonable duration if not specified (e.g., "N/A" or an inferred value like "acute").
+- "medical_history": Infer a plausible medical history if not specified (e.g., ["hypertension"] for chest pain cases).
+- "urgency": Choose from "Critical", "High", "Medium", "Low". Use "Critical" for severe cases like chest pain unless specified otherwise.
+- "triage_category": Assign a number from 1 to 5, where 1 is most urgent. Use "1" for critical cases.
+- "recommended_tests": Provide a list of relevant tests (e.g., ["ECG", "Cardiac enzymes"] for cardiac issues).
+- "potential_diagnosis": Always provide a list of at least two plausible diagnoses (e.g., ["Acute Myocardial Infarction", "Angina"]). Never return an empty list.
+- "action": Provide a complete sentence describing the automated action (e.g., "Cardiac alert sent to EHR").
+Clinical note: "{input}"
+Return the response in JSON format, enclosed in triple backticks (```json\n...\n```).
+"""
+
+TRIAGE_V2 = """Triage this clinical note. Reply with JSON only, in ```json``` fences, with exactly these keys:
+{{"symptoms": ["chest pain", "radiation to left arm", "shortness of breath"], "duration": "30 minutes", "medical_history": ["hypertension"], "urgency": "Critical", "triage_category": "1", "recommended_tests": ["ECG", "Cardiac enzymes"], "potential_diagnosis": ["Acute Myocardial Infarction", "Angina"], "action": "Cardiac alert sent to EHR and cardiology team notified"}}
+urgency: Critical|High|Medium|Low. triage_category: "1"-"5", 1 most urgent. Infer likely symptoms, history and duration when the note is vague; give at least two diagnoses; action is one sentence.
+Clinical note: "{input}"
+"""
+
+MEDICATION_V1 = """
+You are an AI assistant that generates structured medication adherence plans in JSON format. Analyze the following prescription and provide a structured medication adherence plan exactly matching this structure:
+```json
+{{
+  "medication": "Sumatriptan",
+  "dosage": "50mg",
+  "frequency": "as needed",
+  "timing": "at onset of migraine",
+  "duration": "as needed for migraines",
+  "patient_concern": "None reported",
+  "adherence_risk": "Low",
+  "recommendation": "Keep medication accessible + migraine trigger tracking app",
+  "refill_date": "N/A - as needed",
+  "action": "Patient education on migraine triggers scheduled + medication access reminder set"
+}}
+```
+Requirements:
+- Always return a complete JSON structure with all fields, even if the prescription lacks details.
+- "medication": Extract the medication name as a string (e.g., "Sumatriptan").
+- "dosage": Extract the dosage as a string (e.g., "50mg").
+- "frequency": If not specified, infer based on the medication. For Sumatriptan, use "as needed".
+- "timing": If not specified, infer based on the medication. For Sumatriptan, use "at onset of migraine".
+- "duration": If not specified, infer based on the medication. For Sumatriptan, use "as needed for migraines".
+- "patient_concern": If none reported, use "None reported". If a concern is mentioned, extract it.
+- "adherence_risk": Assess as "Low", "Medium", or "High". Use "Low" for as-needed medications like Sumatriptan unless concerns are reported.
+- "recommendation": Provide a string with a practical suggestion. For Sumatriptan, suggest "Keep medication accessible + migraine trigger tracking app" unless a specific concern suggests otherwise.
+- "refill_date": Calculate as YYYY-MM-DD, assuming today is {today}. For as-needed medications like Sumatriptan, use "N/A - as needed".
+- "action": Provide a complete sentence. For Sumatriptan, use "Patient education on migraine triggers scheduled + medication access reminder set" unless a specific concern suggests a different action.
+Prescription: "{input}"
+Return the response in JSON format, enclosed in triple backticks (```json\n...\n```).
+"""
+
+MEDICATION_V2 = """Build a medication adherence plan for this prescription. Reply with JSON only, in ```json``` fences, with every key:
+{{"medication": "Sumatriptan", "dosage": "50mg", "frequency": "as needed", "timing": "at onset of migraine", "duration": "as needed for migraines", "patient_concern": "None reported", "adherence_risk": "Low", "recommendation": "Keep medication accessible + migraine trigger tracking app", "refill_date": "N/A - as needed", "action": "Patient education on migraine triggers scheduled + medication access reminder set"}}
+Infer missing frequency, timing and duration from the drug. adherence_risk: Low|Medium|High. refill_date: YYYY-MM-DD, or "N/A - as needed" for as-needed drugs. action is one sentence.
+Today: {today}
+Prescription: "{input}"
+"""
+
+MEDICATION_CONCERN_V1 = """A prescription has already been parsed as: {sig}. Read the full prescription note below for anything else the patient or prescriber reports, and reply with JSON only, in ```json``` fences, with exactly these keys:
+{{"patient_concern": "Forgets evening doses", "adherence_risk": "Medium", "recommendation": "Pill organizer + phone alarm for the evening dose", "action": "Evening dose reminder set and pharmacist follow-up scheduled"}}
+patient_concern: the stated concern or adherence barrier, or "None reported". adherence_risk: Low|Medium|High. recommendation: one practical suggestion addressing the concern. action: one sentence.
+Prescription: "{input}"
+"""
+
+MENTAL_HEALTH_V1 = """
+You are a mental health AI assistant that assesses risk from patient journals. Analyze the following patient journal entry and provide a structured mental health risk assessment in JSON format exactly matching this structure:
+```json
+{{
+  "risk_phrases": ["hopeless", "overwhelmed", "don't see any point in continuing", "nothing brings me joy"],
+  "symptoms": ["insomnia", "appetite loss", "anhedonia", "hopelessness"],
+  "risk_level": "High",
+  "suicide_risk": "Elevated",
+  "recommended_response": "Immediate follow-up within 24 hours",
+  "suggested_resources": ["Crisis helpline", "Emergency psychiatric evaluation", "Safety plan development"],
+  "action": "Crisis counselor notified and safety check scheduled for today"
+}}
+```
+Requirements:
+- "risk_phrases": List phrases indicating risk (e.g., "hopeless"). Return an empty list if none found.
+- "symptoms": List symptoms (e.g., "insomnia"). Return an empty list if none identified.
+- "risk_level": Assess as "Low", "Medium", or "High". Use "High" for severe cases.
+- "suicide_risk": Assess as a string (e.g., "Elevated", "Low to Medium", "Not detected").
+- "recommended_response": Provide a timeframe as a string (e.g., "Immediate follow-up within 24 hours"). Use "Routine follow-up" if risk is low.
+- "suggested_resources": List at least 2 resources (e.g., "Crisis helpline"). Use general resources if risk is low.
+- "action": Provide a complete sentence (e.g., "Crisis counselor notified").
+Journal entry: "{input}"
+Return the response in JSON format, enclosed in triple backticks (```json\n...\n```).
+"""
+
+MENTAL_HEALTH_V2 = """Assess mental health risk in this journal entry. Reply with JSON only, in ```json``` fences, with exactly these keys:
+{{"risk_phrases": ["hopeless", "nothing brings me joy"], "symptoms": ["insomnia", "anhedonia"], "risk_level": "High", "suicide_risk": "Elevated", "recommended_response": "Immediate follow-up within 24 hours", "suggested_resources": ["Crisis helpline", "Safety plan development"], "action": "Crisis counselor notified and safety check scheduled for today"}}
+risk_level: Low|Medium|High. Use empty lists when nothing is found, "Routine follow-up" for low risk, and at least two resources. action is one sentence.
+Journal entry: "{input}"
+"""
+
+REPORT_V1 = """
+You are a medical AI assistant that generates structured clinical reports. Convert the following clinical note into a structured medical report in JSON format:
+- Extract patient demographics (age, gender, etc.)
+- Identify diagnosis or visit type (string)
+- Extract treatment (string, if applicable)
+- Record vital signs (dictionary)
+- List medications (list of dictionaries with name, dosage, frequency, duration)
+- Specify follow-up plan (dictionary with provider, timeframe, reason)
+- Propose an action (string)
+Clinical note: "{input}"
+Return the response in JSON format, enclosed in triple backticks (```json\n...\n```).
+"""
+
+REPORT_V2 = """Convert this clinical note into a structured report. Reply with JSON only, in ```json``` fences, with keys: patient_demographics (dict), diagnosis (string), treatment (string), vital_signs (dict), medications (list of {{name, dosage, frequency, duration}}), follow_up ({{provider, timeframe, reason}}), action (string).
+Clinical note: "{input}"
+"""
+
+ANALYTICS_V1 = """
+You are an AI assistant that generates structured healthcare analytics data in JSON format. Generate analytics data for a healthcare dashboard with the following sections:
+- Automated Triage System (total cases, urgency distribution, accuracy rate, avg processing time)
+- Medication Adherence Assistant (adherence improvement, total reminders sent, most common medications, avg reminder response)
+- Mental Health Crisis Detector (risk levels, intervention success rate, response time)
+- Clinical Report Generator (total reports, avg completion time, error rate, physician satisfaction)
+Ensure that 'most_common_medications' is a dictionary with medication names as keys and counts as values.
+Return the response as a structured JSON object enclosed in triple backticks (```json\n...\n```). Example:
+```json
+{{
+  "triage_stats": {{
+    "total_cases": 600,
+    "urgency_distribution": {{"Critical": 90, "High": 160, "Medium": 200, "Low": 150}},
+    "accuracy_rate": 95.0,
+    "avg_processing_time": 3.0
+  }},
+  "medication_stats": {{
+    "adherence_improvement": 37,
+    "total_reminders_sent": 12453,
+    "most_common_medications": {{"Metformin": 245, "Lisinopril": 198, "Atorvastatin": 176, "Levothyroxine": 145, "Amlodipine": 121}},
+    "avg_reminder_response": 85.7
+  }},
+  "mental_health_stats": {{...}},
+  "report_stats": {{...}}
+}}
+```
+"""
+
+ANALYTICS_V2 = """Generate healthcare dashboard analytics. Reply with JSON only, in ```json``` fences, shaped like:
+{{"triage_stats": {{"total_cases": 600, "urgency_distribution": {{"Critical": 90, "High": 160, "Medium": 200, "Low": 150}}, "accuracy_rate": 95.0, "avg_processing_time": 3.0}}, "medication_stats": {{"adherence_improvement": 37, "total_reminders_sent": 12453, "most_common_medications": {{"Metformin": 245, "Lisinopril": 198}}, "avg_reminder_response": 85.7}}, "mental_health_stats": {{"risk_levels": {{"High": 10, "Medium": 25, "Low": 65}}, "intervention_success_rate": 80.0, "response_time": 2.5}}, "report_stats": {{"total_reports": 300, "avg_completion_time": 4.0, "error_rate": 1.5, "physician_satisfaction": 4.5}}}}
+"""
+
+
+_tokenizer = None
+
+
+# Function to count the tokens in a piece of prompt text, with PROMPT_TOKENIZER when configured
+def count_tokens(text):
+    global _tokenizer
+    if PROMPT_TOKENIZER:
+        if _tokenizer is None:
+            from transformers import AutoTokenizer
+
+            _tokenizer = AutoTokenizer.from_pretrained(PROMPT_TOKENIZER)
+        return len(_tokenizer.encode(text))
+    return len(TOKEN_RE.findall(text))
+
+
+# Rendered prompt text that remembers which template produced it, so the inference client can attribute latency
+class RenderedPrompt(str):
+    template_key = None
+
+
+# A named, versioned prompt template parsed once into literal and field segments. The literal text before the first
+# field is the static prefix shared by every call, and the tokens of all literal text are counted up front.
+class PromptTemplate:
+    def __init__(self, name, version, source):
+        self.name = name
+        self.version = version
+        self.key = f"{name}@{version}"
+        # Formatter.parse also splits at escaped braces; join those runs back into one literal per field
+        self.segments = []
+        literal_run = ""
+        for literal, field, _, _ in string.Formatter().parse(source):
+            literal_run += literal
+            if field is not None:
+                self.segments.append((literal_run, field))
+                literal_run = ""
+        if literal_run:
+            self.segments.append((literal_run, None))
+        self.fields = tuple(field for _, field in self.segments if field)
+        self.prefix = self.segments[0][0] if self.segments else ""
+        self.prefix_tokens = count_tokens(self.prefix)
+        self.static_tokens = sum(count_tokens(literal) for literal, _ in self.segments)
+
+    # Returns (prompt, prompt_tokens); only the per-call field values are tokenized here
+    def render(self, **values):
+        parts, dynamic_tokens = [], 0
+        for literal, field in self.segments:
+            parts.append(literal)
+            if field:
+                value = str(values[field])
+                parts.append(value)
+                dynamic_tokens += count_tokens(value)
+        prompt = RenderedPrompt("".join(parts))
+        prompt.template_key = self.key
+        return prompt, self.static_tokens + dynamic_tokens
+
+
+# Per-template counts of rendered prompts, prompt tokens and upstream latency
+class PromptStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+
+    def _entry(self, key):
+        return self._counts.setdefault(key, {
+            "renders": 0, "prompt_tokens": 0, "static_tokens": 0, "max_tokens": 0,
+            "calls": 0, "cached": 0, "latency": 0.0
+        })
+
+    def record_render(self, template, prompt_tokens):
+        with self._lock:
+            counts = self._entry(template.key)
+            counts["renders"] += 1
+            counts["prompt_tokens"] += prompt_tokens
+            counts["static_tokens"] += template.static_tokens
+            counts["max_tokens"] = max(counts["max_tokens"], prompt_tokens)
+
+    # Called by the inference client when a request for a rendered prompt completes; plain strings are ignored
+    def observe(self, prompt, elapsed, cached=False):
+        key = getattr(prompt, "template_key", None)
+        if key is None:
+            return
+        with self._lock:
+            counts = self._entry(key)
+            if cached:
+                counts["cached"] += 1
+            else:
+                counts["calls"] += 1
+                counts["latency"] += elapsed
+
+    def snapshot(self):
+        with self._lock:
+            result = {}
+            for key, counts in self._counts.items():
+                renders, calls = counts["renders"], counts["calls"]
+                result[key] = {
+                    "renders": renders,
+                    "avg_prompt_tokens": round(counts["prompt_tokens"] / renders, 1) if renders else 0.0,
+                    "static_share": round(100 * counts["static_tokens"] / counts["prompt_tokens"], 1)
+                    if counts["prompt_tokens"] else 0.0,
+                    "max_prompt_tokens": counts["max_tokens"],
+                    "calls": calls,
+                    "cached": counts["cached"],
+                    "avg_latency": round(counts["latency"] / calls, 2) if calls else 0.0
+                }
+            return result
+
+
+prompt_stats = PromptStats()
+
+# Registered templates: name -> version -> PromptTemplate
+PROMPT_TEMPLATES = {}
+
+
+# Function to add a template version to the registry
+def register_template(name, version, source):
+    template = PromptTemplate(name, version, source)
+    PROMPT_TEMPLATES.setdefault(name, {})[version] = template
+    return template
+
+
+for _name, _versions in {
+    "triage": {"v1": TRIAGE_V1, "v2": TRIAGE_V2},
+    "medication": {"v1": MEDICATION_V1, "v2": MEDICATION_V2},
+    "medication_concern": {"v1": MEDICATION_CONCERN_V1},
+    "mental_health": {"v1": MENTAL_HEALTH_V1, "v2": MENTAL_HEALTH_V2},
+    "report": {"v1": REPORT_V1, "v2": REPORT_V2},
+    "analytics": {"v1": ANALYTICS_V1, "v2": ANALYTICS_V2}
+}.items():
+    for _version, _source in _versions.items():
+        register_template(_name, _version, _source)
+
+
+# Function to look up a template, defaulting to the version selected in PROMPT_VERSIONS
+def get_template(name, version=None):
+    return PROMPT_TEMPLATES[name][version or PROMPT_VERSIONS[name]]
+
+
+# Function to render a registered prompt and record its token count; user_input fills {input}, other fields
+# ({today}) are passed as keywords
+def render_prompt(name, user_input="", version=None, **values):
+    template = get_template(name, version)
+    if "today" in template.fields and "today" not in values:
+        values["today"] = datetime.now()
+    if isinstance(values.get("today"), datetime):
+        values["today"] = values["today"].strftime("%Y-%m-%d")
+    prompt, prompt_tokens = template.render(input=user_input, **values)
+    prompt_stats.record_render(template, prompt_tokens)
+    return prompt
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare prompt template sizes across registered versions.")
+    parser.add_argument("--input", default="", help="sample user input to render into each template")
+    args = parser.parse_args(argv)
+
+    for name, versions in PROMPT_TEMPLATES.items():
+        baseline = None
+        for version, template in versions.items():
+            values = {field: "" for field in template.fields}
+            values.update(input=args.input, today=datetime.now().strftime("%Y-%m-%d") if "today" in values else "")
+            prompt, tokens = template.render(**values)
+            baseline = baseline or tokens
+            active = "*" if PROMPT_VERSIONS.get(name) == version else " "
+            saving = f"{100 * (baseline - tokens) / baseline:5.1f}% fewer" if tokens != baseline else ""
+            print(f"{active} {template.key:<18} {tokens:5d} tokens  {len(prompt):5d} chars  "
+                  f"prefix {template.prefix_tokens:4d} tokens  {saving}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,296 @@
+import argparse
+import csv
+import hashlib
+import io
+import random
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from email.mime.text import MIMEText
+
+from analyzers import normalize_medication_output
+from notifications import SENDER_EMAIL, get_dispatcher
+from schedules import dose_calendar, medication_frame, schedule_frame
+
+# Ledger of claimed reminder deliveries; keeps a restart from sending anything twice
+REMINDER_LEDGER_DB = "reminder_ledger.sqlite3"
+
+# Campaign settings: messages per second, deliveries per batch, and retry policy for failed sends
+REMINDER_RATE = 5.0
+REMINDER_BATCH_SIZE = 50
+REMINDER_MAX_RETRIES = 3
+REMINDER_BACKOFF_BASE = 1.0
+REMINDER_BACKOFF_CAP = 30.0
+
+# How far ahead (hours) dose reminders are generated, and how many days before a refill to remind
+REMINDER_WINDOW_HOURS = 24
+REFILL_LEAD_DAYS = 3
+
+
+# Function to build a stable idempotency key for one delivery of one reminder
+def reminder_key(patient_id, medication, kind, scheduled_at, channel):
+    raw = "|".join([str(patient_id), medication, kind, scheduled_at.isoformat(), channel])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# Function to compute the dose and refill reminder deliveries due for each patient row. Dose times and refill dates for
+# the whole cohort come from the vectorized schedule engine; a row's stated refill_date takes precedence over one
+# computed from its start_date and supply.
+def due_reminders(rows, now=None, window_hours=REMINDER_WINDOW_HOURS, refill_lead_days=REFILL_LEAD_DAYS):
+    now = now or datetime.now()
+    window_end = now + timedelta(hours=window_hours)
+    meds = [normalize_medication_output(dict(row)) for row in rows]
+    if not meds:
+        return []
+    scheduled = schedule_frame(medication_frame(meds), now)
+    reminders = [[] for _ in meds]
+    for index, scheduled_at in dose_calendar(scheduled, now, window_end).itertuples(index=False):
+        scheduled_at = scheduled_at.to_pydatetime()
+        reminders[index].append(("dose", scheduled_at, scheduled_at))
+    for index, refill_date in scheduled["refill"].dropna().items():
+        refill_date = refill_date.to_pydatetime()
+        remind_from = refill_date - timedelta(days=refill_lead_days)
+        if remind_from <= now <= refill_date + timedelta(days=1):
+            reminders[index].append(("refill", remind_from, refill_date))
+
+    deliveries = []
+    for index, (row, med) in enumerate(zip(rows, meds)):
+        patient_id = row.get("patient_id") or row.get("id") or index + 1
+        for kind, scheduled_at, due_at in reminders[index]:
+            for channel, address in (("email", row.get("email")), ("sms", row.get("phone"))):
+                if address:
+                    deliveries.append({
+                        "key": reminder_key(patient_id, med["medication"], kind, scheduled_at, channel),
+                        "patient_id": patient_id,
+                        "kind": kind,
+                        "scheduled_at": scheduled_at,
+                        "due_at": due_at,
+                        "channel": channel,
+                        "address": address,
+                        "medication": med
+                    })
+    return deliveries
+
+
+# Function to render the email subject/body and SMS text for a delivery; refill reminders name the engine's scheduled
+# refill date (due_at), since a computed date is never written back to the medication's refill_date
+def reminder_message(delivery):
+    med = delivery["medication"]
+    if delivery["kind"] == "refill":
+        subject = f"Refill reminder: {med['medication']}"
+        text = (f"Your {med['medication']} {med['dosage']} is due for a refill on "
+                f"{delivery['due_at'].strftime('%Y-%m-%d')}.")
+    else:
+        subject = f"Medication reminder: {med['medication']} {med['dosage']}"
+        text = (f"Time to take {med['medication']} {med['dosage']} "
+                f"({delivery['scheduled_at'].strftime('%H:%M')}, {med['timing']}).")
+    return subject, text
+
+
+# SQLite ledger of reminder deliveries keyed by idempotency key
+class ReminderLedger:
+    def __init__(self, path=REMINDER_LEDGER_DB):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS deliveries (key TEXT PRIMARY KEY, patient_id TEXT, channel TEXT, "
+            "kind TEXT, scheduled_at TEXT, status TEXT NOT NULL, attempts INTEGER DEFAULT 0, updated_at REAL)"
+        )
+        self._db.commit()
+
+    # Claims a delivery before sending; False if an earlier run already sent it or is sending it. A delivery whose
+    # earlier run failed is reclaimed: the upsert only overwrites a row still marked 'failed'.
+    def claim(self, delivery):
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO deliveries (key, patient_id, channel, kind, scheduled_at, status, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, 'sending', ?) "
+                "ON CONFLICT (key) DO UPDATE SET status = 'sending', updated_at = excluded.updated_at "
+                "WHERE deliveries.status = 'failed'",
+                (delivery["key"], str(delivery["patient_id"]), delivery["channel"], delivery["kind"],
+                 delivery["scheduled_at"].isoformat(), time.time())
+            )
+            self._db.commit()
+            return cursor.rowcount == 1
+
+    # Recorded status of a delivery ('sending', 'sent' or 'failed'), or None if no run has claimed it
+    def status(self, key):
+        with self._lock:
+            row = self._db.execute("SELECT status FROM deliveries WHERE key = ?", (key,)).fetchone()
+            return row[0] if row else None
+
+    def finish(self, key, status, attempts):
+        with self._lock:
+            self._db.execute("UPDATE deliveries SET status = ?, attempts = attempts + ?, updated_at = ? WHERE key = ?",
+                             (status, attempts, time.time(), key))
+            self._db.commit()
+
+    def count_sent(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM deliveries WHERE status = 'sent'").fetchone()[0]
+
+
+# Spaces calls evenly so no more than `rate` go out per second across all worker threads
+class RateLimiter:
+    def __init__(self, rate=REMINDER_RATE):
+        self.interval = 1.0 / rate
+        self._lock = threading.Lock()
+        self._next_slot = time.monotonic()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+# Rate-limited, batched, retrying sender for a list of reminder deliveries
+class ReminderCampaign:
+    def __init__(self, ledger, smtp_pool, sms_sender, rate=REMINDER_RATE, batch_size=REMINDER_BATCH_SIZE,
+                 max_retries=REMINDER_MAX_RETRIES, sender_email=SENDER_EMAIL, dry_run=False):
+        self.ledger = ledger
+        self.smtp_pool = smtp_pool
+        self.sms_sender = sms_sender
+        self.limiter = RateLimiter(rate)
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.sender_email = sender_email
+        self.dry_run = dry_run
+        self.total = 0
+        self.sent = 0
+        self.failed = 0
+        self.skipped = 0
+        self.retried = 0
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def run(self, deliveries):
+        self.total = len(deliveries)
+        self.started_at = time.time()
+        workers = max(1, min(self.batch_size, 8))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for start in range(0, len(deliveries), self.batch_size):
+                list(executor.map(self._deliver, deliveries[start:start + self.batch_size]))
+        self.finished_at = time.time()
+        return self.stats()
+
+    # Runs the campaign on a background thread and returns immediately
+    def start(self, deliveries):
+        thread = threading.Thread(target=self.run, args=(deliveries,), name="reminder-campaign", daemon=True)
+        thread.start()
+        return thread
+
+    def _deliver(self, delivery):
+        # Deliveries that failed in an earlier run are sent again, and counted as retried rather than already sent
+        previous = self.ledger.status(delivery["key"])
+        if previous == "failed":
+            self._count("retried")
+        if self.dry_run:
+            self._count("skipped" if previous in ("sending", "sent") else "sent")
+            return
+        if not self.ledger.claim(delivery):
+            self._count("skipped")
+            return
+        subject, text = reminder_message(delivery)
+        for attempt in range(self.max_retries + 1):
+            self.limiter.wait()
+            try:
+                if delivery["channel"] == "email":
+                    msg = MIMEText(text)
+                    msg["From"] = self.sender_email
+                    msg["To"] = delivery["address"]
+                    msg["Subject"] = subject
+                    self.smtp_pool.send(self.sender_email, delivery["address"], msg.as_string())
+                else:
+                    self.sms_sender.send(text, delivery["address"])
+            except Exception:
+                if attempt < self.max_retries:
+                    delay = min(REMINDER_BACKOFF_CAP, REMINDER_BACKOFF_BASE * (2 ** attempt))
+                    time.sleep(random.uniform(delay / 2, delay))
+                    continue
+                self.ledger.finish(delivery["key"], "failed", attempt + 1)
+                self._count("failed")
+                return
+            self.ledger.finish(delivery["key"], "sent", attempt + 1)
+            self._count("sent")
+            return
+
+    def _count(self, field):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def stats(self):
+        with self._lock:
+            end = self.finished_at or time.time()
+            elapsed = end - self.started_at if self.started_at else 0.0
+            done = self.sent + self.failed + self.skipped
+            return {
+                "total": self.total,
+                "sent": self.sent,
+                "failed": self.failed,
+                "skipped": self.skipped,
+                "retried": self.retried,
+                "remaining": self.total - done,
+                "elapsed": round(elapsed, 2),
+                "per_sec": round(self.sent / elapsed, 2) if elapsed > 0 else 0.0,
+                "running": self.started_at is not None and self.finished_at is None
+            }
+
+
+_ledger = None
+_ledger_lock = threading.Lock()
+
+
+# Process-wide reminder ledger
+def get_ledger():
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = ReminderLedger()
+        return _ledger
+
+
+# Function to build a campaign that reuses the notification dispatcher's SMTP pool and Twilio client
+def new_campaign(**options):
+    dispatcher = get_dispatcher()
+    return ReminderCampaign(get_ledger(), dispatcher.smtp_pool, dispatcher.sms_sender, **options)
+
+
+# Function to read patient/medication rows from CSV text
+def load_patient_rows(text):
+    return [row for row in csv.DictReader(io.StringIO(text)) if any(row.values())]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Send due medication reminders for a cohort of patients.")
+    parser.add_argument("path", help="CSV with patient_id, email, phone, medication, dosage, frequency, timing, refill_date")
+    parser.add_argument("--window-hours", type=float, default=REMINDER_WINDOW_HOURS, help="look-ahead for dose reminders")
+    parser.add_argument("--rate", type=float, default=REMINDER_RATE, help="messages per second")
+    parser.add_argument("--batch-size", type=int, default=REMINDER_BATCH_SIZE)
+    parser.add_argument("--dry-run", action="store_true", help="count due deliveries without sending or recording them")
+    args = parser.parse_args(argv)
+
+    with open(args.path, encoding="utf-8") as f:
+        rows = load_patient_rows(f.read())
+    deliveries = due_reminders(rows, window_hours=args.window_hours)
+    campaign = new_campaign(rate=args.rate, batch_size=args.batch_size, dry_run=args.dry_run)
+    stats = campaign.run(deliveries)
+    if args.dry_run:
+        print(f"{stats['sent']} would be sent ({stats['retried']} failed before), {stats['skipped']} already sent "
+              f"of {stats['total']} due")
+        return 0
+    print(f"{stats['sent']} sent, {stats['failed']} failed, {stats['retried']} retried from earlier runs, "
+          f"{stats['skipped']} already sent "
+          f"of {stats['total']} due in {stats['elapsed']}s ({stats['per_sec']} msgs/sec)")
+    print(f"Total reminders sent to date: {get_ledger().count_sent()}")
+    return 0 if stats["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,160 @@
+import html
+import re
+
+# Risk phrase lexicon: phrase -> severity. Phrases are matched case-insensitively on word boundaries,
+# with any run of whitespace between words; keep entries lower-case.
+RISK_LEXICON = {
+    # High: intent, plan, means or recent attempt
+    "kill myself": "High", "killing myself": "High", "end my life": "High", "ending my life": "High",
+    "take my own life": "High", "suicide": "High", "suicidal": "High", "want to die": "High",
+    "wish i was dead": "High", "wish i were dead": "High", "better off dead": "High",
+    "better off without me": "High", "don't see any point in continuing": "High",
+    "no point in living": "High", "no reason to live": "High", "can't go on": "High",
+    "overdose": "High", "hang myself": "High", "wrote a note": "High", "goodbye letter": "High",
+    "giving away my things": "High", "end it all": "High", "not wake up": "High",
+    "hurt myself": "High", "cutting myself": "High", "self-harm": "High", "self harm": "High",
+    # Medium: hopelessness, entrapment, burden, anhedonia
+    "hopeless": "Medium", "hopelessness": "Medium", "worthless": "Medium", "trapped": "Medium",
+    "a burden": "Medium", "nothing brings me joy": "Medium", "can't take it anymore": "Medium",
+    "no way out": "Medium", "empty inside": "Medium", "numb": "Medium", "unbearable": "Medium",
+    "give up": "Medium", "giving up": "Medium", "nobody cares": "Medium", "all alone": "Medium",
+    # Low: distress and symptoms that warrant routine follow-up
+    "overwhelmed": "Low", "anxious": "Low", "can't sleep": "Low", "insomnia": "Low", "no appetite": "Low",
+    "exhausted": "Low", "crying": "Low", "lonely": "Low", "panic": "Low", "stressed": "Low", "sad": "Low"
+}
+
+SEVERITY_RANK = {"High": 0, "Medium": 1, "Low": 2}
+
+# Journals are scanned in chunks of this many characters; only a short tail is carried between chunks
+RISK_SCAN_CHUNK = 64 * 1024
+
+# Characters of surrounding text kept with each match for highlighting, and the number of spans kept
+RISK_CONTEXT_CHARS = 60
+RISK_MAX_SPANS = 50
+
+
+# Compiled single-alternation matcher over a risk lexicon that scans text or chunk streams in one pass
+class RiskMatcher:
+    def __init__(self, lexicon=RISK_LEXICON):
+        self.lexicon = {phrase.lower(): severity for phrase, severity in lexicon.items()}
+        # Longest phrases first so "hopelessness" wins over "hopeless" at the same position
+        phrases = sorted(self.lexicon, key=len, reverse=True)
+        alternation = "|".join(
+            r"\s+".join(re.escape(word).replace("'", "['’]") for word in phrase.split()) for phrase in phrases
+        )
+        self._pattern = re.compile(rf"(?<!\w)(?:{alternation})(?!\w)", re.IGNORECASE)
+        self._overlap = max(len(phrase) for phrase in phrases) * 2
+
+    def _phrase(self, matched):
+        return " ".join(matched.lower().replace("’", "'").split())
+
+    # Yields {"phrase", "severity", "start", "end", "context"} for every match in one string
+    def finditer(self, text, offset=0):
+        for match in self._pattern.finditer(text):
+            yield self._hit(text, match, offset)
+
+    def _hit(self, text, match, offset):
+        phrase = self._phrase(match.group())
+        return {
+            "phrase": phrase,
+            "severity": self.lexicon[phrase],
+            "start": offset + match.start(),
+            "end": offset + match.end(),
+            "context": (
+                text[max(0, match.start() - RISK_CONTEXT_CHARS):match.start()],
+                match.group(),
+                text[match.end():match.end() + RISK_CONTEXT_CHARS]
+            )
+        }
+
+    # Yields matches from an iterable of text chunks, with absolute offsets. Each chunk is scanned together with
+    # the tail of the previous one, so phrases split across a chunk boundary are still found exactly once.
+    def scan(self, chunks):
+        tail, tail_offset, emitted_to = "", 0, 0
+        # The tail keeps one extra leading character so the word-boundary check at its start sees real context
+        keep = 2 * self._overlap + RISK_CONTEXT_CHARS + 1
+        for chunk in chunks:
+            if not chunk:
+                continue
+            window = tail + chunk
+            # Matches ending this close to the end could still grow into the next chunk; defer them
+            limit = len(window) - self._overlap
+            for match in self._pattern.finditer(window, 1 if tail_offset else 0):
+                if match.end() > limit:
+                    break
+                if tail_offset + match.start() >= emitted_to:
+                    emitted_to = tail_offset + match.end()
+                    yield self._hit(window, match, tail_offset)
+            cut = max(0, len(window) - keep)
+            tail_offset += cut
+            tail = window[cut:]
+        for match in self._pattern.finditer(tail, 1 if tail_offset else 0):
+            if tail_offset + match.start() >= emitted_to:
+                emitted_to = tail_offset + match.end()
+                yield self._hit(tail, match, tail_offset)
+
+
+_matcher = None
+
+
+# Shared matcher over the default lexicon, compiled on first use
+def get_risk_matcher():
+    global _matcher
+    if _matcher is None:
+        _matcher = RiskMatcher()
+    return _matcher
+
+
+# Function to read a text file-like object in fixed-size chunks
+def iter_chunks(stream, size=RISK_SCAN_CHUNK):
+    while True:
+        chunk = stream.read(size)
+        if not chunk:
+            return
+        yield chunk.decode("utf-8", errors="replace") if isinstance(chunk, bytes) else chunk
+
+
+# Function to summarize a match stream into a provisional assessment. Memory is bounded: per-phrase counts plus at
+# most RISK_MAX_SPANS highlighted spans. Any High phrase gives High; any Medium phrase or three or more distinct
+# Low phrases gives Medium; otherwise Low.
+def assess_risk(matches, max_spans=RISK_MAX_SPANS):
+    counts, severity, spans = {}, {}, []
+    for hit in matches:
+        counts[hit["phrase"]] = counts.get(hit["phrase"], 0) + 1
+        severity[hit["phrase"]] = hit["severity"]
+        if len(spans) < max_spans:
+            spans.append(hit)
+    severities = list(severity.values())
+    if "High" in severities:
+        risk_level = "High"
+    elif "Medium" in severities or severities.count("Low") >= 3:
+        risk_level = "Medium"
+    else:
+        risk_level = "Low"
+    phrases = sorted(counts, key=lambda phrase: (SEVERITY_RANK[severity[phrase]], -counts[phrase]))
+    return {"risk_level": risk_level, "risk_phrases": phrases, "counts": counts, "spans": spans}
+
+
+# Function to render matched spans as HTML snippets with the phrase highlighted
+def highlight_spans(spans):
+    colors = {"High": "#FEE2E2", "Medium": "#FEF3C7", "Low": "#DBEAFE"}
+    snippets = []
+    for hit in spans:
+        before, matched, after = hit["context"]
+        snippets.append(
+            f"…{html.escape(before)}<mark style='background-color: {colors[hit['severity']]};'>"
+            f"<b>{html.escape(matched)}</b></mark>{html.escape(after)}…"
+        )
+    return snippets
+
+
+# Function to turn a provisional assessment into a mental health output (before normalize_mental_health_output)
+def risk_output(assessment):
+    level = assessment["risk_level"]
+    return {
+        "risk_phrases": list(assessment["risk_phrases"]),
+        "risk_level": level,
+        "suicide_risk": "Elevated" if level == "High" else "Not assessed",
+        "recommended_response": "Immediate follow-up within 24 hours" if level == "High" else "Routine follow-up",
+        "action": f"{level} risk flagged from journal risk phrases; clinician review requested"
+    }
@@ -1,20 +1,36 @@
 import streamlit as st
-import pandas as pd
-from pandas.tseries.offsets import DateOffset
+import hashlib
 import json
+import os
+import queue
 import sys
+import tempfile
 import time
-from datetime import datetime
-import plotly.express as px
+import threading
+from datetime import datetime, timedelta
 from streamlit_lottie import st_lottie
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from io import BytesIO
 import requests
 import warnings
-import smtplib
-from email.mime.text import MIMEText
-from twilio.rest import Client
+from notifications import get_dispatcher
+from event_store import build_analytics, get_event_store
+from reminders import due_reminders, get_ledger, load_patient_rows, new_campaign
+from inference import get_client, get_engine, InferenceError, CircuitOpenError
+from prompts import prompt_stats, render_prompt
+from structured_output import (
+    StreamingJSONParser, StructuredOutputError, generation_budget, parse_stats, parse_structured_output
+)
+from analyzers import (
+    build_medication_concern_prompt, build_prompt, fallback_output, merge_medication_concern,
+    normalize_medication_output, normalize_mental_health_output, normalize_triage_output
+)
+from long_notes import analyze_long_note, needs_chunking
+from medications import parse_prescription
+from schedules import CALENDAR_DAYS, dose_calendar, medication_frame, plan_refill_date, schedule_frame
+from risk_matcher import assess_risk, get_risk_matcher, highlight_spans, iter_chunks, risk_output
+from pretriage import PRETRIAGE_SHORT_CIRCUIT, pretriage, pretriage_output
+from scheduler import triage_priority
+from batch_triage import BATCH_MAX_WORKERS, load_notes, run_batch, results_frame
+from pdf_reports import BULK_WORKERS, cached_report_pdf, export_reports, pdf_cache
 
 # Streamlit page configuration
 st.set_page_config(
@@ -23,154 +39,183 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Hugging Face API configuration
-API_URL = ""
-headers = {
-    "Authorization": "",
-    "Content-Type": ""
+# Maximum number of built chart figures kept for reuse across sessions and reruns
+FIGURE_CACHE_SIZE = 64
+
+# Where dashboard analytics come from: "events" (recorded analysis results) or "model" (generated by the LLM)
+ANALYTICS_SOURCE = "events"
+
+# Seconds before the cached analytics payload is considered stale and refreshed in the background
+ANALYTICS_TTL_SECONDS = 300
+
+# Stream model output token by token into the result panels (needs an endpoint that supports SSE)
+STREAM_RESPONSES = True
+
+# Labels for the progress stages reported by the inference client
+PROGRESS_LABELS = {
+    "sent": "Request sent to model",
+    "retrying": "Model busy, retrying",
+    "first_byte": "First byte received",
+    "parsed": "Response JSON parsed",
+    "cached": "Served from response cache",
+    "coalesced": "Joined an identical in-flight request"
 }
 
-# Function to make Hugging Face API call
-def call_huggingface_api(prompt, max_length=800):
-    data = {
-        "inputs": prompt,
-        "parameters": {
-            "max_length": max_length,
-            "temperature": 0.3,
-            "return_full_text": False
-        }
-    }
+# Function to surface a failed model call in the UI
+def report_api_error(error, status=None):
+    if isinstance(error, CircuitOpenError):
+        label = "Model unavailable"
+        st.warning("Hugging Face API is unavailable. Using fallback output.")
+    elif isinstance(error, InferenceError):
+        label = "Unexpected model response"
+        st.error(str(error))
+    else:
+        label = "Model request failed"
+        st.error(f"Hugging Face API call failed: {str(error)}")
+    if status is not None:
+        status.update(label=label, state="error")
+
+# Function to make Hugging Face API call, reporting each stage of the request as it happens
+def call_huggingface_api(prompt, max_length=800, use_cache=True, show_progress=True, stream_to=None, stream_fields=(),
+                         priority=None):
+    if stream_to is not None:
+        return stream_huggingface_api(
+            prompt, stream_to, stream_fields, max_length=max_length, use_cache=use_cache, priority=priority
+        )
+    events = queue.Queue()
+    future = get_engine().submit(
+        prompt, max_length=max_length, use_cache=use_cache, progress=events.put, priority=priority
+    )
+    future.add_done_callback(lambda f: events.put(None))
+    status = st.status("Processing...") if show_progress else None
+    start_time = time.time()
+    stage = events.get()
+    while stage is not None:
+        if status is not None:
+            status.update(label=f"{PROGRESS_LABELS[stage]}...")
+            status.write(f"{PROGRESS_LABELS[stage]} ({time.time() - start_time:.2f}s)")
+        stage = events.get()
     try:
-        response = requests.post(API_URL, headers=headers, json=data)
-        response.raise_for_status()
-        result = response.json()
-        if isinstance(result, list) and len(result) > 0 and "generated_text" in result[0]:
-            raw_response = result[0]["generated_text"]
-            return raw_response
-        else:
-            st.error(f"Unexpected response format: {result}")
-            return None
-    except requests.exceptions.RequestException as e:
-        st.error(f"Hugging Face API call failed: {str(e)}")
+        result = future.result()
+    except (InferenceError, requests.exceptions.RequestException) as e:
+        report_api_error(e, status)
+        return None
+    if status is not None:
+        status.update(label=f"Model response received in {time.time() - start_time:.2f}s", state="complete")
+    return result
+
+# Function to stream a model call into a placeholder, showing watched fields as soon as they parse
+def stream_huggingface_api(prompt, placeholder, fields, max_length=800, use_cache=True, priority=None):
+    parser = StreamingJSONParser()
+    text = ""
+    try:
+        for chunk in get_engine().stream(prompt, max_length=max_length, use_cache=use_cache, priority=priority):
+            text += chunk
+            parser.feed(chunk)
+            summary = "  \n".join(
+                f"**{key.replace('_', ' ').title()}:** {parser.fields[key]}" for key in fields if key in parser.fields
+            )
+            with placeholder.container():
+                st.markdown(summary or "_Generating..._")
+                st.code(text, language="json")
+    except (InferenceError, requests.exceptions.RequestException) as e:
+        placeholder.empty()
+        report_api_error(e)
         return None
+    placeholder.empty()
+    return text
 
 # Function to validate analytics dictionary
 def validate_analytics(analytics):
     required_keys = ["triage_stats", "medication_stats", "mental_health_stats", "report_stats"]
     return all(key in analytics for key in required_keys)
 
-# Function to normalize and validate triage output
-def normalize_triage_output(output):
-    required_keys = [
-        "symptoms", "duration", "medical_history", "urgency",
-        "triage_category", "recommended_tests", "potential_diagnosis", "action"
-    ]
-    for key in required_keys:
-        if key not in output:
-            if key in ["symptoms", "medical_history", "recommended_tests", "potential_diagnosis"]:
-                output[key] = []
-            elif key == "action":
-                output[key] = "No action specified"
-            else:
-                output[key] = "Unknown"
-    if isinstance(output["symptoms"], str):
-        output["symptoms"] = [output["symptoms"].strip()] if output["symptoms"].strip() else []
-    return output
+# Function to analyze a note too long for one model call: its chunks run concurrently and their outputs are merged.
+# Returns the merged output as JSON text so it goes through the same parsing path as a single response.
+def call_chunked_analysis(kind, user_input, max_length=None, priority=None):
+    status = st.status("Splitting long note into sections...")
+    start_time = time.time()
+    try:
+        merged, stats = analyze_long_note(
+            kind, user_input, max_length=max_length, priority=priority,
+            on_chunk=lambda done, total: status.update(label=f"Analyzed {done} of {total} sections...")
+        )
+    except (InferenceError, requests.exceptions.RequestException) as e:
+        report_api_error(e, status)
+        return None
+    except StructuredOutputError as e:
+        status.update(label="No section could be analyzed", state="error")
+        st.error(f"Long note analysis failed: {str(e)}")
+        return None
+    failed = f", {stats['failed']} failed" if stats["failed"] else ""
+    status.update(
+        label=f"Merged {stats['chunks']} sections{failed} in {time.time() - start_time:.2f}s",
+        state="complete"
+    )
+    return json.dumps(merged)
 
-# Function to normalize medication adherence output
-def normalize_medication_output(output):
-    required_keys = [
-        "medication", "dosage", "frequency", "timing", "duration",
-        "patient_concern", "adherence_risk", "recommendation", "refill_date", "action"
-    ]
-    for key in required_keys:
-        if key not in output or not output[key]:
-            if key == "action":
-                output[key] = "Patient education on migraine triggers scheduled + medication access reminder set" if output.get("medication") == "Sumatriptan" else "No action specified"
-            elif key == "refill_date":
-                output[key] = "N/A - as needed" if output.get("medication") == "Sumatriptan" else "N/A"
-            elif key == "adherence_risk":
-                output[key] = "Low" if output.get("medication") == "Sumatriptan" else "Unknown"
-            elif key == "patient_concern":
-                output[key] = "None reported"
-            elif key == "recommendation":
-                output[key] = "Keep medication accessible + migraine trigger tracking app" if output.get("medication") == "Sumatriptan" else "Not specified"
-            elif key == "frequency" and output.get("medication") == "Sumatriptan":
-                output[key] = "as needed"
-            elif key == "frequency":
-                output[key] = "Not specified"
-            elif key == "timing" and output.get("medication") == "Sumatriptan":
-                output[key] = "at onset of migraine"
-            elif key == "duration" and output.get("medication") == "Sumatriptan":
-                output[key] = "as needed for migraines"
-            else:
-                output[key] = "Not specified"
-    return output
+# Function to run one analysis: long notes are chunked, everything else is a single (streamed) model call.
+# max_length defaults to the analysis kind's generation budget and priority to the kind's scheduler class.
+def call_analysis(kind, user_input, max_length=None, stream_to=None, stream_fields=(), priority=None):
+    if needs_chunking(user_input):
+        return call_chunked_analysis(kind, user_input, max_length=max_length, priority=priority)
+    return call_huggingface_api(
+        build_prompt(kind, user_input), max_length=max_length or generation_budget(kind),
+        stream_to=stream_to, stream_fields=stream_fields, priority=priority
+    )
 
-# Function to normalize mental health output
-def normalize_mental_health_output(output):
-    required_keys = [
-        "risk_phrases", "symptoms", "risk_level", "suicide_risk",
-        "recommended_response", "suggested_resources", "action"
-    ]
-    for key in required_keys:
-        if key not in output:
-            if key in ["risk_phrases", "symptoms", "suggested_resources"]:
-                output[key] = []
-            elif key == "action":
-                output[key] = "No action specified"
-            else:
-                output[key] = "Unknown"
-    return output
+# Function to lay out a medication plan's dose times for the next CALENDAR_DAYS days as {"Date", "Doses"} rows
+def medication_calendar(output):
+    now = datetime.now()
+    scheduled = schedule_frame(medication_frame([output]), now)
+    calendar = dose_calendar(scheduled, now, now + timedelta(days=CALENDAR_DAYS))
+    days = {}
+    for scheduled_at in calendar["scheduled_at"]:
+        days.setdefault(scheduled_at.strftime("%a %b %d"), []).append(scheduled_at.strftime("%H:%M"))
+    return [{"Date": day, "Doses": ", ".join(times)} for day, times in days.items()]
 
-# Function to fetch analytics data using Hugging Face API
+# Function to fetch analytics data using Hugging Face API. It runs on AnalyticsCache's refresh thread, which has no
+# script context, so it makes no st.* calls: a failed call or unparseable payload raises and the cache keeps its last
+# good value.
 def get_analytics_from_gpt():
-    prompt = """
-You are an AI assistant that generates structured healthcare analytics data in JSON format. Generate analytics data for a healthcare dashboard with the following sections:
-- Automated Triage System (total cases, urgency distribution, accuracy rate, avg processing time)
-- Medication Adherence Assistant (adherence improvement, total reminders sent, most common medications, avg reminder response)
-- Mental Health Crisis Detector (risk levels, intervention success rate, response time)
-- Clinical Report Generator (total reports, avg completion time, error rate, physician satisfaction)
-Ensure that 'most_common_medications' is a dictionary with medication names as keys and counts as values.
-Return the response as a structured JSON object enclosed in triple backticks (```json\n...\n```). Example:
-```json
-{
-  "triage_stats": {
-    "total_cases": 600,
-    "urgency_distribution": {"Critical": 90, "High": 160, "Medium": 200, "Low": 150},
-    "accuracy_rate": 95.0,
-    "avg_processing_time": 3.0
-  },
-  "medication_stats": {
-    "adherence_improvement": 37,
-    "total_reminders_sent": 12453,
-    "most_common_medications": {"Metformin": 245, "Lisinopril": 198, "Atorvastatin": 176, "Levothyroxine": 145, "Amlodipine": 121},
-    "avg_reminder_response": 85.7
-  },
-  "mental_health_stats": {...},
-  "report_stats": {...}
-}
-```
-"""
-    response_text = call_huggingface_api(prompt, max_length=800)
-    if response_text:
+    # Analytics has its own TTL cache, so always ask the model for a fresh payload here
+    response_text = get_engine().generate(
+        render_prompt("analytics"), max_length=generation_budget("analytics"), use_cache=False
+    )
+    return parse_structured_output(response_text, "analytics")
+
+# Process-wide analytics cache: serves the last payload instantly and refreshes it in the background once stale
+class AnalyticsCache:
+    def __init__(self, loader, initial, ttl=ANALYTICS_TTL_SECONDS):
+        self.loader = loader
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._value = initial
+        self._loaded_at = 0.0
+        self._refreshing = False
+
+    def get(self):
+        with self._lock:
+            if time.time() - self._loaded_at >= self.ttl and not self._refreshing:
+                self._refreshing = True
+                threading.Thread(target=self._refresh, daemon=True).start()
+            return self._value
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = 0.0
+
+    # A loader that raises or returns None leaves the previous payload in place until the next refresh
+    def _refresh(self):
         try:
-            json_str = response_text.strip()
-            if json_str.startswith("```json"):
-                json_str = json_str[7:-3].strip()
-            analytics = json.loads(json_str)
-            if validate_analytics(analytics):
-                return analytics
-            else:
-                st.error("Analytics data missing required keys. Using default analytics.")
-                return default_analytics
-        except json.JSONDecodeError as e:
-            st.error(f"Failed to parse analytics JSON: {str(e)}")
-            return default_analytics
-        except Exception as e:
-            st.error(f"Unexpected error parsing analytics: {str(e)}")
-            return default_analytics
-    return default_analytics
+            value = self.loader()
+        except Exception:
+            value = None
+        with self._lock:
+            if value is not None and validate_analytics(value):
+                self._value = value
+            self._loaded_at = time.time()
+            self._refreshing = False
 
 # Function to load Lottie animations (using placeholder since network calls aren't allowed)
 def load_lottieurl(url):
@@ -490,25 +535,20 @@ default_analytics = {
     }
 }
 
+# Shared across sessions so reruns read the cached payload instead of calling the model
+@st.cache_resource
+def get_analytics_cache():
+    return AnalyticsCache(get_analytics_from_gpt, default_analytics)
+
 # Fetch analytics data
-analytics = get_analytics_from_gpt()
+if ANALYTICS_SOURCE == "model":
+    analytics = get_analytics_cache().get()
+else:
+    analytics = build_analytics(get_event_store(), default_analytics, reminders_sent=get_ledger().count_sent())
 if not validate_analytics(analytics):
     st.error("Invalid analytics data structure. Using default analytics.")
     analytics = default_analytics
 
-# Function to display loading animation
-def loading_animation():
-    with st.spinner('Processing...'):
-        cols = st.columns([1, 1, 1, 1, 1])
-        for i in range(3):
-            for j, col in enumerate(cols[:3]):
-                if i == 0:
-                    with col:
-                        st.markdown(f"<div class='loader-dot'></div>", unsafe_allow_html=True)
-                    time.sleep(0.1)
-                else:
-                    time.sleep(0.1)
-
 # Function to display a metric card
 def metric_card(title, value, change=None, is_positive=True):
     change_html = ""
@@ -525,6 +565,67 @@ def metric_card(title, value, change=None, is_positive=True):
     </div>
     """
 
+# Function to build a donut chart from a {label: count} distribution
+def build_pie_figure(spec):
+    import plotly.express as px
+
+    fig = px.pie(
+        names=list(spec["data"].keys()),
+        values=list(spec["data"].values()),
+        title=spec["title"],
+        color=list(spec["data"].keys()),
+        color_discrete_map=spec["colors"],
+        hole=0.4
+    )
+    fig.update_layout(legend=dict(orientation="h", yanchor="bottom", y=-0.2, xanchor="center", x=0.5))
+    return fig
+
+# Function to build a trend line chart, with an optional dashed target line
+def build_line_figure(spec):
+    import plotly.express as px
+
+    fig = px.line(x=spec["x"], y=spec["y"], title=spec["title"], markers=True)
+    fig.update_layout(xaxis_title="", yaxis_title="")
+    fig.update_traces(line_color=spec["color"])
+    if spec.get("target") is not None:
+        fig.add_hline(y=spec["target"], line_dash="dash", line_color="gray", annotation_text="Target")
+    return fig
+
+# Function to build a single-series bar chart
+def build_bar_figure(spec):
+    import plotly.express as px
+
+    fig = px.bar(x=spec["x"], y=spec["y"], title=spec["title"], color_discrete_sequence=[spec["color"]])
+    fig.update_layout(xaxis_title="", yaxis_title=spec["yaxis_title"])
+    return fig
+
+FIGURE_BUILDERS = {"pie": build_pie_figure, "line": build_line_figure, "bar": build_bar_figure}
+
+# Built figures are keyed by page, chart and a content hash of their data, and shared by every session, so callers
+# must treat them as read-only. The Figure itself is cached rather than its JSON: st.plotly_chart serializes whatever
+# it is given, and rebuilds a dict or JSON spec into a validated Figure first, so for a bar chart that takes 66 ms to
+# build, rendering cached JSON would cost about 21 ms per rerun against 3 ms for the cached Figure.
+@st.cache_resource(max_entries=FIGURE_CACHE_SIZE, show_spinner=False)
+def cached_figure(page, chart, kind, spec_hash, _spec_json):
+    return FIGURE_BUILDERS[kind](json.loads(_spec_json))
+
+# Function to fetch a chart figure, building it only when its data has changed
+def chart_figure(page, chart, kind, **spec):
+    spec_json = json.dumps(spec, sort_keys=True, default=str)
+    spec_hash = hashlib.sha256(spec_json.encode("utf-8")).hexdigest()
+    return cached_figure(page, chart, kind, spec_hash, spec_json)
+
+# Function to show the local risk-phrase scan: provisional level and highlighted passages
+def show_risk_preview(assessment):
+    if not assessment["counts"]:
+        st.caption("Risk lexicon: no risk phrases found")
+        return
+    total = sum(assessment["counts"].values())
+    st.markdown(f"**Provisional risk (lexicon): {assessment['risk_level']}** - {total} matches of "
+                f"{len(assessment['counts'])} risk phrases")
+    for snippet in highlight_spans(assessment["spans"]):
+        st.markdown(f"<div style='font-size: 13px; margin-bottom: 6px;'>{snippet}</div>", unsafe_allow_html=True)
+
 # Function to handle contact information for notifications
 def handle_contact_info(email, phone):
     # Store in session state
@@ -543,12 +644,6 @@ Duration: {output['duration']}
 Next Refill: {output['refill_date']}
 """
 
-    # ------------------ SMTP Email Part ------------------
-    smtp_server = "smtp.gmail.com"
-    smtp_port = 587
-    sender_email = "amennahali8@gmail.com"
-    sender_password = "vifntmdgfjgnqzen"
-
     subject = "Thank you for providing your contact info"
     body = f"""
 Hello,
@@ -560,90 +655,25 @@ Email: {email}
 Best regards,
 Your Healthcare App
 """
-
-    msg = MIMEText(body)
-    msg["From"] = sender_email
-    msg["To"] = email
-    msg["Subject"] = subject
-
-    try:
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.starttls()
-        server.login(sender_email, sender_password)
-        server.sendmail(sender_email, email, msg.as_string())
-        server.quit()
-        st.success("✅ Email sent successfully")
-    except Exception as e:
-        st.error(f"❌ Email failed: {e}")
-
-    # ------------------ Twilio SMS Part ------------------
-    account_sid = ""
-    auth_token = ""
-    twilio_number = "+12183001925"  # Your Twilio number
     suffix = med_details if med_details else "We'll be in touch."
     sms_body = f"Hi! Your contact info was received. {suffix}"
 
-    try:
-        client = Client(account_sid, auth_token)
-        message = client.messages.create(
-            body=sms_body,
-            from_=twilio_number,
-            to=phone
-        )
-        st.success("✅ SMS sent: " + message.sid)
-    except Exception as e:
-        st.error(f"❌ SMS failed: {e}")
+    # Email and SMS are sent by the background dispatcher; the click returns immediately
+    job_id = get_dispatcher().submit(email=email, phone=phone, subject=subject, body=body, sms_body=sms_body)
+    st.session_state["notification_job"] = job_id
+    st.success(f"✅ Notifications queued (job {job_id})")
 
-# Function to generate PDF report
-def generate_pdf_report(output):
-    buffer = BytesIO()
-    c = canvas.Canvas(buffer, pagesize=letter)
-    c.setFont("Helvetica", 12)
-    y = 750
-    c.drawString(50, y, "Structured Clinical Report")
-    y -= 30
-    
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(50, y, "Patient Information")
-    c.setFont("Helvetica", 12)
-    y -= 20
-    for key, value in output.get("patient_demographics", {}).items():
-        c.drawString(50, y, f"{key.title()}: {value}")
-        y -= 20
-    if "diagnosis" in output:
-        c.drawString(50, y, f"Diagnosis: {output['diagnosis']}")
-        y -= 20
-    
-    y -= 20
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(50, y, "Clinical Findings")
-    c.setFont("Helvetica", 12)
-    y -= 20
-    for key, value in output.get("vital_signs", {}).items():
-        c.drawString(50, y, f"{key}: {value}")
-        y -= 20
-    if "medications" in output:
-        c.drawString(50, y, "Medications:")
-        y -= 20
-        for med in output["medications"]:
-            c.drawString(50, y, f"- {med['name']} {med['dosage']} {med['frequency']}")
-            y -= 20
-    
-    y -= 20
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(50, y, "Follow-up Plan")
-    c.setFont("Helvetica", 12)
-    y -= 20
-    follow_up = output.get("follow_up", {})
-    c.drawString(50, y, f"When: In {follow_up.get('timeframe', 'N/A')} with {follow_up.get('provider', 'Provider')}")
-    y -= 20
-    if "action" in output:
-        c.drawString(50, y, f"Action: {output['action']}")
-    
-    c.showPage()
-    c.save()
-    buffer.seek(0)
-    return buffer
+# Function to show the status of the last notification job
+def show_notification_status(job_id):
+    job = get_dispatcher().job(job_id)
+    if job is None:
+        return
+    icons = {"queued": "⏳", "sending": "📤", "done": "✅", "failed": "❌"}
+    st.markdown(f"{icons[job['status']]} **Notification job {job_id}:** {job['status']}")
+    st.markdown(f"- Email: {job['email']}")
+    st.markdown(f"- SMS: {job['sms']}")
+    if job["status"] in ("queued", "sending"):
+        st.button("🔄 Refresh notification status")
 
 # Sidebar for navigation
 with st.sidebar:
@@ -674,6 +704,35 @@ with st.sidebar:
     st.markdown("---")
     st.subheader("System Status")
     st.markdown("✅ All systems operational")
+    cache_stats = get_client().cache.stats()
+    st.caption(f"Response cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses ({cache_stats['hit_rate']}%)")
+    pdf_stats = pdf_cache.stats()
+    st.caption(f"PDF cache: {pdf_stats['entries']} reports, {pdf_stats['bytes'] // 1024} KiB ({pdf_stats['hit_rate']}% hits)")
+    engine_stats = get_engine().stats()
+    st.caption(f"Inference ({engine_stats['backend']}): {engine_stats['in_flight']} in flight, {engine_stats['coalesced']} duplicate requests coalesced")
+    scheduler_stats = get_engine().scheduler.snapshot()
+    waits = ", ".join(
+        f"{cls} {counts['wait_p95']}s" for cls, counts in scheduler_stats["classes"].items() if counts["started"]
+    )
+    st.caption(f"Scheduler: {scheduler_stats['queued']} queued (peak {scheduler_stats['peak_queued']})"
+               f"{f'; p95 wait {waits}' if waits else ''}")
+    parse_counts = parse_stats.snapshot()
+    if parse_counts:
+        failed = sum(c["failed"] for c in parse_counts.values())
+        total = sum(c["total"] for c in parse_counts.values())
+        st.caption(f"Structured output: {failed}/{total} responses unparseable ({round(100 * failed / total, 1)}%)")
+    prompt_counts = prompt_stats.snapshot()
+    if prompt_counts:
+        with st.expander("Prompt templates"):
+            for key, counts in sorted(prompt_counts.items()):
+                latency = f", {counts['avg_latency']}s avg over {counts['calls']} calls" if counts["calls"] else ""
+                st.caption(
+                    f"{key}: {counts['avg_prompt_tokens']:.0f} tokens/prompt "
+                    f"({counts['static_share']}% template){latency}"
+                )
+    if ANALYTICS_SOURCE == "model" and st.button("🔄 Refresh analytics"):
+        get_analytics_cache().invalidate()
+        st.rerun()
     
     st.markdown("---")
     with st.expander("Help & Support"):
@@ -716,70 +775,42 @@ if selected == "Automated Triage System":
         user_input = st.text_area("Enter clinical note (Patient Data Entry):", "Patient reports severe chest pain radiating to left arm, shortness of breath, and dizziness for the past 30 minutes. History of hypertension.", height=150)
         
         if st.button("Analyze Clinical Note"):
-            with st.spinner():
-                start_time = time.time()
-                loading_animation()
-                
-                prompt = f"""
-You are a medical AI assistant specialized in triage analysis. Analyze the following clinical note and provide a structured triage assessment in JSON format. The response must exactly match the structure and detail level of the following example:
-```json
-{{
-  "symptoms": ["chest pain", "radiation to left arm", "shortness of breath", "dizziness"],
-  "duration": "30 minutes",
-  "medical_history": ["hypertension"],
-  "urgency": "Critical",
-  "triage_category": "1",
-  "recommended_tests": ["ECG", "Cardiac enzymes", "Chest X-ray"],
-  "potential_diagnosis": ["Acute Myocardial Infarction", "Angina", "Aortic Dissection"],
-  "action": "Cardiac alert sent to EHR and cardiology team notified"
-}}
-```
-Requirements:
-- "symptoms": Always return as a list of detailed symptoms. If the clinical note is vague (e.g., "chest pain"), infer additional related symptoms (e.g., "shortness of breath", "dizziness") based on medical likelihood.
-- "duration": Provide a reasonable duration if not specified (e.g., "N/A" or an inferred value like "acute").
-- "medical_history": Infer a plausible medical history if not specified (e.g., ["hypertension"] for chest pain cases).
-- "urgency": Choose from "Critical", "High", "Medium", "Low". Use "Critical" for severe cases like chest pain unless specified otherwise.
-- "triage_category": Assign a number from 1 to 5, where 1 is most urgent. Use "1" for critical cases.
-- "recommended_tests": Provide a list of relevant tests (e.g., ["ECG", "Cardiac enzymes"] for cardiac issues).
-- "potential_diagnosis": Always provide a list of at least two plausible diagnoses (e.g., ["Acute Myocardial Infarction", "Angina"]). Never return an empty list.
-- "action": Provide a complete sentence describing the automated action (e.g., "Cardiac alert sent to EHR").
-Clinical note: "{user_input}"
-Return the response in JSON format, enclosed in triple backticks (```json\n...\n```).
-"""
-                response_text = call_huggingface_api(prompt, max_length=800)
+            start_time = time.time()
+            used_fallback = True
+            
+            # Local rules run first: red flags show instantly, confident routine cases skip the model
+            provisional = pretriage(user_input)
+            st.session_state["triage_pretriage"] = provisional
+            if provisional["urgency"] == "Critical" and provisional["confident"]:
+                col2.error(f"🚨 Provisional triage: CRITICAL (category 1) - {', '.join(provisional['matched'])}. Full analysis in progress...")
+            fallback = pretriage_output(provisional) if provisional["urgency"] else fallback_output("triage")
+            
+            if provisional["confident"] and provisional["urgency"] in PRETRIAGE_SHORT_CIRCUIT:
+                st.session_state["triage_output"] = normalize_triage_output(fallback)
+                used_fallback = False
+            else:
+                response_text = call_analysis(
+                    "triage", user_input,
+                    stream_to=col2.empty() if STREAM_RESPONSES else None,
+                    stream_fields=("urgency", "triage_category", "potential_diagnosis"),
+                    priority=triage_priority(provisional["urgency"])
+                )
                 if response_text:
                     try:
-                        json_str = response_text.strip()
-                        if json_str.startswith("```json"):
-                            json_str = json_str[7:-3].strip()
-                        triage_output = json.loads(json_str)
+                        triage_output = parse_structured_output(response_text, "triage")
                         triage_output = normalize_triage_output(triage_output)
                         st.session_state["triage_output"] = triage_output
-                    except json.JSONDecodeError as e:
+                        used_fallback = False
+                    except StructuredOutputError as e:
                         st.error(f"Failed to parse triage JSON: {str(e)}")
-                        st.session_state["triage_output"] = normalize_triage_output({
-                            "symptoms": ["chest pain", "radiation to left arm", "shortness of breath", "dizziness"],
-                            "duration": "30 minutes",
-                            "medical_history": ["hypertension"],
-                            "urgency": "Critical",
-                            "triage_category": "1",
-                            "recommended_tests": ["ECG", "Cardiac enzymes", "Chest X-ray"],
-                            "potential_diagnosis": ["Acute Myocardial Infarction", "Angina", "Aortic Dissection"],
-                            "action": "Cardiac alert sent to EHR and cardiology team notified"
-                        })
+                        st.session_state["triage_output"] = normalize_triage_output(fallback)
                 else:
-                    st.session_state["triage_output"] = normalize_triage_output({
-                        "symptoms": ["chest pain", "radiation to left arm", "shortness of breath", "dizziness"],
-                        "duration": "30 minutes",
-                        "medical_history": ["hypertension"],
-                        "urgency": "Critical",
-                        "triage_category": "1",
-                        "recommended_tests": ["ECG", "Cardiac enzymes", "Chest X-ray"],
-                        "potential_diagnosis": ["Acute Myocardial Infarction", "Angina", "Aortic Dissection"],
-                        "action": "Cardiac alert sent to EHR and cardiology team notified"
-                    })
-                
-                st.session_state["triage_processing_time"] = round(time.time() - start_time, 2)
+                    st.session_state["triage_output"] = normalize_triage_output(fallback)
+            
+            st.session_state["triage_processing_time"] = round(time.time() - start_time, 2)
+            get_event_store().record(
+                "triage", st.session_state["triage_output"], st.session_state["triage_processing_time"], fallback=used_fallback
+            )
     
     with col2:
         st.subheader("AI Analysis & Action Plan")
@@ -797,6 +828,10 @@ Return the response in JSON format, enclosed in triple backticks (```json\n...\n
                 urgency_badge = '<span class="status-low">⚠️ LOW</span>'
                 
             st.markdown(f"### Triage Assessment {urgency_badge}", unsafe_allow_html=True)
+            provisional = st.session_state.get("triage_pretriage")
+            if provisional and provisional["urgency"]:
+                st.caption(f"Pre-triage rules: {provisional['urgency']} ({', '.join(provisional['matched'])})"
+                           f"{'' if provisional['confident'] else ', low confidence'}")
             
             st.markdown("#### Identified Symptoms")
             symptoms_list = ", ".join([f"**{s}**" for s in output["symptoms"]]) if output["symptoms"] else "None identified"
@@ -823,40 +858,79 @@ Return the response in JSON format, enclosed in triple backticks (```json\n...\n
     
     st.markdown('</div>', unsafe_allow_html=True)
     
+    st.markdown('<div class="stCard">', unsafe_allow_html=True)
+    st.subheader("Batch Triage")
+    st.markdown("Upload a CSV (with a `note` column) or JSONL (with a `note` field) of queued intake notes.")
+    
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        batch_file = st.file_uploader("Intake notes file", type=["csv", "jsonl"], label_visibility="collapsed")
+    with col2:
+        batch_workers = st.number_input("Concurrent requests", min_value=1, max_value=32, value=BATCH_MAX_WORKERS)
+    
+    if batch_file is not None and st.button("Run Batch Triage"):
+        records = load_notes(batch_file.getvalue().decode("utf-8"), batch_file.name)
+        progress = st.progress(0.0, text=f"Triaging {len(records)} notes...")
+        throughput = st.empty()
+        table = st.empty()
+        rows = []
+        start_time = time.time()
+        for row in run_batch(records, max_workers=int(batch_workers)):
+            rows.append(row)
+            elapsed = time.time() - start_time
+            progress.progress(len(rows) / len(records), text=f"Triaged {len(rows)} of {len(records)} notes")
+            throughput.metric("Throughput", f"{len(rows) / elapsed:.2f} notes/sec" if elapsed > 0 else "-")
+            table.dataframe(results_frame(rows), use_container_width=True, hide_index=True)
+        st.session_state["batch_triage_results"] = results_frame(rows)
+        st.session_state["batch_triage_rate"] = round(len(rows) / (time.time() - start_time), 2) if rows else 0.0
+    elif "batch_triage_results" in st.session_state:
+        st.metric("Throughput", f"{st.session_state['batch_triage_rate']} notes/sec")
+        st.dataframe(st.session_state["batch_triage_results"], use_container_width=True, hide_index=True)
+    
+    if "batch_triage_results" in st.session_state:
+        st.download_button(
+            label="Download Results (CSV)",
+            data=st.session_state["batch_triage_results"].to_csv(index=False),
+            file_name="batch_triage_results.csv",
+            mime="text/csv"
+        )
+    
+    st.markdown('</div>', unsafe_allow_html=True)
+    
     st.markdown('<div class="stCard">', unsafe_allow_html=True)
     st.subheader("Triage Analytics")
     
     col1, col2 = st.columns(2)
     
     with col1:
-        fig = px.pie(
-            names=list(analytics["triage_stats"]["urgency_distribution"].keys()),
-            values=list(analytics["triage_stats"]["urgency_distribution"].values()),
+        fig = chart_figure(
+            "triage", "urgency_distribution", "pie",
+            data=analytics["triage_stats"]["urgency_distribution"],
             title="Urgency Distribution",
-            color=list(analytics["triage_stats"]["urgency_distribution"].keys()),
-            color_discrete_map={
+            colors={
                 "Critical": "#EF4444", 
                 "High": "#F59E0B", 
                 "Medium": "#3B82F6", 
                 "Low": "#10B981"
-            },
-            hole=0.4
+            }
         )
-        fig.update_layout(legend=dict(orientation="h", yanchor="bottom", y=-0.2, xanchor="center", x=0.5))
         st.plotly_chart(fig, use_container_width=True)
         
     with col2:
         days = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
         processing_times = [3.4, 3.3, 3.5, 3.2, 3.1, 2.9, 3.0]
+        if ANALYTICS_SOURCE == "events" and get_event_store().totals("triage")["count"]:
+            daily = get_event_store().daily("triage")
+            days = [datetime.strptime(day, "%Y-%m-%d").strftime("%a") for day, _, _ in daily]
+            processing_times = [avg_time for _, _, avg_time in daily]
         
-        fig = px.line(
+        fig = chart_figure(
+            "triage", "processing_trend", "line",
             x=days, 
             y=processing_times,
             title="Processing Time Trend (seconds)",
-            markers=True
+            color="#3B82F6"
         )
-        fig.update_layout(xaxis_title="", yaxis_title="")
-        fig.update_traces(line_color="#3B82F6")
         st.plotly_chart(fig, use_container_width=True)
     
     st.markdown('</div>', unsafe_allow_html=True)
@@ -906,81 +980,62 @@ elif selected == "Medication Adherence Assistant":
             else:
                 st.error("Please provide both email and phone number.")
         
+        if "notification_job" in st.session_state:
+            show_notification_status(st.session_state["notification_job"])
+        
         if st.button("Process Prescription"):
-            with st.spinner():
-                start_time = time.time()
-                loading_animation()
-                
-                prompt = f"""
-You are an AI assistant that generates structured medication adherence plans in JSON format. Analyze the following prescription and provide a structured medication adherence plan exactly matching this structure:
-```json
-{{
-  "medication": "Sumatriptan",
-  "dosage": "50mg",
-  "frequency": "as needed",
-  "timing": "at onset of migraine",
-  "duration": "as needed for migraines",
-  "patient_concern": "None reported",
-  "adherence_risk": "Low",
-  "recommendation": "Keep medication accessible + migraine trigger tracking app",
-  "refill_date": "N/A - as needed",
-  "action": "Patient education on migraine triggers scheduled + medication access reminder set"
-}}
-```
-Requirements:
-- Always return a complete JSON structure with all fields, even if the prescription lacks details.
-- "medication": Extract the medication name as a string (e.g., "Sumatriptan").
-- "dosage": Extract the dosage as a string (e.g., "50mg").
-- "frequency": If not specified, infer based on the medication. For Sumatriptan, use "as needed".
-- "timing": If not specified, infer based on the medication. For Sumatriptan, use "at onset of migraine".
-- "duration": If not specified, infer based on the medication. For Sumatriptan, use "as needed for migraines".
-- "patient_concern": If none reported, use "None reported". If a concern is mentioned, extract it.
-- "adherence_risk": Assess as "Low", "Medium", or "High". Use "Low" for as-needed medications like Sumatriptan unless concerns are reported.
-- "recommendation": Provide a string with a practical suggestion. For Sumatriptan, suggest "Keep medication accessible + migraine trigger tracking app" unless a specific concern suggests otherwise.
-- "refill_date": Calculate as YYYY-MM-DD, assuming today is {datetime.now().strftime('%Y-%m-%d')}. For as-needed medications like Sumatriptan, use "N/A - as needed".
-- "action": Provide a complete sentence. For Sumatriptan, use "Patient education on migraine triggers scheduled + medication access reminder set" unless a specific concern suggests a different action.
-Prescription: "{user_input}"
-Return the response in JSON format, enclosed in triple backticks (```json\n...\n```).
-"""
-                response_text = call_huggingface_api(prompt, max_length=800)
+            start_time = time.time()
+            used_fallback = True
+            
+            # Known drugs are parsed locally; the model is only asked about what the sig rules could not read
+            prescription = parse_prescription(user_input)
+            if prescription["local"]:
+                st.session_state["med_output"] = normalize_medication_output(prescription["output"])
+                st.session_state["med_source"] = "Parsed locally"
+                used_fallback = False
+            elif prescription["drug"] and not needs_chunking(user_input):
+                med_output = prescription["output"]
+                st.session_state["med_source"] = "Parsed locally"
+                response_text = call_huggingface_api(
+                    build_medication_concern_prompt(user_input, med_output),
+                    max_length=generation_budget("medication_concern"),
+                    stream_to=col2.empty() if STREAM_RESPONSES else None,
+                    stream_fields=("patient_concern", "adherence_risk")
+                )
                 if response_text:
                     try:
-                        json_str = response_text.strip()
-                        if json_str.startswith("```json"):
-                            json_str = json_str[7:-3].strip()
-                        med_output = json.loads(json_str)
+                        merge_medication_concern(med_output, response_text)
+                        st.session_state["med_source"] = "Parsed locally, concern and guidance from the model"
+                    except StructuredOutputError as e:
+                        st.warning(f"Failed to parse the model's adherence notes: {str(e)}. Using the drug's default guidance.")
+                st.session_state["med_output"] = normalize_medication_output(med_output)
+                used_fallback = False
+            else:
+                st.session_state["med_source"] = "Model"
+                response_text = call_analysis(
+                    "medication", user_input,
+                    stream_to=col2.empty() if STREAM_RESPONSES else None,
+                    stream_fields=("medication", "dosage", "frequency", "adherence_risk")
+                )
+                if response_text:
+                    try:
+                        med_output = parse_structured_output(response_text, "medication")
                         med_output = normalize_medication_output(med_output)
+                        # Refill dates come from the schedule engine rather than the model's date arithmetic
+                        med_output["refill_date"] = plan_refill_date(med_output)
                         st.session_state["med_output"] = med_output
-                    except (json.JSONDecodeError, KeyError) as e:
+                        used_fallback = False
+                    except StructuredOutputError as e:
                         st.error(f"Failed to parse medication JSON: {str(e)}. Using fallback output.")
-                        st.session_state["med_output"] = normalize_medication_output({
-                            "medication": "Sumatriptan",
-                            "dosage": "50mg",
-                            "frequency": "as needed",
-                            "timing": "at onset of migraine",
-                            "duration": "as needed for migraines",
-                            "patient_concern": "None reported",
-                            "adherence_risk": "Low",
-                            "recommendation": "Keep medication accessible + migraine trigger tracking app",
-                            "refill_date": "N/A - as needed",
-                            "action": "Patient education on migraine triggers scheduled + medication access reminder set"
-                        })
+                        st.session_state["med_output"] = fallback_output("medication")
                 else:
                     st.error("Hugging Face API returned no response. Using fallback output.")
-                    st.session_state["med_output"] = normalize_medication_output({
-                        "medication": "Sumatriptan",
-                        "dosage": "50mg",
-                        "frequency": "as needed",
-                        "timing": "at onset of migraine",
-                        "duration": "as needed for migraines",
-                        "patient_concern": "None reported",
-                        "adherence_risk": "Low",
-                        "recommendation": "Keep medication accessible + migraine trigger tracking app",
-                        "refill_date": "N/A - as needed",
-                        "action": "Patient education on migraine triggers scheduled + medication access reminder set"
-                    })
-                
-                st.session_state["med_processing_time"] = round(time.time() - start_time, 2)
+                    st.session_state["med_output"] = fallback_output("medication")
+            
+            st.session_state["med_processing_time"] = round(time.time() - start_time, 2)
+            get_event_store().record(
+                "medication", st.session_state["med_output"], st.session_state["med_processing_time"], fallback=used_fallback
+            )
     
     with col2:
         st.subheader("Medication Schedule & Reminders")
@@ -999,11 +1054,18 @@ Return the response in JSON format, enclosed in triple backticks (```json\n...\n
             
             st.markdown("#### Medication Details")
             st.markdown(f"**Medication:** {output['medication']} {output['dosage']}")
+            if output.get("route"):
+                st.markdown(f"**Route:** {output['route']}")
             st.markdown(f"**Schedule:** {output['frequency']} {output['timing']}")
             st.markdown(f"**Duration:** {output['duration']}")
             
             st.markdown(f"**Next Refill:** {output['refill_date']}")
             
+            calendar = medication_calendar(output)
+            if calendar:
+                st.markdown(f"#### Dose Calendar (next {CALENDAR_DAYS} days)")
+                st.table(calendar)
+            
             st.markdown("#### Adherence Challenge")
             st.markdown(f"_{output['patient_concern']}_")
             
@@ -1020,12 +1082,41 @@ Return the response in JSON format, enclosed in triple backticks (```json\n...\n
                 st.info("Use these details to implement notification or medicine time functions.")
             
             processing_time = st.session_state.get("med_processing_time", 2.8)
+            if "med_source" in st.session_state:
+                st.caption(f"Source: {st.session_state['med_source']}")
             st.markdown(f"<div style='text-align: right; color: #64748B; font-size: 12px; margin-top: 20px;'>Processed in {processing_time} seconds</div>", unsafe_allow_html=True)
         else:
             st.info("Enter a prescription and click 'Process Prescription' to see AI-generated medication schedule.")
     
     st.markdown('</div>', unsafe_allow_html=True)
     
+    st.markdown('<div class="stCard">', unsafe_allow_html=True)
+    st.subheader("Reminder Campaign")
+    st.markdown("Upload a patient CSV (`patient_id, email, phone, medication, dosage, frequency, timing, refill_date`) to send every reminder due in the next 24 hours.")
+    
+    campaign_file = st.file_uploader("Patient medication file", type=["csv"], label_visibility="collapsed")
+    if campaign_file is not None:
+        deliveries = due_reminders(load_patient_rows(campaign_file.getvalue().decode("utf-8")))
+        st.markdown(f"**{len(deliveries)}** reminder deliveries due.")
+        if deliveries and st.button("Start Reminder Campaign"):
+            campaign = new_campaign()
+            campaign.start(deliveries)
+            st.session_state["reminder_campaign"] = campaign
+    
+    if "reminder_campaign" in st.session_state:
+        stats = st.session_state["reminder_campaign"].stats()
+        col1, col2, col3, col4, col5 = st.columns(5)
+        col1.metric("Sent", stats["sent"])
+        col2.metric("Failed", stats["failed"])
+        col3.metric("Retried", stats["retried"])
+        col4.metric("Already Sent", stats["skipped"])
+        col5.metric("Throughput", f"{stats['per_sec']} msgs/sec")
+        if stats["running"]:
+            st.progress((stats["total"] - stats["remaining"]) / stats["total"], text=f"{stats['remaining']} remaining")
+            st.button("🔄 Refresh campaign status")
+    
+    st.markdown('</div>', unsafe_allow_html=True)
+    
     st.markdown('<div class="stCard">', unsafe_allow_html=True)
     st.subheader("Medication Analytics")
     
@@ -1035,28 +1126,28 @@ Return the response in JSON format, enclosed in triple backticks (```json\n...\n
         medications = list(analytics["medication_stats"]["most_common_medications"].keys())
         counts = list(analytics["medication_stats"]["most_common_medications"].values())
         
-        fig = px.bar(
+        fig = chart_figure(
+            "medication", "most_common_medications", "bar",
             x=medications, 
             y=counts,
             title="Most Common Medications",
-            color_discrete_sequence=["#3B82F6"]
+            color="#3B82F6",
+            yaxis_title="Patient Count"
         )
-        fig.update_layout(xaxis_title="", yaxis_title="Patient Count")
         st.plotly_chart(fig, use_container_width=True)
         
     with col2:
         months = ["Jan", "Feb", "Mar", "Apr", "May", "Jun"]
         adherence_rates = [58, 64, 72, 78, 82, 85]
         
-        fig = px.line(
+        fig = chart_figure(
+            "medication", "adherence_rate", "line",
             x=months, 
             y=adherence_rates,
             title="Monthly Adherence Rate (%)",
-            markers=True
+            color="#10B981",
+            target=60
         )
-        fig.update_layout(xaxis_title="", yaxis_title="")
-        fig.update_traces(line_color="#10B981")
-        fig.add_hline(y=60, line_dash="dash", line_color="gray", annotation_text="Target")
         st.plotly_chart(fig, use_container_width=True)
     
     st.markdown('</div>', unsafe_allow_html=True)
@@ -1095,68 +1186,46 @@ elif selected == "Mental Health Crisis Detector":
         st.subheader("Patient Journal Entry")
         
         user_input = st.text_area("Enter journal entry (Patient Data Entry):", "Patient journal: I've been feeling hopeless and overwhelmed lately. I can't sleep, have no appetite, and don't see any point in continuing. Nothing brings me joy anymore.", height=150)
+        journal_file = st.file_uploader("Or upload a long journal (.txt)", type=["txt"])
         
         if st.button("Analyze Journal Entry"):
-            with st.spinner():
-                start_time = time.time()
-                loading_animation()
-                
-                prompt = f"""
-You are a mental health AI assistant that assesses risk from patient journals. Analyze the following patient journal entry and provide a structured mental health risk assessment in JSON format exactly matching this structure:
-```json
-{{
-  "risk_phrases": ["hopeless", "overwhelmed", "don't see any point in continuing", "nothing brings me joy"],
-  "symptoms": ["insomnia", "appetite loss", "anhedonia", "hopelessness"],
-  "risk_level": "High",
-  "suicide_risk": "Elevated",
-  "recommended_response": "Immediate follow-up within 24 hours",
-  "suggested_resources": ["Crisis helpline", "Emergency psychiatric evaluation", "Safety plan development"],
-  "action": "Crisis counselor notified and safety check scheduled for today"
-}}
-```
-Requirements:
-- "risk_phrases": List phrases indicating risk (e.g., "hopeless"). Return an empty list if none found.
-- "symptoms": List symptoms (e.g., "insomnia"). Return an empty list if none identified.
-- "risk_level": Assess as "Low", "Medium", or "High". Use "High" for severe cases.
-- "suicide_risk": Assess as a string (e.g., "Elevated", "Low to Medium", "Not detected").
-- "recommended_response": Provide a timeframe as a string (e.g., "Immediate follow-up within 24 hours"). Use "Routine follow-up" if risk is low.
-- "suggested_resources": List at least 2 resources (e.g., "Crisis helpline"). Use general resources if risk is low.
-- "action": Provide a complete sentence (e.g., "Crisis counselor notified").
-Journal entry: "{user_input}"
-Return the response in JSON format, enclosed in triple backticks (```json\n...\n```).
-"""
-                response_text = call_huggingface_api(prompt, max_length=800)
-                if response_text:
-                    try:
-                        json_str = response_text.strip()
-                        if json_str.startswith("```json"):
-                            json_str = json_str[7:-3].strip()
-                        mental_output = json.loads(json_str)
-                        mental_output = normalize_mental_health_output(mental_output)
-                        st.session_state["mental_output"] = mental_output
-                    except json.JSONDecodeError as e:
-                        st.error(f"Failed to parse mental health JSON: {str(e)}")
-                        st.session_state["mental_output"] = normalize_mental_health_output({
-                            "risk_phrases": ["hopeless", "overwhelmed", "don't see any point in continuing", "nothing brings me joy"],
-                            "symptoms": ["insomnia", "appetite loss", "anhedonia", "hopelessness"],
-                            "risk_level": "High",
-                            "suicide_risk": "Elevated",
-                            "recommended_response": "Immediate follow-up within 24 hours",
-                            "suggested_resources": ["Crisis helpline", "Emergency psychiatric evaluation", "Safety plan development"],
-                            "action": "Crisis counselor notified and safety check scheduled for today"
-                        })
-                else:
-                    st.session_state["mental_output"] = normalize_mental_health_output({
-                        "risk_phrases": ["hopeless", "overwhelmed", "don't see any point in continuing", "nothing brings me joy"],
-                        "symptoms": ["insomnia", "appetite loss", "anhedonia", "hopelessness"],
-                        "risk_level": "High",
-                        "suicide_risk": "Elevated",
-                        "recommended_response": "Immediate follow-up within 24 hours",
-                        "suggested_resources": ["Crisis helpline", "Emergency psychiatric evaluation", "Safety plan development"],
-                        "action": "Crisis counselor notified and safety check scheduled for today"
-                    })
-                
-                st.session_state["mental_processing_time"] = round(time.time() - start_time, 2)
+            start_time = time.time()
+            used_fallback = True
+            
+            # Local lexicon scan first: matched phrases and a provisional risk level show before the model answers.
+            # Uploaded journals are scanned chunk by chunk.
+            if journal_file is not None:
+                journal_file.seek(0)
+                provisional = assess_risk(get_risk_matcher().scan(iter_chunks(journal_file)))
+                user_input = journal_file.getvalue().decode("utf-8", errors="replace")
+            else:
+                provisional = assess_risk(get_risk_matcher().finditer(user_input))
+            st.session_state["mental_provisional"] = provisional
+            with col2.container():
+                show_risk_preview(provisional)
+            fallback = risk_output(provisional) if provisional["counts"] else fallback_output("mental_health")
+            
+            response_text = call_analysis(
+                "mental_health", user_input,
+                stream_to=col2.empty() if STREAM_RESPONSES else None,
+                stream_fields=("risk_level", "suicide_risk", "risk_phrases")
+            )
+            if response_text:
+                try:
+                    mental_output = parse_structured_output(response_text, "mental_health")
+                    mental_output = normalize_mental_health_output(mental_output)
+                    st.session_state["mental_output"] = mental_output
+                    used_fallback = False
+                except StructuredOutputError as e:
+                    st.error(f"Failed to parse mental health JSON: {str(e)}")
+                    st.session_state["mental_output"] = normalize_mental_health_output(fallback)
+            else:
+                st.session_state["mental_output"] = normalize_mental_health_output(fallback)
+            
+            st.session_state["mental_processing_time"] = round(time.time() - start_time, 2)
+            get_event_store().record(
+                "mental_health", st.session_state["mental_output"], st.session_state["mental_processing_time"], fallback=used_fallback
+            )
     
     with col2:
         st.subheader("Risk Assessment & Action Plan")
@@ -1173,6 +1242,10 @@ Return the response in JSON format, enclosed in triple backticks (```json\n...\n
                 
             st.markdown(f"### Risk Assessment {risk_badge}", unsafe_allow_html=True)
             
+            if "mental_provisional" in st.session_state:
+                with st.expander("Matched journal passages"):
+                    show_risk_preview(st.session_state["mental_provisional"])
+            
             if output["risk_phrases"]:
                 st.markdown("#### Concerning Language")
                 for phrase in output["risk_phrases"]:
@@ -1207,34 +1280,30 @@ Return the response in JSON format, enclosed in triple backticks (```json\n...\n
     col1, col2 = st.columns(2)
     
     with col1:
-        fig = px.pie(
-            names=list(analytics["mental_health_stats"]["risk_levels"].keys()),
-            values=list(analytics["mental_health_stats"]["risk_levels"].values()),
+        fig = chart_figure(
+            "mental_health", "risk_levels", "pie",
+            data=analytics["mental_health_stats"]["risk_levels"],
             title="Risk Level Distribution",
-            color=list(analytics["mental_health_stats"]["risk_levels"].keys()),
-            color_discrete_map={
+            colors={
                 "High": "#EF4444", 
                 "Medium": "#F59E0B", 
                 "Low": "#10B981"
-            },
-            hole=0.4
+            }
         )
-        fig.update_layout(legend=dict(orientation="h", yanchor="bottom", y=-0.2, xanchor="center", x=0.5))
         st.plotly_chart(fig, use_container_width=True)
         
     with col2:
         months = ["Jan", "Feb", "Mar", "Apr", "May", "Jun"]
         intervention_times = [8.2, 7.5, 6.8, 6.1, 5.7, 5.4]
         
-        fig = px.line(
+        fig = chart_figure(
+            "mental_health", "response_time", "line",
             x=months, 
             y=intervention_times,
             title="Avg. Crisis Response Time (hours)",
-            markers=True
+            color="#F59E0B",
+            target=6
         )
-        fig.update_layout(xaxis_title="", yaxis_title="")
-        fig.update_traces(line_color="#F59E0B")
-        fig.add_hline(y=6, line_dash="dash", line_color="gray", annotation_text="Target")
         st.plotly_chart(fig, use_container_width=True)
     
     st.markdown('</div>', unsafe_allow_html=True)
@@ -1275,53 +1344,29 @@ elif selected == "Clinical Report Generator":
         user_input = st.text_area("Enter clinical note (Patient Data Entry):", "Discharge note: Patient is a 65-year-old male admitted for community-acquired pneumonia. Treated with IV antibiotics, now stable. BP 120/80, O2 sat 97% on room air. Continue Amoxicillin 500mg TID for 7 days. Follow up with PCP in 1 week.", height=150)
         
         if st.button("Generate Structured Report"):
-            with st.spinner():
-                start_time = time.time()
-                loading_animation()
-                
-                prompt = f"""
-You are a medical AI assistant that generates structured clinical reports. Convert the following clinical note into a structured medical report in JSON format:
-- Extract patient demographics (age, gender, etc.)
-- Identify diagnosis or visit type (string)
-- Extract treatment (string, if applicable)
-- Record vital signs (dictionary)
-- List medications (list of dictionaries with name, dosage, frequency, duration)
-- Specify follow-up plan (dictionary with provider, timeframe, reason)
-- Propose an action (string)
-Clinical note: "{user_input}"
-Return the response in JSON format, enclosed in triple backticks (```json\n...\n```).
-"""
-                response_text = call_huggingface_api(prompt, max_length=800)
-                if response_text:
-                    try:
-                        json_str = response_text.strip()
-                        if json_str.startswith("```json"):
-                            json_str = json_str[7:-3].strip()
-                        report_output = json.loads(json_str)
-                        st.session_state["report_output"] = report_output
-                    except json.JSONDecodeError as e:
-                        st.error(f"Failed to parse report JSON: {str(e)}")
-                        st.session_state["report_output"] = {
-                            "patient_demographics": {"age": "65", "gender": "male"},
-                            "diagnosis": "Community-acquired pneumonia",
-                            "treatment": "IV antibiotics, now transitioned to oral",
-                            "vital_signs": {"BP": "120/80", "O2 saturation": "97% on room air"},
-                            "medications": [{"name": "Amoxicillin", "dosage": "500mg", "frequency": "TID", "duration": "7 days"}],
-                            "follow_up": {"provider": "PCP", "timeframe": "1 week"},
-                            "action": "Structured report generated and sent to PCP"
-                        }
-                else:
-                    st.session_state["report_output"] = {
-                        "patient_demographics": {"age": "65", "gender": "male"},
-                        "diagnosis": "Community-acquired pneumonia",
-                        "treatment": "IV antibiotics, now transitioned to oral",
-                        "vital_signs": {"BP": "120/80", "O2 saturation": "97% on room air"},
-                        "medications": [{"name": "Amoxicillin", "dosage": "500mg", "frequency": "TID", "duration": "7 days"}],
-                        "follow_up": {"provider": "PCP", "timeframe": "1 week"},
-                        "action": "Structured report generated and sent to PCP"
-                    }
-                
-                st.session_state["report_processing_time"] = round(time.time() - start_time, 2)
+            start_time = time.time()
+            used_fallback = True
+            
+            response_text = call_analysis(
+                "report", user_input,
+                stream_to=col2.empty() if STREAM_RESPONSES else None,
+                stream_fields=("diagnosis", "treatment", "vital_signs")
+            )
+            if response_text:
+                try:
+                    report_output = parse_structured_output(response_text, "report")
+                    st.session_state["report_output"] = report_output
+                    used_fallback = False
+                except StructuredOutputError as e:
+                    st.error(f"Failed to parse report JSON: {str(e)}")
+                    st.session_state["report_output"] = fallback_output("report")
+            else:
+                st.session_state["report_output"] = fallback_output("report")
+            
+            st.session_state["report_processing_time"] = round(time.time() - start_time, 2)
+            get_event_store().record(
+                "report", st.session_state["report_output"], st.session_state["report_processing_time"], fallback=used_fallback
+            )
     
     with col2:
         st.subheader("Structured Report")
@@ -1395,14 +1440,12 @@ Return the response in JSON format, enclosed in triple backticks (```json\n...\n
             st.markdown("#### Export Options")
             col1, col2 = st.columns(2)
             with col1:
-                if st.button("📄 Export as PDF"):
-                    pdf_buffer = generate_pdf_report(output)
-                    st.download_button(
-                        label="Download PDF",
-                        data=pdf_buffer,
-                        file_name="clinical_report.pdf",
-                        mime="application/pdf"
-                    )
+                st.download_button(
+                    label="📄 Export as PDF",
+                    data=cached_report_pdf(output),
+                    file_name="clinical_report.pdf",
+                    mime="application/pdf"
+                )
             with col2:
                 if st.button("💾 Save to EHR"):
                     st.success("Report saved to EHR (simulated)")
@@ -1414,6 +1457,51 @@ Return the response in JSON format, enclosed in triple backticks (```json\n...\n
     
     st.markdown('</div>', unsafe_allow_html=True)
     
+    st.markdown('<div class="stCard">', unsafe_allow_html=True)
+    st.subheader("Report Pack Export")
+    st.markdown("Render every structured report recorded on a day into one merged PDF or a ZIP of per-report PDFs.")
+    
+    col1, col2, col3 = st.columns([2, 1, 1])
+    with col1:
+        pack_day = st.date_input("Reports from", value=datetime.now().date())
+    with col2:
+        pack_format = st.radio("Format", ["PDF", "ZIP"], horizontal=True)
+    with col3:
+        pack_workers = st.number_input("Render processes", min_value=1, max_value=32, value=BULK_WORKERS)
+    
+    if st.button("Build Report Pack"):
+        fmt = pack_format.lower()
+        if "report_pack" in st.session_state and os.path.exists(st.session_state["report_pack"][0]):
+            os.remove(st.session_state["report_pack"][0])
+        fd, pack_path = tempfile.mkstemp(prefix=f"report_pack_{pack_day:%Y-%m-%d}_", suffix=f".{fmt}")
+        os.close(fd)
+        with st.status("Rendering report pack...") as status:
+            stats = export_reports(
+                get_event_store().outputs("report", day=pack_day.strftime("%Y-%m-%d")),
+                pack_path, fmt=fmt, workers=int(pack_workers)
+            )
+            status.update(
+                label=f"Rendered {stats['reports']} reports ({stats['pages']} pages) in {stats['elapsed']}s, "
+                      f"{stats['pages_per_sec']} pages/sec",
+                state="complete"
+            )
+        st.session_state["report_pack"] = (pack_path, fmt, stats, f"{pack_day:%Y-%m-%d}")
+    
+    if "report_pack" in st.session_state:
+        pack_path, fmt, stats, pack_label = st.session_state["report_pack"]
+        if stats["reports"] and os.path.exists(pack_path):
+            with open(pack_path, "rb") as f:
+                st.download_button(
+                    label=f"Download Report Pack ({fmt.upper()})",
+                    data=f,
+                    file_name=f"report_pack_{pack_label}.{fmt}",
+                    mime="application/pdf" if fmt == "pdf" else "application/zip"
+                )
+        else:
+            st.info("No structured reports were recorded on that day.")
+    
+    st.markdown('</div>', unsafe_allow_html=True)
+    
     st.markdown('<div class="stCard">', unsafe_allow_html=True)
     st.subheader("Report Analytics")
     
@@ -1422,28 +1510,32 @@ Return the response in JSON format, enclosed in triple backticks (```json\n...\n
     with col1:
         days = ["1 week ago", "6 days ago", "5 days ago", "4 days ago", "3 days ago", "2 days ago", "Yesterday"]
         report_counts = [23, 31, 27, 42, 35, 29, 38]
+        if ANALYTICS_SOURCE == "events" and get_event_store().totals("report")["count"]:
+            daily = get_event_store().daily("report")
+            days = ["6 days ago", "5 days ago", "4 days ago", "3 days ago", "2 days ago", "Yesterday", "Today"]
+            report_counts = [count for _, count, _ in daily]
         
-        fig = px.bar(
+        fig = chart_figure(
+            "report", "daily_reports", "bar",
             x=days, 
             y=report_counts,
             title="Daily Report Generation",
-            color_discrete_sequence=["#1E40AF"]
+            color="#1E40AF",
+            yaxis_title="Report Count"
         )
-        fig.update_layout(xaxis_title="", yaxis_title="Report Count")
         st.plotly_chart(fig, use_container_width=True)
         
     with col2:
         months = ["Jan", "Feb", "Mar", "Apr", "May", "Jun"]
         satisfaction_scores = [4.2, 4.3, 4.5, 4.6, 4.65, 4.7]
         
-        fig = px.line(
+        fig = chart_figure(
+            "report", "physician_satisfaction", "line",
             x=months, 
             y=satisfaction_scores,
             title="Physician Satisfaction Rating (out of 5)",
-            markers=True
+            color="#10B981"
         )
-        fig.update_layout(xaxis_title="", yaxis_title="")
-        fig.update_traces(line_color="#10B981")
         st.plotly_chart(fig, use_container_width=True)
     
     st.markdown('</div>', unsafe_allow_html=True)
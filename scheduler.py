@@ -0,0 +1,157 @@
+import asyncio
+import threading
+import time
+from collections import deque
+
+# Priority classes, most urgent first: crisis checks (mental health, red-flag triage), triage, medication plans,
+# clinical reports, then dashboard analytics
+PRIORITY_CLASSES = ("crisis", "triage", "medication", "report", "analytics")
+
+# Class used for a prompt's template when the caller does not name one
+TEMPLATE_PRIORITIES = {
+    "mental_health": "crisis",
+    "triage": "triage",
+    "medication": "medication",
+    "medication_concern": "medication",
+    "report": "report",
+    "analytics": "analytics"
+}
+DEFAULT_PRIORITY = "report"
+
+# Pre-triage urgencies that put a triage call in the crisis class
+CRISIS_URGENCIES = ("Critical",)
+
+# Most requests each class may have in flight at once (None: the whole pool). Lower classes are capped so bulk work
+# never holds every upstream slot: with a pool of 20, at least 4 are always left for crisis and triage calls.
+PRIORITY_LIMITS = {"crisis": None, "triage": 16, "medication": 8, "report": 6, "analytics": 2}
+
+# A waiting request moves up one class for every PRIORITY_AGING seconds it has queued, so no class starves
+PRIORITY_AGING = 10.0
+
+# Recent queue waits kept per class for the wait-time percentiles
+WAIT_SAMPLES = 500
+
+
+# Function to pick the priority class for a prompt from the template that rendered it
+def priority_for(prompt):
+    key = getattr(prompt, "template_key", None) or ""
+    return TEMPLATE_PRIORITIES.get(key.split("@")[0], DEFAULT_PRIORITY)
+
+
+# Function to pick the class for a triage call from its local pre-triage urgency
+def triage_priority(urgency):
+    return "crisis" if urgency in CRISIS_URGENCIES else "triage"
+
+
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+# Admission control for the inference engine's event loop: up to capacity requests run at once, each class within
+# its limit. When a slot frees, the waiting request with the best aged rank (class rank minus one per PRIORITY_AGING
+# seconds waited) goes next, oldest first among equals. acquire/release must run on the engine's loop.
+class PriorityScheduler:
+    def __init__(self, capacity, limits=PRIORITY_LIMITS, aging=PRIORITY_AGING):
+        self.capacity = capacity
+        self.limits = {cls: min(limits.get(cls) or capacity, capacity) for cls in PRIORITY_CLASSES}
+        self.aging = aging
+        self.running = {cls: 0 for cls in PRIORITY_CLASSES}
+        self._waiting = []
+        self._lock = threading.Lock()
+        self._metrics = {
+            cls: {"queued": 0, "started": 0, "aged": 0, "max_wait": 0.0, "waits": deque(maxlen=WAIT_SAMPLES)}
+            for cls in PRIORITY_CLASSES
+        }
+        self.peak_queued = 0
+
+    @property
+    def queued(self):
+        return len(self._waiting)
+
+    def _rank(self, entry, now):
+        cls, enqueued_at, _ = entry
+        return PRIORITY_CLASSES.index(cls) - (now - enqueued_at) / self.aging, enqueued_at
+
+    def _start(self, cls, waited, aged=False):
+        self.running[cls] += 1
+        with self._lock:
+            metrics = self._metrics[cls]
+            metrics["started"] += 1
+            metrics["aged"] += aged
+            metrics["waits"].append(waited)
+            metrics["max_wait"] = max(metrics["max_wait"], waited)
+
+    def _has_slot(self, cls):
+        return sum(self.running.values()) < self.capacity and self.running[cls] < self.limits[cls]
+
+    # Waits for a slot for one request of the class; pair every successful acquire with release(cls)
+    async def acquire(self, cls):
+        if cls not in self.running:
+            raise ValueError(f"Unknown priority class: {cls}")
+        if not self._waiting and self._has_slot(cls):
+            self._start(cls, 0.0)
+            return
+        entry = (cls, time.monotonic(), asyncio.get_running_loop().create_future())
+        self._waiting.append(entry)
+        with self._lock:
+            self._metrics[cls]["queued"] += 1
+            self.peak_queued = max(self.peak_queued, len(self._waiting))
+        # Requests already waiting may be held only by their own class limit, so this one can still start at once
+        self._dispatch()
+        try:
+            await entry[2]
+        except asyncio.CancelledError:
+            if entry in self._waiting:
+                self._remove(entry)
+            elif not entry[2].cancelled():
+                # The slot was granted just as the caller gave up; hand it back
+                self.release(cls)
+            raise
+
+    def _remove(self, entry):
+        self._waiting.remove(entry)
+        with self._lock:
+            self._metrics[entry[0]]["queued"] -= 1
+
+    def release(self, cls):
+        self.running[cls] -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        now = time.monotonic()
+        while self._waiting and sum(self.running.values()) < self.capacity:
+            ready = [entry for entry in self._waiting if self.running[entry[0]] < self.limits[entry[0]]]
+            if not ready:
+                return
+            entry = min(ready, key=lambda entry: self._rank(entry, now))
+            cls, enqueued_at, future = entry
+            self._remove(entry)
+            if future.done():
+                # Cancelled while waiting: drop it without taking a slot
+                continue
+            # Count requests that only won their slot through aging, i.e. a more urgent class was also ready
+            rank = PRIORITY_CLASSES.index(cls)
+            aged = any(PRIORITY_CLASSES.index(other[0]) < rank for other in ready if other is not entry)
+            self._start(cls, now - enqueued_at, aged)
+            future.set_result(None)
+
+    # Per-class queue depth, requests in flight and queue wait times (seconds; percentiles over recent requests)
+    def snapshot(self):
+        with self._lock:
+            classes = {}
+            for cls in PRIORITY_CLASSES:
+                metrics = self._metrics[cls]
+                waits = list(metrics["waits"])
+                classes[cls] = {
+                    "queued": metrics["queued"], "running": self.running[cls], "limit": self.limits[cls],
+                    "started": metrics["started"], "aged": metrics["aged"],
+                    "wait_p50": round(_percentile(waits, 0.5), 3), "wait_p95": round(_percentile(waits, 0.95), 3),
+                    "wait_max": round(metrics["max_wait"], 3)
+                }
+            return {
+                "queued": sum(c["queued"] for c in classes.values()), "peak_queued": self.peak_queued,
+                "running": sum(c["running"] for c in classes.values()), "capacity": self.capacity, "classes": classes
+            }
@@ -0,0 +1,225 @@
+import argparse
+import random
+import re
+import sys
+import time
+from datetime import datetime, timedelta
+
+from medications import DEFAULT_DAYS_SUPPLY, DRUG_PROFILES, drug_profile
+
+# Dose times of day for common frequencies and sig abbreviations
+FREQUENCY_TIMES = {
+    "once daily": ["09:00"], "daily": ["09:00"], "qd": ["09:00"], "od": ["09:00"], "every morning": ["08:00"],
+    "twice daily": ["08:00", "20:00"], "bid": ["08:00", "20:00"], "every 12 hours": ["08:00", "20:00"],
+    "three times daily": ["08:00", "14:00", "20:00"], "tid": ["08:00", "14:00", "20:00"],
+    "every 8 hours": ["06:00", "14:00", "22:00"],
+    "four times daily": ["08:00", "12:00", "16:00", "20:00"], "qid": ["08:00", "12:00", "16:00", "20:00"],
+    "every 6 hours": ["06:00", "12:00", "18:00", "00:00"],
+    "at bedtime": ["21:00"], "qhs": ["21:00"], "nightly": ["21:00"]
+}
+
+# Single-dose times implied by the timing field when the frequency is once a day
+TIMING_TIMES = {"bedtime": "21:00", "night": "21:00", "evening": "19:00", "morning": "08:00", "breakfast": "08:00",
+                "lunch": "12:30", "dinner": "18:30", "supper": "18:30"}
+
+# Prescription columns the schedule engine reads; missing columns are treated as empty
+SCHEDULE_COLUMNS = ("medication", "frequency", "timing", "duration", "refill_date", "start_date", "days_supply", "quantity")
+
+# Days of doses shown in the medication page's calendar
+CALENDAR_DAYS = 7
+
+# Duration text such as "7 days", "2 weeks", "3 months"
+DURATION_RE = re.compile(r"(\d+)\s*(day|d\b|week|wk|month|mo)", re.IGNORECASE)
+
+
+# Function to resolve a medication's dose times of day from its frequency and timing
+def dose_times(frequency, timing=""):
+    frequency = (frequency or "").strip().lower()
+    times = FREQUENCY_TIMES.get(frequency)
+    if times is None:
+        # Longest phrase first so "twice daily" wins over "daily"
+        matches = [key for key in sorted(FREQUENCY_TIMES, key=len, reverse=True) if key in frequency]
+        times = FREQUENCY_TIMES[matches[0]] if matches else []
+    if len(times) == 1:
+        timing = (timing or "").lower()
+        times = [next((t for key, t in TIMING_TIMES.items() if key in timing), times[0])]
+    return times
+
+
+# Function to read a duration as (days, calendar months); either is None when it does not apply
+def _duration(text):
+    match = DURATION_RE.search(text)
+    if not match:
+        return None, None
+    count, unit = int(match.group(1)), match.group(2)[0].lower()
+    if unit == "m":
+        return None, count
+    return count * (7 if unit == "w" else 1), None
+
+
+# Function to build a prescription DataFrame from dict rows (parsed prescriptions or medication plans)
+def medication_frame(rows):
+    import pandas as pd
+
+    frame = pd.DataFrame.from_records(list(rows))
+    for column in SCHEDULE_COLUMNS:
+        if column not in frame:
+            frame[column] = None
+    return frame
+
+
+# Function to compute each prescription's supply, refill date and course end with vectorized date arithmetic.
+# Returns a copy of the frame with start (first dose day), doses_per_day, supply_days, refill (NaT for as-needed drugs
+# and fixed courses), course_end (NaT unless the drug is a fixed course) and as_needed columns. The refill is the stated
+# refill_date when there is one, otherwise start + the supply implied by (in order) days_supply, a duration in days or
+# weeks, a duration in calendar months (DateOffset), quantity / doses per day, the drug's profile, DEFAULT_DAYS_SUPPLY.
+def schedule_frame(frame, today=None):
+    import numpy as np
+    import pandas as pd
+
+    today = pd.Timestamp(today or datetime.now()).normalize()
+    frame = frame.copy()
+    text = {column: frame[column].fillna("").astype(str) for column in ("medication", "frequency", "timing", "duration")}
+
+    # Per-value lookups run once per distinct value, then broadcast back with map
+    pairs = text["frequency"].str.lower().str.strip() + "|" + text["timing"].str.lower()
+    frame["doses_per_day"] = pairs.map({pair: len(dose_times(*pair.split("|", 1))) for pair in pairs.unique()})
+    names = text["medication"].str.lower().str.strip()
+    profiles = {name: drug_profile(name) or {} for name in names.unique()}
+    profile_supply = names.map({name: profile.get("days_supply") for name, profile in profiles.items()})
+    course = names.map({name: bool(profile.get("course")) for name, profile in profiles.items()})
+    frame["as_needed"] = text["frequency"].str.contains(r"(?i)\bas needed\b|\bprn\b", regex=True)
+
+    frame["start"] = pd.to_datetime(frame["start_date"], errors="coerce").fillna(today).dt.normalize()
+
+    durations = {value: _duration(value) for value in text["duration"].unique()}
+    duration_days = pd.to_numeric(text["duration"].map({value: days for value, (days, _) in durations.items()}))
+    duration_months = pd.to_numeric(text["duration"].map({value: months for value, (_, months) in durations.items()}))
+
+    quantity = pd.to_numeric(frame["quantity"], errors="coerce")
+    stated_supply = pd.to_numeric(frame["days_supply"], errors="coerce")
+    supply = stated_supply.fillna(duration_days)
+    supply = supply.fillna(np.floor(quantity / frame["doses_per_day"].replace(0, np.nan)))
+    supply = supply.fillna(pd.to_numeric(profile_supply, errors="coerce")).fillna(DEFAULT_DAYS_SUPPLY)
+    end = frame["start"] + pd.to_timedelta(supply, unit="D")
+
+    # Calendar months vary in length, so month durations use DateOffset, applied once per distinct month count
+    months = duration_months.where(stated_supply.isna())
+    for count in months.dropna().unique():
+        rows = months == count
+        end[rows] = frame.loc[rows, "start"] + pd.DateOffset(months=int(count))
+    frame["supply_days"] = (end - frame["start"]).dt.days
+
+    stated = pd.to_datetime(frame["refill_date"].fillna("").astype(str).str[:10], format="%Y-%m-%d", errors="coerce")
+    frame["course_end"] = end.where(course & ~frame["as_needed"])
+    frame["refill"] = stated.fillna(end.where(~course)).where(~frame["as_needed"])
+    return frame
+
+
+# Function to expand a scheduled frame into its dose calendar between start and end: one row per dose with the
+# prescription's index (row) and scheduled_at, ordered by row then time. Doses before a prescription's start or after
+# its course end are dropped; as-needed drugs have no scheduled doses.
+def dose_calendar(frame, start, end):
+    import numpy as np
+    import pandas as pd
+
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    pairs = frame["frequency"].fillna("").astype(str).str.lower().str.strip() + "|" + \
+        frame["timing"].fillna("").astype(str).str.lower()
+    offsets = {
+        pair: [pd.Timedelta(hours=int(clock[:2]), minutes=int(clock[3:])) for clock in dose_times(*pair.split("|", 1))]
+        for pair in pairs.unique()
+    }
+    doses = pairs.map(offsets).where(~frame["as_needed"], None).explode().dropna()
+    if doses.empty:
+        return pd.DataFrame({"row": pd.Series(dtype=frame.index.dtype), "scheduled_at": pd.Series(dtype="datetime64[ns]")})
+
+    days = pd.date_range(start.normalize(), end.normalize(), freq="D").values
+    clock = doses.to_numpy(dtype="timedelta64[ns]")
+    # (dose, day) grid of candidate times, masked to the window and to each prescription's active period
+    stamps = days[None, :] + clock[:, None]
+    first = frame.loc[doses.index, "start"].to_numpy(dtype="datetime64[ns]")
+    last = frame.loc[doses.index, "course_end"].fillna(pd.Timestamp.max).to_numpy(dtype="datetime64[ns]")
+    mask = (stamps >= start.to_datetime64()) & (stamps < end.to_datetime64())
+    mask &= (stamps >= first[:, None]) & (stamps < last[:, None])
+    dose_index, _ = np.nonzero(mask)
+    calendar = pd.DataFrame({"row": doses.index.to_numpy()[dose_index], "scheduled_at": stamps[mask]})
+    return calendar.sort_values(["row", "scheduled_at"], kind="stable").reset_index(drop=True)
+
+
+# Function to fill a single medication plan's refill_date from the schedule engine rather than the model's arithmetic
+def plan_refill_date(output, today=None):
+    import pandas as pd
+
+    row = schedule_frame(medication_frame([dict(output, refill_date=None)]), today).iloc[0]
+    if row["as_needed"]:
+        return "N/A - as needed"
+    if pd.notna(row["course_end"]):
+        return f"N/A - course ends {row['course_end'].strftime('%Y-%m-%d')}"
+    return row["refill"].strftime("%Y-%m-%d")
+
+
+# Function to build synthetic prescriptions for benchmarking
+def sample_prescriptions(count, seed=0):
+    rng = random.Random(seed)
+    names = list(DRUG_PROFILES)
+    frequencies = ["once daily", "twice daily", "three times daily", "at bedtime", "every 8 hours", "as needed"]
+    today = datetime.now()
+    for i in range(count):
+        yield {
+            "patient_id": f"P{i:06d}",
+            "medication": DRUG_PROFILES[rng.choice(names)]["name"],
+            "frequency": rng.choice(frequencies),
+            "timing": rng.choice(["", "with meals", "in the evening"]),
+            "duration": rng.choice(["", "ongoing", "7 days", "2 weeks", "3 months"]),
+            "start_date": (today - timedelta(days=rng.randint(0, 60))).strftime("%Y-%m-%d"),
+            "quantity": rng.choice([None, 30, 60, 90])
+        }
+
+
+def benchmark(count, days):
+    frame = medication_frame(sample_prescriptions(count))
+    start_time = time.perf_counter()
+    scheduled = schedule_frame(frame)
+    refill_elapsed = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    now = datetime.now()
+    calendar = dose_calendar(scheduled, now, now + timedelta(days=days))
+    calendar_elapsed = time.perf_counter() - start_time
+    print(f"refill dates: {count} prescriptions in {refill_elapsed * 1000:.0f} ms "
+          f"({count / refill_elapsed:,.0f} rows/sec)")
+    print(f"dose calendar: {len(calendar):,} doses over {days} days in {calendar_elapsed * 1000:.0f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compute refill dates and dose calendars for a prescription CSV.")
+    parser.add_argument("path", nargs="?", help="CSV with medication, frequency, timing, duration, start_date, "
+                                                "days_supply, quantity and/or refill_date columns")
+    parser.add_argument("--days", type=int, default=CALENDAR_DAYS, help="days of dose calendar to compute")
+    parser.add_argument("-o", "--output", help="write the dose calendar as CSV to this path")
+    parser.add_argument("--benchmark", type=int, metavar="N", help="schedule N synthetic prescriptions and report timings")
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        benchmark(args.benchmark, args.days)
+        return 0
+    if not args.path:
+        parser.error("a path is required unless --benchmark is given")
+
+    import pandas as pd
+
+    scheduled = schedule_frame(pd.read_csv(args.path, dtype=str, keep_default_na=False).replace("", None))
+    now = datetime.now()
+    calendar = dose_calendar(scheduled, now, now + timedelta(days=args.days))
+    calendar = calendar.join(scheduled[["medication", "refill"]], on="row")
+    if args.output:
+        calendar.to_csv(args.output, index=False)
+    else:
+        calendar.to_csv(sys.stdout, index=False)
+    print(f"{len(scheduled)} prescriptions, {len(calendar)} doses in the next {args.days} days, "
+          f"{int(scheduled['refill'].notna().sum())} refill dates", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
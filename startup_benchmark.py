@@ -0,0 +1,85 @@
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+
+# Modules timed with `python -X importtime`: the dashboard's helpers and each headless entry point
+BENCHMARK_MODULES = ("analyzers", "inference", "notifications", "reminders", "batch_triage", "api")
+
+# Cold-import budget (milliseconds, cumulative) for each headless module
+IMPORT_BUDGET_MS = 400
+
+# Reruns of the dashboard script timed after the first (cold) run
+RERUNS = 5
+
+IMPORTTIME_RE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+# Function to cold-import a module in a fresh interpreter; returns (total_ms, [(cumulative_ms, name)] top-level deps)
+def import_time(module):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=HERE, capture_output=True, text=True, check=True
+    )
+    total, deps = 0.0, []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if not match:
+            continue
+        cumulative_ms = int(match.group(2)) / 1000
+        if match.group(4) == module and not match.group(3):
+            total = cumulative_ms
+        elif len(match.group(3)) == 2:
+            deps.append((cumulative_ms, match.group(4)))
+    return total, sorted(deps, reverse=True)
+
+
+# Function to time the dashboard script under Streamlit's test runner; returns (cold_ms, [rerun_ms])
+def script_times(reruns=RERUNS):
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(os.path.join(HERE, "sadas.py"), default_timeout=60)
+    start_time = time.perf_counter()
+    app.run()
+    cold = (time.perf_counter() - start_time) * 1000
+    times = []
+    for _ in range(reruns):
+        start_time = time.perf_counter()
+        app.run()
+        times.append((time.perf_counter() - start_time) * 1000)
+    if app.exception:
+        raise RuntimeError(app.exception[0].value)
+    return cold, times
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure cold import time and dashboard script time.")
+    parser.add_argument("--budget", type=float, default=IMPORT_BUDGET_MS, help="cold-import budget per module (ms)")
+    parser.add_argument("--reruns", type=int, default=RERUNS, help="dashboard reruns to time after the first run")
+    parser.add_argument("--top", type=int, default=3, help="heaviest direct dependencies to list per module")
+    parser.add_argument("--skip-app", action="store_true", help="only measure module imports")
+    args = parser.parse_args(argv)
+
+    over_budget = []
+    for module in BENCHMARK_MODULES:
+        total, deps = import_time(module)
+        heaviest = ", ".join(f"{name} {ms:.0f}ms" for ms, name in deps[:args.top])
+        flag = "" if total <= args.budget else "  OVER BUDGET"
+        print(f"import {module:<14} {total:8.1f} ms  ({heaviest}){flag}")
+        if flag:
+            over_budget.append(module)
+
+    if not args.skip_app:
+        cold, reruns = script_times(args.reruns)
+        print(f"sadas.py first run {cold:8.1f} ms")
+        print(f"sadas.py rerun     {sum(reruns) / len(reruns):8.1f} ms (mean of {len(reruns)}, best {min(reruns):.1f} ms)")
+
+    return 1 if over_budget else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
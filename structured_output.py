@@ -0,0 +1,386 @@
+import copy
+import json
+import re
+import threading
+
+from prompts import count_tokens
+
+_INVALID = object()
+
+FENCE_RE = re.compile(r"```(?:json)?", re.IGNORECASE)
+
+
+# Incremental parser that surfaces top-level JSON fields as soon as their values are complete
+class StreamingJSONParser:
+    def __init__(self):
+        self.fields = {}
+        self.done = False
+        self._buffer = ""
+        self._pos = 0
+        self._state = "seek_object"
+        self._key = None
+        self._value_start = None
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    # Feed the next chunk of generated text; returns the {key: value} pairs completed by this chunk
+    def feed(self, chunk):
+        self._buffer += chunk
+        completed = {}
+        while self._pos < len(self._buffer) and not self.done:
+            char = self._buffer[self._pos]
+            state = self._state
+            if state == "seek_object":
+                if char == "{":
+                    self._state = "seek_key"
+            elif state == "seek_key":
+                if char == '"':
+                    self._state = "key"
+                    self._value_start = self._pos
+                    self._escaped = False
+                elif char == "}":
+                    self.done = True
+            elif state == "key":
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    key = self._decode(self._value_start, self._pos + 1)
+                    self._key = key if isinstance(key, str) else None
+                    self._state = "seek_colon"
+            elif state == "seek_colon":
+                if char == ":":
+                    self._state = "seek_value"
+            elif state == "seek_value":
+                if not char.isspace():
+                    self._value_start = self._pos
+                    self._depth = 0
+                    self._in_string = False
+                    self._escaped = False
+                    if char == '"':
+                        self._state = "string"
+                    elif char in "{[":
+                        self._state = "container"
+                        self._depth = 1
+                    else:
+                        self._state = "scalar"
+            elif state == "string":
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._complete(self._pos + 1, completed)
+            elif state == "container":
+                if self._in_string:
+                    if self._escaped:
+                        self._escaped = False
+                    elif char == "\\":
+                        self._escaped = True
+                    elif char == '"':
+                        self._in_string = False
+                elif char == '"':
+                    self._in_string = True
+                elif char in "{[":
+                    self._depth += 1
+                elif char in "}]":
+                    self._depth -= 1
+                    if self._depth == 0:
+                        self._complete(self._pos + 1, completed)
+            elif state == "scalar":
+                if char in ",}" or char.isspace():
+                    self._complete(self._pos, completed)
+                    if char == "}":
+                        self.done = True
+            self._pos += 1
+        return completed
+
+    def _complete(self, end, completed):
+        value = self._decode(self._value_start, end)
+        if self._key is not None and value is not _INVALID:
+            self.fields[self._key] = value
+            completed[self._key] = value
+        self._key = None
+        self._state = "seek_key"
+
+    def _decode(self, start, end):
+        try:
+            return json.loads(self._buffer[start:end])
+        except ValueError:
+            return _INVALID
+
+
+# Incremental scanner that finds where the first balanced top-level JSON object in a text stream ends
+class JSONEndScanner:
+    def __init__(self):
+        self.done = False
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    # Feed the next chunk; returns the index in this chunk just past the object's closing brace, or None
+    def feed(self, chunk):
+        if self.done:
+            return 0
+        for i, char in enumerate(chunk):
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = self._depth > 0
+            elif char == "{":
+                self._depth += 1
+            elif char == "}" and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0:
+                    self.done = True
+                    return i + 1
+        return None
+
+
+class StructuredOutputError(ValueError):
+    pass
+
+
+# Per-feature output schemas: required keys, expected field types, allowed values and defaults
+SCHEMAS = {
+    "triage": {
+        "required": ["urgency"],
+        "fields": {
+            "symptoms": list, "duration": str, "medical_history": list, "urgency": str,
+            "triage_category": (str, int), "recommended_tests": list, "potential_diagnosis": list, "action": str
+        },
+        "enums": {"urgency": ["Critical", "High", "Medium", "Low"]},
+        "defaults": {}
+    },
+    "medication": {
+        "required": ["medication"],
+        "fields": {
+            "medication": str, "dosage": str, "frequency": str, "timing": str, "duration": str,
+            "patient_concern": str, "adherence_risk": str, "recommendation": str, "refill_date": str, "action": str
+        },
+        "enums": {"adherence_risk": ["Low", "Medium", "High"]},
+        "defaults": {}
+    },
+    "medication_concern": {
+        "required": ["recommendation"],
+        "fields": {"patient_concern": str, "adherence_risk": str, "recommendation": str, "action": str},
+        "enums": {"adherence_risk": ["Low", "Medium", "High"]},
+        "defaults": {}
+    },
+    "mental_health": {
+        "required": ["risk_level"],
+        "fields": {
+            "risk_phrases": list, "symptoms": list, "risk_level": str, "suicide_risk": str,
+            "recommended_response": str, "suggested_resources": list, "action": str
+        },
+        "enums": {"risk_level": ["Low", "Medium", "High"]},
+        "defaults": {}
+    },
+    "report": {
+        "required": [],
+        "fields": {
+            "patient_demographics": dict, "diagnosis": str, "treatment": str, "vital_signs": dict,
+            "medications": list, "follow_up": dict, "action": str
+        },
+        "enums": {},
+        "defaults": {
+            "patient_demographics": {}, "vital_signs": {}, "follow_up": {},
+            "action": "Structured report generated"
+        }
+    },
+    "analytics": {
+        "required": ["triage_stats", "medication_stats", "mental_health_stats", "report_stats"],
+        "fields": {"triage_stats": dict, "medication_stats": dict, "mental_health_stats": dict, "report_stats": dict},
+        "enums": {},
+        "defaults": {}
+    }
+}
+
+
+# Generation budget (tokens) for one schema field's value, by expected type; enum and category fields get
+# ENUM_TOKEN_BUDGET. Each field also pays for its key and punctuation, and the object for its fences and braces.
+# Budgets are sized for the longest realistic value, not a typical one: a list of up to ~12 short phrases, or a dict
+# of up to ~15 entries or one nested level (an analytics section). Over-sizing costs nothing when the JSON object
+# closes early, since generation stops there; under-sizing truncates the object and the response fails to parse.
+FIELD_TOKEN_BUDGETS = {str: 48, list: 128, dict: 192}
+ENUM_TOKEN_BUDGET = 8
+JSON_WRAPPER_TOKENS = 16
+
+# Fields whose values run longer than their type's budget: a report lists up to ~8 medications, each an object with
+# name, dosage, frequency and duration (~45 tokens)
+FIELD_TOKEN_OVERRIDES = {("report", "medications"): 384}
+
+# Ceiling on any feature's budget: the previous uniform max_length, so no output may run longer than before
+MAX_GENERATION_TOKENS = 800
+
+# Stop sequences sent with structured-output requests: every prompt asks for one object in ```json fences,
+# so generation can end at the closing fence. The newline before the fence keeps the object's "}" in the output.
+JSON_STOP_SEQUENCES = ("\n```\n",)
+
+_budgets = {}
+
+
+# Function to size a feature's generation budget (max_length) from its schema's fields
+def generation_budget(feature):
+    if feature not in _budgets:
+        schema = SCHEMAS[feature]
+        total = JSON_WRAPPER_TOKENS
+        for key, expected in schema["fields"].items():
+            if (feature, key) in FIELD_TOKEN_OVERRIDES:
+                value = FIELD_TOKEN_OVERRIDES[(feature, key)]
+            elif key in schema["enums"] or isinstance(expected, tuple):
+                value = ENUM_TOKEN_BUDGET
+            else:
+                value = FIELD_TOKEN_BUDGETS[expected]
+            total += count_tokens(f'  "{key}": ,\n') + value
+        _budgets[feature] = min(total, MAX_GENERATION_TOKENS)
+    return _budgets[feature]
+
+
+# Per-feature counts of clean parses, repaired parses and failures
+class ParseStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+
+    def record(self, feature, outcome):
+        with self._lock:
+            counts = self._counts.setdefault(feature, {"clean": 0, "repaired": 0, "failed": 0})
+            counts[outcome] += 1
+
+    def snapshot(self):
+        with self._lock:
+            result = {}
+            for feature, counts in self._counts.items():
+                total = sum(counts.values())
+                result[feature] = dict(counts, total=total, failure_rate=round(100 * counts["failed"] / total, 1))
+            return result
+
+
+parse_stats = ParseStats()
+
+
+# Function to yield each balanced {...} span in the text, in order
+def _balanced_objects(text):
+    start = text.find("{")
+    while start != -1:
+        depth = 0
+        in_string = False
+        escaped = False
+        end = None
+        for i in range(start, len(text)):
+            char = text[i]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif char == "\\":
+                    escaped = True
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char == "{":
+                depth += 1
+            elif char == "}":
+                depth -= 1
+                if depth == 0:
+                    end = i + 1
+                    break
+        if end is None:
+            return
+        yield start, end
+        start = text.find("{", end)
+
+
+# Function to drop commas that directly precede a closing bracket, ignoring string contents
+def _strip_trailing_commas(candidate):
+    out = []
+    in_string = False
+    escaped = False
+    for i, char in enumerate(candidate):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == "," and candidate[i + 1:].lstrip()[:1] in ("}", "]"):
+            continue
+        out.append(char)
+    return "".join(out)
+
+
+# Function to find the first JSON object anywhere in generated text; returns (object, repaired)
+def extract_json(text):
+    for start, end in _balanced_objects(text):
+        candidate = text[start:end]
+        repaired = bool(FENCE_RE.sub("", text[:start]).strip() or FENCE_RE.sub("", text[end:]).strip())
+        try:
+            return json.loads(candidate), repaired
+        except ValueError:
+            pass
+        try:
+            return json.loads(_strip_trailing_commas(candidate)), True
+        except ValueError:
+            pass
+    raise StructuredOutputError("No valid JSON object found in model response")
+
+
+# Function to coerce a parsed object to a feature schema, dropping fields of the wrong type
+def apply_schema(data, schema):
+    if not isinstance(data, dict):
+        raise StructuredOutputError("Model response is not a JSON object")
+    for key, expected in schema["fields"].items():
+        if key not in data:
+            continue
+        value = data[key]
+        if expected is list and isinstance(value, str):
+            data[key] = [value.strip()] if value.strip() else []
+        elif expected is str and isinstance(value, (int, float)) and not isinstance(value, bool):
+            data[key] = str(value)
+        elif not isinstance(value, expected):
+            del data[key]
+    for key, allowed in schema["enums"].items():
+        if key in data:
+            match = next((a for a in allowed if a.lower() == data[key].strip().lower()), None)
+            if match is None:
+                del data[key]
+            else:
+                data[key] = match
+    missing = [key for key in schema["required"] if key not in data]
+    if missing:
+        raise StructuredOutputError(f"Model response is missing required fields: {', '.join(missing)}")
+    for key, default in schema["defaults"].items():
+        data.setdefault(key, copy.deepcopy(default))
+    return data
+
+
+# Function to check that text holds a valid structured output for a feature, without recording a parse outcome
+def is_structured_output(text, feature):
+    try:
+        apply_schema(extract_json(text or "")[0], SCHEMAS[feature])
+    except StructuredOutputError:
+        return False
+    return True
+
+
+# Function to extract and validate a feature's structured output, recording the outcome
+def parse_structured_output(text, feature):
+    try:
+        data, repaired = extract_json(text or "")
+        data = apply_schema(data, SCHEMAS[feature])
+    except StructuredOutputError:
+        parse_stats.record(feature, "failed")
+        raise
+    parse_stats.record(feature, "repaired" if repaired else "clean")
+    return data
@@ -0,0 +1,178 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from backend_benchmark import STUB_OUTPUT, start_stub, stub_generator
+from inference import CircuitBreaker, CircuitOpenError, HFBackend, InferenceError, OpenAIBackend
+from local_backend import LocalBackend
+
+STUB_LATENCY = 0.01
+
+
+@pytest.fixture(scope="module")
+def stub_url():
+    server, url = start_stub(STUB_LATENCY)
+    yield url
+    server.shutdown()
+    server.server_close()
+
+
+# Server-sent events endpoint replaying a fixed list of data lines, for the streaming paths the stub does not cover
+def _sse_server(events):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            for event in events:
+                self.wfile.write(f"data: {event}\n\n".encode())
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+@pytest.fixture
+def sse_server():
+    servers = []
+
+    def start(events):
+        server, url = _sse_server(events)
+        servers.append(server)
+        return url
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def _recorder():
+    stages = []
+    return stages, stages.append
+
+
+@pytest.mark.parametrize("backend_class", [HFBackend, OpenAIBackend])
+def test_http_backend_generates_from_the_stub(stub_url, backend_class):
+    backend = backend_class(stub_url)
+    stages, report = _recorder()
+    try:
+        assert backend.generate("prompt", 64, 0.3, report, stop=("\n```\n",)) == STUB_OUTPUT
+    finally:
+        backend.close()
+    assert stages == ["sent", "first_byte", "parsed"]
+    assert backend.breaker.state == "closed"
+
+
+@pytest.mark.parametrize("backend_class", [HFBackend, OpenAIBackend])
+def test_http_backend_stream_falls_back_to_a_whole_response(stub_url, backend_class):
+    # The stub ignores the stream flag, so the backend yields the complete response as one chunk
+    backend = backend_class(stub_url)
+    try:
+        assert list(backend.stream("prompt", 64, 0.3, lambda stage: None)) == [STUB_OUTPUT]
+    finally:
+        backend.close()
+
+
+def test_payloads_carry_stop_sequences_in_each_protocol():
+    hf = HFBackend("http://127.0.0.1:1")._payload("p", 64, 0.3, stop=("\n```\n",), stream=True)
+    assert hf["parameters"]["stop"] == ["\n```\n"] and hf["stream"] is True
+    # The budget counts new tokens only, as max_tokens does for OpenAI-compatible servers
+    assert hf["parameters"]["max_new_tokens"] == 64 and "max_length" not in hf["parameters"]
+    openai = OpenAIBackend("http://127.0.0.1:1", model="m")._payload("p", 64, 0.3)
+    assert openai == {"model": "m", "prompt": "p", "max_tokens": 64, "temperature": 0.3, "stop": None,
+                      "stream": False}
+
+
+def test_hf_backend_streams_tokens_and_skips_special_ones(sse_server):
+    url = sse_server([
+        json.dumps({"token": {"text": '{"a"', "special": False}}),
+        json.dumps({"token": {"text": "<|im_end|>", "special": True}}),
+        json.dumps({"token": {"text": ": 1}", "special": False}})
+    ])
+    backend = HFBackend(url)
+    try:
+        assert list(backend.stream("prompt", 64, 0.3, lambda stage: None)) == ['{"a"', ": 1}"]
+    finally:
+        backend.close()
+
+
+def test_openai_backend_stream_ends_at_done(sse_server):
+    url = sse_server([json.dumps({"choices": [{"text": "{}"}]}), "[DONE]", json.dumps({"choices": [{"text": "x"}]})])
+    backend = OpenAIBackend(url)
+    try:
+        assert list(backend.stream("prompt", 64, 0.3, lambda stage: None)) == ["{}"]
+    finally:
+        backend.close()
+
+
+def test_malformed_stream_event_raises_and_counts_as_a_failure(sse_server):
+    url = sse_server([json.dumps({"choices": [{"text": "{"}]}), '{"choices": [{"te'])
+    backend = OpenAIBackend(url, breaker=CircuitBreaker(failure_threshold=1, cooldown=60))
+    try:
+        with pytest.raises(InferenceError, match="Malformed stream event"):
+            list(backend.stream("prompt", 64, 0.3, lambda stage: None))
+        assert backend.breaker.state == "open"
+        with pytest.raises(CircuitOpenError):
+            backend.generate("prompt", 64, 0.3, lambda stage: None)
+    finally:
+        backend.close()
+
+
+def test_local_backend_batches_concurrent_prompts():
+    backend = LocalBackend(stub_generator(STUB_LATENCY), batch_size=8, batch_wait=0.05)
+    try:
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            texts = list(pool.map(lambda i: backend.generate(f"prompt {i}", 64, 0.3, lambda stage: None), range(8)))
+    finally:
+        backend.close()
+    assert texts == [STUB_OUTPUT] * 8
+    assert backend.stats()["prompts"] == 8
+    assert backend.stats()["batches"] < 8
+
+
+def test_local_backend_only_batches_matching_settings():
+    calls = []
+
+    def generator(prompts, max_length, temperature, stop=()):
+        calls.append((len(prompts), max_length, stop))
+        return [f"{prompt}:{max_length}" for prompt in prompts]
+
+    backend = LocalBackend(generator, batch_size=8, batch_wait=0.05)
+    try:
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            texts = list(pool.map(
+                lambda args: backend.generate(args[0], args[1], 0.3, lambda stage: None, stop=args[2]),
+                [("a", 64, ()), ("b", 128, ()), ("c", 64, ()), ("d", 64, ("}",))]
+            ))
+    finally:
+        backend.close()
+    assert texts == ["a:64", "b:128", "c:64", "d:64"]
+    # Each generator call sees one max_length and stop, however the four requests were split into batches
+    prompts_by_settings = {}
+    for size, max_length, stop in calls:
+        prompts_by_settings[(max_length, stop)] = prompts_by_settings.get((max_length, stop), 0) + size
+    assert prompts_by_settings == {(64, ()): 2, (128, ()): 1, (64, ("}",)): 1}
+
+
+def test_local_backend_reports_generator_errors_and_keeps_running():
+    def generator(prompts, max_length, temperature, stop=()):
+        raise RuntimeError("out of memory")
+
+    backend = LocalBackend(generator)
+    try:
+        with pytest.raises(RuntimeError, match="out of memory"):
+            backend.generate("prompt", 64, 0.3, lambda stage: None)
+        # The worker survives a failed batch
+        with pytest.raises(RuntimeError):
+            list(backend.stream("prompt", 64, 0.3, lambda stage: None))
+    finally:
+        backend.close()
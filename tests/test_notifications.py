@@ -0,0 +1,220 @@
+import base64
+import socketserver
+import threading
+import time
+
+import pytest
+
+import notifications
+from notifications import NotificationConfigError, NotificationDispatcher, SMSSender, SMTPPool
+
+
+# Debugging SMTP server: accepts AUTH PLAIN and every message, and records what it saw. With drop_after set, each
+# connection is closed by the server once it has taken that many messages.
+class RecordingSMTPHandler(socketserver.StreamRequestHandler):
+    def _reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        taken = 0
+        self._reply("220 localhost test SMTP")
+        mail_from, rcpt_to = None, []
+        while True:
+            line = self.rfile.readline().decode().rstrip("\r\n")
+            if not line:
+                return
+            command = line.split(" ", 1)[0].upper()
+            if command == "EHLO":
+                self._reply("250-localhost")
+                self._reply("250 AUTH PLAIN")
+            elif command == "AUTH":
+                _, username, password = base64.b64decode(line.split()[2]).decode().split("\0")
+                server.logins.append((username, password))
+                self._reply("235 Authentication successful")
+            elif command == "MAIL":
+                mail_from, rcpt_to = line.split(":", 1)[1].strip(" <>"), []
+                self._reply("250 OK")
+            elif command == "RCPT":
+                rcpt_to.append(line.split(":", 1)[1].strip(" <>"))
+                self._reply("250 OK")
+            elif command == "DATA":
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                while True:
+                    data = self.rfile.readline().decode().rstrip("\r\n")
+                    if data == ".":
+                        break
+                    lines.append(data)
+                server.messages.append((mail_from, rcpt_to, "\n".join(lines)))
+                taken += 1
+                self._reply("250 OK queued")
+                if server.drop_after and taken >= server.drop_after:
+                    return
+            elif command == "QUIT":
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("250 OK")
+
+
+class RecordingSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), RecordingSMTPHandler)
+        self.connections = 0
+        self.logins = []
+        self.messages = []
+        self.drop_after = None
+
+
+@pytest.fixture
+def smtp_server():
+    server = RecordingSMTPServer()
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def smtp_pool(smtp_server):
+    pool = SMTPPool(smtp_server.server_address[0], smtp_server.server_address[1], username="sender@example.com",
+                    password="secret", size=2, use_tls=False)
+    yield pool
+    pool.close()
+
+
+# Stand-in Twilio REST client: records messages.create calls and returns numbered sids
+class FakeTwilioClient:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.sent = []
+        self.messages = self
+
+    def create(self, body, from_, to):
+        if self.fail:
+            raise RuntimeError("Twilio unavailable")
+        self.sent.append((body, from_, to))
+        return type("Message", (), {"sid": f"SM{len(self.sent)}"})()
+
+
+def _wait_for(dispatcher, job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = dispatcher.job(job_id)
+        if job["finished_at"] is not None:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not finish: {dispatcher.job(job_id)}")
+
+
+def test_pool_logs_in_once_and_reuses_the_connection(smtp_server, smtp_pool):
+    for i in range(3):
+        smtp_pool.send("sender@example.com", "patient@example.com", f"Subject: Reminder {i}\n\nTake your dose.")
+    assert smtp_server.connections == 1
+    assert smtp_server.logins == [("sender@example.com", "secret")]
+    assert [message[1] for message in smtp_server.messages] == [["patient@example.com"]] * 3
+
+
+def test_pool_replaces_a_connection_the_server_dropped(smtp_server, smtp_pool):
+    smtp_server.drop_after = 1
+    smtp_pool.send("sender@example.com", "a@example.com", "Subject: One\n\nFirst.")
+    smtp_pool.send("sender@example.com", "b@example.com", "Subject: Two\n\nSecond.")
+    assert len(smtp_server.messages) == 2
+    assert smtp_server.connections == 2
+
+
+def test_pool_without_a_password_fails_before_connecting(smtp_server, monkeypatch):
+    monkeypatch.delenv(notifications.SENDER_PASSWORD_KEY, raising=False)
+    pool = SMTPPool(smtp_server.server_address[0], smtp_server.server_address[1], username="sender@example.com",
+                    use_tls=False)
+    with pytest.raises(NotificationConfigError, match=notifications.SENDER_PASSWORD_KEY):
+        pool.send("sender@example.com", "patient@example.com", "Subject: x\n\ny")
+    assert smtp_server.connections == 0
+
+
+def test_pool_reads_the_password_from_the_environment(smtp_server, monkeypatch):
+    monkeypatch.setenv(notifications.SENDER_PASSWORD_KEY, "from-env")
+    pool = SMTPPool(smtp_server.server_address[0], smtp_server.server_address[1], username="sender@example.com",
+                    use_tls=False)
+    pool.send("sender@example.com", "patient@example.com", "Subject: x\n\ny")
+    pool.close()
+    assert smtp_server.logins == [("sender@example.com", "from-env")]
+
+
+def test_dispatcher_sends_email_and_sms(smtp_server, smtp_pool):
+    twilio = FakeTwilioClient()
+    sms = SMSSender("AC123", "token", "+15550000000", client_factory=lambda sid, token: twilio)
+    dispatcher = NotificationDispatcher(smtp_pool, sms, workers=2, sender_email="sender@example.com")
+    job_id = dispatcher.submit(email="patient@example.com", phone="+15551234567", subject="Triage result",
+                               body="Urgency: High", sms_body="Urgency: High")
+    job = _wait_for(dispatcher, job_id)
+    assert job["status"] == "done"
+    assert job["email"] == "sent"
+    assert job["sms"] == "sent (SM1)"
+    assert twilio.sent == [("Urgency: High", "+15550000000", "+15551234567")]
+    mail_from, rcpt_to, data = smtp_server.messages[0]
+    assert (mail_from, rcpt_to) == ("sender@example.com", ["patient@example.com"])
+    assert "Subject: Triage result" in data
+
+
+def test_dispatcher_skips_missing_channels_and_reports_failures(smtp_pool):
+    sms = SMSSender("AC123", "token", "+15550000000", client_factory=lambda sid, token: FakeTwilioClient(fail=True))
+    dispatcher = NotificationDispatcher(smtp_pool, sms, workers=1)
+    job = _wait_for(dispatcher, dispatcher.submit(phone="+15551234567", sms_body="Reminder"))
+    assert job["email"] == "skipped"
+    assert job["sms"] == "failed: Twilio unavailable"
+    assert job["status"] == "failed"
+
+
+def test_sms_sender_builds_its_client_once():
+    created = []
+
+    def factory(sid, token):
+        created.append((sid, token))
+        return FakeTwilioClient()
+
+    sms = SMSSender("AC123", "token", "+15550000000", client_factory=factory)
+    assert [sms.send("hi", "+1555000000") for _ in range(3)] == ["SM1", "SM2", "SM3"]
+    assert created == [("AC123", "token")]
+
+
+def test_dispatcher_evicts_finished_jobs_after_their_ttl(smtp_pool):
+    dispatcher = NotificationDispatcher(smtp_pool, SMSSender(client_factory=lambda sid, token: FakeTwilioClient()),
+                                        workers=1, job_ttl=0.05)
+    job_id = dispatcher.submit(phone="+15551234567", sms_body="Reminder")
+    assert _wait_for(dispatcher, job_id)["status"] == "done"
+    time.sleep(0.1)
+    dispatcher.submit()
+    assert dispatcher.job(job_id) is None
+
+
+def test_dispatcher_keeps_only_the_newest_finished_jobs(smtp_pool):
+    dispatcher = NotificationDispatcher(smtp_pool, SMSSender(client_factory=lambda sid, token: FakeTwilioClient()),
+                                        workers=1, job_history=2)
+    job_ids = []
+    for i in range(4):
+        job_ids.append(dispatcher.submit(phone="+15551234567", sms_body=f"Reminder {i}"))
+        _wait_for(dispatcher, job_ids[-1])
+    assert [dispatcher.job(job_id) is not None for job_id in job_ids] == [False, False, True, True]
+
+
+def test_dispatcher_never_evicts_unfinished_jobs(smtp_pool):
+    release = threading.Event()
+
+    class BlockingClient(FakeTwilioClient):
+        def create(self, body, from_, to):
+            release.wait(5)
+            return super().create(body, from_, to)
+
+    dispatcher = NotificationDispatcher(smtp_pool, SMSSender(client_factory=lambda sid, token: BlockingClient()),
+                                        workers=1, job_ttl=0, job_history=0)
+    sending = dispatcher.submit(phone="+15551234567", sms_body="First")
+    queued = dispatcher.submit(phone="+15551234567", sms_body="Second")
+    assert dispatcher.job(sending)["status"] in ("queued", "sending")
+    assert dispatcher.job(queued)["status"] == "queued"
+    release.set()
@@ -0,0 +1,82 @@
+import json
+
+import pytest
+
+from structured_output import JSONEndScanner, StreamingJSONParser
+
+TRIAGE_TEXT = (
+    '```json\n{"symptoms": ["chest pain", "sweating"], "urgency": "Critical", "triage_category": 1, '
+    '"action": "Page the \\"cardiac\\" team {now}", "vitals": {"hr": [110, {"note": "}"}]}, "stable": false}\n```\n'
+)
+
+
+def _chunks(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+# Feeds text in chunks of the given size; returns the fields completed by each chunk, in order
+def _stream(parser, text, size):
+    return [parser.feed(chunk) for chunk in _chunks(text, size)]
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, len(TRIAGE_TEXT)])
+def test_parser_fields_match_json_regardless_of_chunking(size):
+    parser = StreamingJSONParser()
+    _stream(parser, TRIAGE_TEXT, size)
+    expected = json.loads(TRIAGE_TEXT.split("```json\n")[1].split("\n```")[0])
+    assert parser.fields == expected
+    assert parser.done
+
+
+def test_parser_surfaces_each_field_once_it_completes():
+    parser = StreamingJSONParser()
+    assert parser.feed('{"urgency": "Hi') == {}
+    assert parser.feed('gh", "symptoms": ["cough"') == {"urgency": "High"}
+    assert parser.feed('], "triage_category": 2') == {"symptoms": ["cough"]}
+    # A bare scalar only ends at a delimiter, since more digits may follow
+    assert parser.feed("}") == {"triage_category": 2}
+    assert parser.done
+
+
+def test_parser_ignores_text_after_the_object():
+    parser = StreamingJSONParser()
+    parser.feed('{"urgency": "Low"} {"urgency": "Critical"}')
+    assert parser.fields == {"urgency": "Low"}
+
+
+def test_parser_skips_values_that_are_not_valid_json():
+    parser = StreamingJSONParser()
+    parser.feed('{"urgency": High, "action": "Refer"}')
+    assert parser.fields == {"action": "Refer"}
+
+
+@pytest.mark.parametrize("size", [1, 4, len(TRIAGE_TEXT)])
+def test_scanner_finds_the_closing_brace_across_chunks(size):
+    scanner = JSONEndScanner()
+    consumed = 0
+    for chunk in _chunks(TRIAGE_TEXT, size):
+        end = scanner.feed(chunk)
+        if end is not None:
+            consumed += end
+            break
+        consumed += len(chunk)
+    assert scanner.done
+    assert TRIAGE_TEXT[:consumed].endswith('"stable": false}')
+
+
+def test_scanner_ignores_braces_inside_strings_and_before_the_object():
+    scanner = JSONEndScanner()
+    assert scanner.feed('Note "}" first: {"a": "{", "b": "\\"}"') is None
+    assert scanner.feed("}\n```") == 1
+
+
+def test_scanner_returns_zero_once_done():
+    scanner = JSONEndScanner()
+    assert scanner.feed('{"a": 1} trailing') == 8
+    assert scanner.feed("more") == 0
+
+
+def test_scanner_waits_for_an_unclosed_object():
+    scanner = JSONEndScanner()
+    assert scanner.feed('{"a": {"b": 1}') is None
+    assert not scanner.done